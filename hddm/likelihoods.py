@@ -116,8 +116,9 @@ def generate_wfpt_stochastic_class(
     # create likelihood function
     def wfpt_like(x, v, sv, a, z, sz, t, st, p_outlier=0):
         if x["rt"].abs().max() < 998:
+            (rt,), weights = hddm.utils.unique_trials(x, ("rt",))
             return hddm.wfpt.wiener_like(
-                x["rt"].values, v, sv, a, z, sz, t, st, p_outlier=p_outlier, **wp
+                rt, v, sv, a, z, sz, t, st, p_outlier=p_outlier, weights=weights, **wp
             )
         else:  # for missing RTs. Currently undocumented.
             noresponse = x["rt"].abs() >= 999
@@ -233,7 +234,7 @@ def generate_wfpt_stochastic_class(
         return hddm.cdfdif.dmat_cdf_array(x, w_outlier=wp["w_outlier"], **self.parents)
 
     # create wfpt class
-    wfpt = stochastic_from_dist("wfpt", wfpt_like)
+    wfpt = stochastic_from_dist("wfpt", hddm.utils.memoize_logp(wfpt_like))
 
     # add pdf and cdf_vec to the class
     wfpt.pdf = pdf
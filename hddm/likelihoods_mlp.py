@@ -1,4 +1,6 @@
 from inspect import modulesbyfile
+import inspect
+import weakref
 import numpy as np
 from functools import partial
 from kabuki.utils import stochastic_from_dist
@@ -89,8 +91,141 @@ def __prepare_indirect_betas(model_config={}):
     return param_links_betas, indirect_betas_present
 
 
+class BatchedMLPLikelihood(object):
+    """Evaluates the LAN likelihoods of several observed nodes in one forward pass.
+
+    PyMC2 asks the observed nodes for their logp one at a time. When a parent
+    that is shared by several registered nodes (e.g. a group level parameter)
+    has changed since the last call, the likelihoods of all registered nodes
+    whose parent values changed are computed together: their network inputs
+    are concatenated, passed through network.predict_on_batch() once and the
+    per-node sums are kept until PyMC2 asks the other nodes for their logp.
+
+    :Arguments:
+        likelihood: function
+            LAN likelihood as returned by make_likelihood_mlp(), used for nodes
+            that are evaluated on their own.
+        n_params: int
+            Number of model parameters (the leading parent arguments of likelihood).
+        param_bounds: list
+            Lower and upper bounds of the model parameters (as in model_config["param_bounds"]).
+            Nodes with parameters out of bounds are left to likelihood, which returns -np.inf.
+    """
+
+    def __init__(self, likelihood=None, n_params=None, param_bounds=None):
+        self.likelihood = likelihood
+        self.n_params = n_params
+        self.lower_bounds, self.upper_bounds = param_bounds
+        self.__signature__ = inspect.signature(likelihood)
+        parameters = list(self.__signature__.parameters.values())
+        self.data_arg = parameters[0].name
+        self.param_names = [p.name for p in parameters[1:] if p.name != "network"]
+        self.param_defaults = {
+            p.name: p.default for p in parameters if p.default is not p.empty
+        }
+        self.nodes = weakref.WeakValueDictionary()  # id(node) -> node
+        self.data_nodes = weakref.WeakValueDictionary()  # id(node.value) -> node
+        self.last_call = {}  # id(data) -> (parent values, logp)
+
+    def register(self, node):
+        self.nodes[id(node)] = node
+        self.data_nodes[id(node.value)] = node
+
+    def _in_bounds(self, values):
+        return all(
+            lower <= value <= upper
+            for value, lower, upper in zip(values, self.lower_bounds, self.upper_bounds)
+        )
+
+    def _parent_values(self, node):
+        values = node.parents.value
+        return tuple(
+            float(values.get(name, self.param_defaults.get(name)))
+            for name in self.param_names
+        )
+
+    def _stale_nodes(self, node, last_values, values):
+        # Registered nodes sharing a parent that changed for node
+        stale = {}
+        for name, last, value in zip(self.param_names, last_values, values):
+            if last == value:
+                continue
+            for child in getattr(node.parents.get(name), "children", ()):
+                if self.nodes.get(id(child)) is not child or child is node:
+                    continue
+                child_values = self._parent_values(child)
+                cached = self.last_call.get(id(child.value))
+                if (cached is None or cached[0] != child_values) and self._in_bounds(
+                    child_values
+                ):
+                    stale[id(child)] = (child.value, child_values)
+        return list(stale.values())
+
+    def __call__(self, *args, **kwargs):
+        arguments = self.__signature__.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        arguments = arguments.arguments
+        data = arguments[self.data_arg]
+        values = tuple(float(arguments[name]) for name in self.param_names)
+
+        key = id(data)
+        cached = self.last_call.get(key)
+        if cached is not None and cached[0] == values:
+            return cached[1]
+
+        node = self.data_nodes.get(key)
+        if cached is None or node is None or not self._in_bounds(values):
+            batch = []
+        else:
+            batch = self._stale_nodes(node, cached[0], values)
+
+        if not batch:
+            logp = self.likelihood(*args, **kwargs)
+        else:
+            batch.insert(0, (data, values))
+            logp = self._batch_logp(batch, arguments["network"])[0]
+
+        if cached is not None or hddm.utils._track_data(data, self.last_call, key):
+            self.last_call[key] = (values, logp)
+        return logp
+
+    def _batch_logp(self, batch, network):
+        inputs = []
+        for data, values in batch:
+            buffer, weights = lan_input_buffer(data, self.n_params)
+            buffer[:, : self.n_params] = values[: self.n_params]
+            inputs.append((buffer, weights))
+
+        # One forward pass for all nodes, then split by node
+        net_log_p = network.predict_on_batch(
+            np.concatenate([buffer for buffer, weights in inputs])
+        )
+
+        logps = []
+        start = 0
+        for (data, values), (buffer, weights) in zip(batch, inputs):
+            stop = start + buffer.shape[0]
+            parents = dict(zip(self.param_names, values))
+            logp = hddm.wfpt.nn_mlp_log_p(
+                net_log_p[start:stop],
+                p_outlier=parents["p_outlier"],
+                w_outlier=parents["w_outlier"],
+                weights=weights,
+            )
+            key = id(data)
+            if key in self.last_call or hddm.utils._track_data(
+                data, self.last_call, key
+            ):
+                self.last_call[key] = (values, logp)
+            logps.append(logp)
+            start = stop
+        return logps
+
+
 # LIKELIHOODS
-def make_mlp_likelihood(model=None, model_config=None, wiener_params=None, **kwargs):
+def make_mlp_likelihood(
+    model=None, model_config=None, wiener_params=None, batch_nodes=False, **kwargs
+):
     """Defines the likelihoods for the MLP networks.
 
     :Arguments:
@@ -100,6 +235,9 @@ def make_mlp_likelihood(model=None, model_config=None, wiener_params=None, **kwa
         model_config: dict <default=None>
             Model config supplied via the calling HDDM class. Necessary for construction of likelihood.
             Should have the structure of model_configs in the hddm.model_config.model_config dictionary.
+        batch_nodes: bool <default=False>
+            Evaluate the nodes of the returned stochastic together when a shared parent changes
+            (see BatchedMLPLikelihood).
         kwargs: dict
             Dictionary of additional keyword arguments.
             Importantly here, this carries the preloaded CNN.
@@ -185,12 +323,7 @@ def make_mlp_likelihood(model=None, model_config=None, wiener_params=None, **kwa
         return "Not yet implemented"
 
     def make_likelihood():
-        likelihood_str = make_likelihood_str_mlp(
-            config=model_config, wiener_params=wiener_params
-        )
-        exec(likelihood_str)
-        my_fun = locals()["custom_likelihood"]
-        return my_fun
+        return make_likelihood_mlp(config=model_config, wiener_params=wiener_params)
 
     # TODO: Allow for rt's of -999 in LAN likelihoods
     def make_likelihood_missing_data():
@@ -198,7 +331,27 @@ def make_mlp_likelihood(model=None, model_config=None, wiener_params=None, **kwa
 
     likelihood_ = make_likelihood()
 
-    wfpt_nn = stochastic_from_dist("Wienernn_" + model, partial(likelihood_, **kwargs))
+    if batch_nodes:
+        batched_likelihood = BatchedMLPLikelihood(
+            likelihood=likelihood_,
+            n_params=len(model_config["params"]),
+            param_bounds=model_config["param_bounds"],
+        )
+        wfpt_nn_base = stochastic_from_dist(
+            "Wienernn_" + model, partial(batched_likelihood, **kwargs)
+        )
+
+        class wfpt_nn(wfpt_nn_base):
+            def __init__(self, *args, **kwds):
+                super(wfpt_nn, self).__init__(*args, **kwds)
+                batched_likelihood.register(self)
+
+        wfpt_nn.__name__ = wfpt_nn_base.__name__
+
+    else:
+        wfpt_nn = stochastic_from_dist(
+            "Wienernn_" + model, partial(memoize_logp(likelihood_), **kwargs)
+        )
 
     wfpt_nn.pdf = pdf
     wfpt_nn.cdf_vec = None  # AF TODO: Implement this for neural nets (not a big deal actually but not yet sure where this is ever used finally)
@@ -229,15 +382,12 @@ def make_mlp_likelihood_rlssm(
     """
 
     def make_likelihood():
-        likelihood_str = make_likelihood_str_mlp_rlssm(
+        return make_likelihood_mlp_rlssm(
             model=model,
             config=model_config,
             config_rl=model_config_rl,
             wiener_params=wiener_params,
         )
-        exec(likelihood_str)
-        my_fun = locals()["custom_likelihood"]
-        return my_fun
 
     likelihood_ = make_likelihood()
 
@@ -350,22 +500,12 @@ def make_mlp_likelihood_reg(
         return "Not yet implemented"
 
     def make_likelihood():
-        if indirect_betas_present or indirect_regressors_present:
-            likelihood_str = make_reg_likelihood_str_mlp(
-                config=model_config,
-                wiener_params=wiener_params,
-                param_links=param_links,
-                param_links_betas=param_links_betas,
-            )
-        else:
-            likelihood_str = make_reg_likelihood_str_mlp_basic(
-                config=model_config,
-                wiener_params=wiener_params,
-            )
-
-        exec(likelihood_str)
-        my_fun = locals()["custom_likelihood_reg"]
-        return my_fun
+        return make_reg_likelihood_mlp(
+            config=model_config,
+            wiener_params=wiener_params,
+            param_links=param_links,
+            param_links_betas=param_links_betas,
+        )
 
     # TODO: Allow for missing data in LAN likelihoods
     def make_likelihood_missing_data():
@@ -413,17 +553,13 @@ def make_mlp_likelihood_reg_nn_rl(
                 "Indirect regressors are not yet implemented for RLSSM models."
             )
         else:
-            likelihood_str = make_reg_likelihood_str_mlp_basic_nn_rl(
+            return make_reg_likelihood_mlp_nn_rl(
                 model=model,
                 config=model_config,
                 config_rl=model_config_rl,
                 wiener_params=wiener_params,
             )
 
-        exec(likelihood_str)
-        my_fun = locals()["custom_likelihood_reg"]
-        return my_fun
-
     param_links, indirect_regressors_present = __prepare_indirect_regressors(
         model_config=model_config
     )
@@ -1,5 +1,7 @@
 import numpy as np
 
+# "update_rule" selects the Q-learning update of the LAN likelihoods for
+# tasks with any number of options (see hddm.wfpt.rl_update_rules).
 model_config_rl = {
     "RWupdate": {
         "doc": "Rescorla-Wagner update rule.",
@@ -8,6 +10,7 @@ model_config_rl = {
         "params_std_upper": [10],
         "param_bounds": [[0.0], [1.0]],
         "params_default": [0.5],
+        "update_rule": "rw",
     },
     "RWupdate_dual": {
         "doc": "Rescorla-Wagner update with two learning rates",
@@ -16,5 +19,16 @@ model_config_rl = {
         "params_std_upper": [10, 10],
         "param_bounds": [[0.0, 0.0], [1.0, 1.0]],
         "params_default": [0.5, 0.5],
+        "update_rule": "rw_dual",
+    },
+    "RWupdate_decay": {
+        "doc": "Rescorla-Wagner update where the values of the unchosen options decay \n"
+        + "towards the initial value with rate rl_decay.",
+        "params": ["rl_alpha", "rl_decay"],
+        "params_trans": [0, 0],
+        "params_std_upper": [10, 10],
+        "param_bounds": [[0.0, 0.0], [1.0, 1.0]],
+        "params_default": [0.5, 0.5],
+        "update_rule": "rw_decay",
     },
 }
@@ -92,9 +92,14 @@ class HDDM(HDDMBase):
          :Parameters:
              * err: Error bound for wfpt <default=1e-4>
              * n_st: Maximum depth for numerical integration for st <default=2>
+               (number of nodes if use_adaptive=2)
              * n_sz: Maximum depth for numerical integration for Z <default=2>
-             * use_adaptive: Whether to use adaptive numerical integration <default=True>
+               (number of nodes if use_adaptive=2)
+             * use_adaptive: Numerical integration method: 0 fixed Simpson,
+               1 adaptive Simpson, 2 Gauss-Legendre with n_st/n_sz nodes <default=1>
              * simps_err: Error bound for Simpson integration <default=1e-3>
+             * fast: Sum the density series with recurrences if sz and st are not
+               estimated, within a relative error of 1e-9 <default=False>
 
     :Example:
         >>> data, params = hddm.generate.gen_rand_data() # gen data
@@ -10,14 +10,7 @@ from kabuki.hierarchical import (
 from hddm.models import HDDMnn
 from copy import deepcopy
 
-try:
-    from hddm.torch.mlp_inference_class import load_torch_mlp
-except:
-    print(
-        "It seems that you do not have pytorch installed."
-        + "The HDDMnn, HDDMnnRL, HDDMnnRegressor, HDDMnnStimCoding, HDDMnnRL and HDDMnnRLRegressor"
-        + "classes will not work"
-    )
+from hddm.torch.mlp_inference_numpy import get_mlp, is_shared_mlp
 
 
 class HDDMnnRL(HDDMnn):
@@ -39,8 +32,25 @@ class HDDMnnRL(HDDMnn):
             String that determines which sequential sampling model you would like to fit your data to.
             Currently available models are: 'ddm', 'full_ddm', 'angle', 'weibull', 'ornstein', 'levy'
 
+        network_backend: str <default='torch'>
+            'torch', 'torchscript' or 'numpy' (see hddm.torch.mlp_inference_numpy.get_mlp).
+
+        network_threads: int <default=None>
+            CPU threads of the torch network (see hddm.torch.mlp_inference_numpy.get_mlp).
+
+        network_quantize: str <default=None>
+            'int8' or 'bfloat16' for reduced precision (see hddm.torch.mlp_inference_numpy.get_mlp).
+
         rl_rule: str <default='RWupdate'>
             String that determines which reinforcement learning model you would like to fit your data to.
+            Available rules are listed in hddm.model_config_rl: 'RWupdate', 'RWupdate_dual'
+            (separate learning rate for positive prediction errors) and 'RWupdate_decay'
+            (values of the unchosen options decay towards q_init).
+
+            Tasks with more than two options are fit with models that have one accumulator
+            per option, e.g. model='race_no_bias_4' or 'lca_no_bias_4' for four options coded
+            as responses 0 .. 3. The drift of accumulator k is then v<k> times the Q-value
+            of option k.
 
         include: list <default=None>
             A list with parameters we wish to include in the fitting procedure.
@@ -84,6 +94,9 @@ class HDDMnnRL(HDDMnn):
         self.model_config_rl = kwargs.pop("model_config_rl", None)
 
         self.network = kwargs.pop("network", None)
+        self.network_backend = kwargs.pop("network_backend", "torch")
+        self.network_threads = kwargs.pop("network_threads", None)
+        self.network_quantize = kwargs.pop("network_quantize", None)
 
         print("\nPrinting model specifications -- ")
         print("ssm: ", self.model)
@@ -112,10 +125,16 @@ class HDDMnnRL(HDDMnn):
 
         if self.network is None:
             try:
-                self.network = load_torch_mlp(model=self.model)
+                self.network = get_mlp(
+                    model=self.model,
+                    backend=self.network_backend,
+                    n_threads=self.network_threads,
+                    quantize=self.network_quantize,
+                )
             except:
-                print("Couldn't execute load_torch_mlp()...")
+                print("Couldn't execute get_mlp()...")
                 print("Option 1: pytorch not installed or version older than 1.7?")
+                print("(network_backend='numpy' does not need pytorch)")
                 print(
                     "Option 2: pytorch model for your model string is not yet available"
                 )
@@ -145,6 +164,9 @@ class HDDMnnRL(HDDMnn):
         super(HDDMnnRL, self).__init__(
             model=self.model,
             network=self.network,
+            network_backend=self.network_backend,
+            network_threads=self.network_threads,
+            network_quantize=self.network_quantize,
             non_centered=self.non_centered,
             *args,
             **kwargs
@@ -168,11 +190,20 @@ class HDDMnnRL(HDDMnn):
 
     def __getstate__(self):
         d = super(HDDMnnRL, self).__getstate__()
+        if is_shared_mlp(d["network"]):
+            d["network"] = None
         del d["wfpt_nn_rlssm"]
 
         return d
 
     def __setstate__(self, d):
+        if d["network"] is None:
+            d["network"] = get_mlp(
+                model=d["model"],
+                backend=d.get("network_backend", "torch"),
+                n_threads=d.get("network_threads"),
+                quantize=d.get("network_quantize"),
+            )
         network_dict = {"network": d["network"]}
         d["wfpt_nn_rlssm"] = hddm.likelihoods_mlp.make_mlp_likelihood_rlssm(
             model=d["model"],
@@ -3,14 +3,7 @@ from hddm.models import HDDMRegressor
 from copy import deepcopy
 from kabuki import Knode
 
-try:
-    from hddm.torch.mlp_inference_class import load_torch_mlp
-except:
-    print(
-        "It seems that you do not have pytorch installed."
-        + "The HDDMnn, HDDMnnRegressor, HDDMnnStimCoding, HDDMnnRL and HDDMnnRLRegressor"
-        + "classes will not work"
-    )
+from hddm.torch.mlp_inference_numpy import get_mlp, is_shared_mlp
 
 
 class HDDMnnRLRegressor(HDDMRegressor):
@@ -47,6 +40,12 @@ class HDDMnnRLRegressor(HDDMRegressor):
             model: str <default='ddm'>
                 String that determines which sequential sampling model you would like to fit your data to.
                 Currently available models are: 'ddm', 'full_ddm', 'angle', 'weibull', 'ornstein', 'levy'
+            network_backend: str <default='torch'>
+                'torch', 'torchscript' or 'numpy' (see hddm.torch.mlp_inference_numpy.get_mlp).
+            network_threads: int <default=None>
+                CPU threads of the torch network (see hddm.torch.mlp_inference_numpy.get_mlp).
+            network_quantize: str <default=None>
+                'int8' or 'bfloat16' for reduced precision (see hddm.torch.mlp_inference_numpy.get_mlp).
             rl_rule: str <default='RWupdate'>
                 String that determines which reinforcement learning model you would like to fit your data to.
             include: list <default=None>
@@ -105,6 +104,9 @@ class HDDMnnRLRegressor(HDDMRegressor):
             kwargs["informative"] = False
 
         self.network = kwargs.pop("network", None)
+        self.network_backend = kwargs.pop("network_backend", "torch")
+        self.network_threads = kwargs.pop("network_threads", None)
+        self.network_quantize = kwargs.pop("network_quantize", None)
         self.non_centered = kwargs.pop("non_centered", False)
 
         self.w_outlier = kwargs.pop("w_outlier", 0.1)
@@ -157,10 +159,16 @@ class HDDMnnRLRegressor(HDDMRegressor):
 
         if self.network is None:
             try:
-                self.network = load_torch_mlp(model=self.model)
+                self.network = get_mlp(
+                    model=self.model,
+                    backend=self.network_backend,
+                    n_threads=self.network_threads,
+                    quantize=self.network_quantize,
+                )
             except:
-                print("Couldn't execute load_torch_mlp()...")
+                print("Couldn't execute get_mlp()...")
                 print("Option 1: pytorch not installed or version older than 1.7?")
+                print("(network_backend='numpy' does not need pytorch)")
                 print(
                     "Option 2: pytorch model for your model string is not yet available"
                 )
@@ -237,11 +245,20 @@ class HDDMnnRLRegressor(HDDMRegressor):
 
     def __getstate__(self):
         d = super(HDDMnnRLRegressor, self).__getstate__()
+        if is_shared_mlp(d["network"]):
+            d["network"] = None
         del d["wfpt_nn_rl_reg_class"]
 
         return d
 
     def __setstate__(self, d):
+        if d["network"] is None:
+            d["network"] = get_mlp(
+                model=d["model"],
+                backend=d.get("network_backend", "torch"),
+                n_threads=d.get("network_threads"),
+                quantize=d.get("network_quantize"),
+            )
         network_dict = {"network": d["network"]}
 
         d["wfpt_nn_rl_reg_class"] = hddm.likelihoods_mlp.make_mlp_likelihood_reg_nn_rl(
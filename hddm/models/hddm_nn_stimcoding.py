@@ -2,15 +2,7 @@ from hddm.models import HDDMStimCoding
 from hddm.models.hddm_stimcoding import KnodeWfptStimCoding
 from copy import deepcopy
 
-try:
-    # print('HDDM: Trying import of pytorch related classes.')
-    from hddm.torch.mlp_inference_class import load_torch_mlp
-except:
-    print(
-        "It seems that you do not have pytorch installed."
-        + "The HDDMnn, HDDMnnRegressor and HDDMnnStimCoding"
-        + "classes will not work"
-    )
+from hddm.torch.mlp_inference_numpy import get_mlp, is_shared_mlp
 
 import hddm
 
@@ -33,6 +25,19 @@ class HDDMnnStimCoding(HDDMStimCoding):
             String that determines which model you would like to fit your data to.
             Currently available models are: 'ddm', 'full_ddm', 'angle', 'weibull', 'ornstein', 'levy'
 
+        network_backend: str <default='torch'>
+            'torch', 'torchscript' or 'numpy' (see hddm.torch.mlp_inference_numpy.get_mlp).
+
+        network_threads: int <default=None>
+            CPU threads of the torch network (see hddm.torch.mlp_inference_numpy.get_mlp).
+
+        network_quantize: str <default=None>
+            'int8' or 'bfloat16' for reduced precision (see hddm.torch.mlp_inference_numpy.get_mlp).
+
+        batch_nodes: bool <default=False>
+            Evaluate the network once for all observed nodes whose shared parents
+            (e.g. group only parameters or p_outlier) changed, instead of once per node.
+
         nbin: int <default=512>
             Relevant only if network type was chosen to be 'cnn'. CNNs can be trained on coarser or
             finer binnings of RT space. At this moment only networks with 512 bins are available.
@@ -68,6 +73,10 @@ class HDDMnnStimCoding(HDDMStimCoding):
             kwargs["informative"] = False
 
         self.network = kwargs.pop("network", None)
+        self.network_backend = kwargs.pop("network_backend", "torch")
+        self.network_threads = kwargs.pop("network_threads", None)
+        self.network_quantize = kwargs.pop("network_quantize", None)
+        self.batch_nodes = kwargs.pop("batch_nodes", False)
         self.non_centered = kwargs.pop("non_centered", False)
         self.w_outlier = kwargs.pop("w_outlier", 0.1)
         self.model = kwargs.pop("model", "ddm")
@@ -95,10 +104,16 @@ class HDDMnnStimCoding(HDDMStimCoding):
 
         if self.network is None:
             try:
-                self.network = load_torch_mlp(model=self.model)
+                self.network = get_mlp(
+                    model=self.model,
+                    backend=self.network_backend,
+                    n_threads=self.network_threads,
+                    quantize=self.network_quantize,
+                )
             except:
-                print("Couldn't execute load_torch_mlp()...")
+                print("Couldn't execute get_mlp()...")
                 print("Option 1: pytorch not installed or version older than 1.7?")
+                print("(network_backend='numpy' does not need pytorch)")
                 print(
                     "Option 2: pytorch model for your model string is not yet available"
                 )
@@ -108,6 +123,7 @@ class HDDMnnStimCoding(HDDMStimCoding):
             model=self.model,
             model_config=self.model_config,
             wiener_params=kwargs["wiener_params"],
+            batch_nodes=self.batch_nodes,
             **network_dict
         )
 
@@ -135,15 +151,28 @@ class HDDMnnStimCoding(HDDMStimCoding):
 
     def __getstate__(self):
         d = super(HDDMnnStimCoding, self).__getstate__()
+        if is_shared_mlp(d["network"]):
+            d["network"] = None
         # del d["network"]
         del d["wfpt_nn"]
         return d
 
     def __setstate__(self, d):
+        if d["network"] is None:
+            d["network"] = get_mlp(
+                model=d["model"],
+                backend=d.get("network_backend", "torch"),
+                n_threads=d.get("network_threads"),
+                quantize=d.get("network_quantize"),
+            )
         # d["network"] = load_torch_mlp(model=d["model"])
         network_dict = {"network": d["network"]}
         d["wfpt_nn"] = hddm.likelihoods_mlp.make_mlp_likelihood(
-            model=d["model"], **network_dict
+            model=d["model"],
+            model_config=d["model_config"],
+            wiener_params=d["wiener_params"],
+            batch_nodes=d.get("batch_nodes", False),
+            **network_dict
         )
 
         super(HDDMnnStimCoding, self).__setstate__(d)
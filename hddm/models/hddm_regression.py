@@ -44,8 +44,8 @@ def generate_wfpt_reg_stochastic_class(
         """Log-likelihood for the full DDM using the interpolation method"""
         params = {"v": v, "sv": sv, "a": a, "z": z, "sz": sz, "t": t, "st": st}
         for reg_outcome in reg_outcomes:
-            params[reg_outcome] = params[reg_outcome].loc[value["rt"].index].values
-        return hddm.wfpt.wiener_like_multi(
+            params[reg_outcome] = hddm.utils.reg_values(value, params[reg_outcome])
+        return hddm.wfpt.wiener_like_array(
             value["rt"].values,
             params["v"],
             params["sv"],
@@ -55,9 +55,9 @@ def generate_wfpt_reg_stochastic_class(
             params["t"],
             params["st"],
             1e-4,
-            reg_outcomes,
             w_outlier=wp["w_outlier"],
             p_outlier=p_outlier,
+            fast=wp.get("fast", False),
         )
 
     def random(
@@ -152,30 +152,35 @@ class KnodeRegress(kabuki.hierarchical.Knode):
 
         parents = {"args": args}
 
+        # The design matrix is computed on all data of the model (self.data) and
+        # sliced to the trials of this node once, so that an evaluation is a
+        # single matrix-vector product.
+        design_matrix = dmatrix(
+            reg["model"],
+            data=self.data,  # Note: data is hardcoded here
+            return_type="dataframe",
+            NA_action="raise",
+        )
+        if design_matrix.shape[1] != len(args):
+            raise NotImplementedError(
+                "Missing columns in design matrix. You need data for all conditions for all subjects."
+            )
+        positions = design_matrix.index.get_indexer(data.index)
+        if (positions < 0).any():
+            raise KeyError("Design matrix is missing trials of the data.")
+
         def func(
             args,
-            design_matrix=dmatrix(
-                reg["model"],
-                data=self.data,  # Note: data is hardcoded here
-                return_type="dataframe",
-                NA_action="raise",
+            design_matrix=np.ascontiguousarray(
+                design_matrix.values[positions], dtype=np.float64
             ),
+            index=data.index,
             link_func=reg["link_func"],
-            # knode_data=data, AF-NOTE: I think this can be dropped
         ):
-            # Convert parents to matrix
-            params = np.matrix(args)
-            design_matrix = design_matrix.loc[data.index]
-
-            # Apply design matrix to input data
-            if design_matrix.shape[1] != params.shape[1]:
-                raise NotImplementedError(
-                    "Missing columns in design matrix. You need data for all conditions for all subjects."
-                )
-
             # predictor is the final regression outcome --> our parameter of interest
-            predictor = link_func(design_matrix.dot(params.T)[0])
-            return predictor
+            # (the same index object on every call, see hddm.utils.reg_values)
+            predictor = design_matrix.dot(np.asarray(args, dtype=np.float64))
+            return link_func(pd.Series(predictor, index=index))
 
         # Build pymc node based on the information provided
         return self.pymc_node(
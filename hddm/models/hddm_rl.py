@@ -9,6 +9,7 @@ import wfpt
 from kabuki.hierarchical import Knode
 from kabuki.utils import stochastic_from_dist
 from hddm.models import HDDM
+from hddm.utils import data_columns, split_by_blocks
 from wfpt import wiener_like_rlddm
 
 
@@ -106,10 +107,10 @@ def wienerRL_like(x, v, alpha, pos_alpha, sv, a, z, sz, t, st, p_outlier=0):
         "w_outlier": 0.1,
     }
     wp = wiener_params
-    response = x["response"].values.astype(int)
+    (response, split_by) = data_columns(x, ("response", "split_by"), np.int_)
+    (feedback,) = data_columns(x, ("feedback",))
+    order, offsets = split_by_blocks(x)
     q = x["q_init"].iloc[0]
-    feedback = x["feedback"].values.astype(float)
-    split_by = x["split_by"].values.astype(int)
     return wiener_like_rlddm(
         x["rt"].values,
         response,
@@ -126,6 +127,8 @@ def wienerRL_like(x, v, alpha, pos_alpha, sv, a, z, sz, t, st, p_outlier=0):
         t,
         st,
         p_outlier=p_outlier,
+        order=order,
+        offsets=offsets,
         **wp
     )
 
@@ -9,6 +9,7 @@ import wfpt
 from kabuki.hierarchical import Knode
 from kabuki.utils import stochastic_from_dist
 from hddm.models import HDDM
+from hddm.utils import data_columns, split_by_blocks
 from wfpt import wiener_like_rl
 from collections import OrderedDict
 
@@ -119,10 +120,10 @@ def RL_like(x, v, alpha, pos_alpha, z=0.5, p_outlier=0):
     }
     sum_logp = 0
     wp = wiener_params
-    response = x["response"].values.astype(int)
+    (response, split_by) = data_columns(x, ("response", "split_by"), np.int_)
+    (feedback,) = data_columns(x, ("feedback",))
+    order, offsets = split_by_blocks(x)
     q = x["q_init"].iloc[0]
-    feedback = x["feedback"].values.astype(float)
-    split_by = x["split_by"].values.astype(int)
     return wiener_like_rl(
         response,
         feedback,
@@ -133,6 +134,8 @@ def RL_like(x, v, alpha, pos_alpha, z=0.5, p_outlier=0):
         v,
         z,
         p_outlier=p_outlier,
+        order=order,
+        offsets=offsets,
         **wp
     )
 
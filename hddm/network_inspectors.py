@@ -21,6 +21,7 @@ except:
         + " You cannot use the network_inspector module."
     )
 
+from hddm.torch.mlp_inference_numpy import get_mlp
 from hddm.simulators.basic_simulator import *
 
 from sklearn.neighbors import KernelDensity
@@ -31,12 +32,14 @@ from hddm.model_config import model_config
 # NETWORK LOADERS -------------------------------------------------------------------------
 
 
-def get_torch_mlp(model="angle", nbin=512):
+def get_torch_mlp(model="angle", nbin=512, quantize=None):
     """Returns the torch network which is the basis of the TORCH_MLP likelihoods
 
     :Arguments:
         model: str <default='angle'>
         Specifies the models you would like to load
+        quantize: str <default=None>
+        'int8' or 'bfloat16' to get the network in reduced precision (see LoadTorchMLPInfer)
 
     Returns:
         Returns a function that gives you access to a forward pass through the MLP.
@@ -50,7 +53,7 @@ def get_torch_mlp(model="angle", nbin=512):
         >>> data = np.array([[0.5, 1.5, 0.5, 0.5, 1.0, -1.0], [0.5, 1.5, 0.5, 0.5, 1.0, -1.0]], dtype = np.float32)
         >>> forward(data)
     """
-    network = load_torch_mlp(model=model)
+    network = get_mlp(model=model, quantize=quantize)
     return network.predict_on_batch
 
 
@@ -271,6 +274,7 @@ def kde_vs_lan_likelihoods(  # ax_titles = [],
     show=True,
     font_scale=1.5,
     figsize=(10, 10),
+    quantize=None,
 ):
     """Function creates a plot that compares kernel density estimates from simulation data with mlp output.
 
@@ -293,6 +297,10 @@ def kde_vs_lan_likelihoods(  # ax_titles = [],
         font_scale: float <default=1.5>
             Seaborn setting, exposed here to be adjusted by user, since it is not always
             obvious which value is best.
+        quantize: str <default=None>
+            'int8' or 'bfloat16'. Adds the likelihoods of the network in reduced precision
+            to the plot, to validate them against the float32 network and the KDE. The
+            subplot titles show the largest absolute difference between the two networks.
 
     :Returns:
         empty
@@ -339,6 +347,8 @@ def kde_vs_lan_likelihoods(  # ax_titles = [],
 
     # Load Keras model and initialize batch container
     torch_model = get_torch_mlp(model=model)
+    if quantize is not None:
+        quantized_model = get_torch_mlp(model=model, quantize=quantize)
     input_batch = np.zeros((4000, parameter_df.shape[1] + 2))
     input_batch[:, parameter_df.shape[1] :] = plot_data
 
@@ -353,6 +363,11 @@ def kde_vs_lan_likelihoods(  # ax_titles = [],
         input_batch[:, : parameter_df.shape[1]] = parameter_df.iloc[i, :].values
         # input_batch = input_batch.astype(np.float32)
         ll_out_keras = torch_model(input_batch.astype(np.float32))
+        if quantize is not None:
+            ll_out_quantized = quantized_model(input_batch.astype(np.float32))
+            quantize_error = np.max(
+                np.abs(np.exp(ll_out_quantized) - np.exp(ll_out_keras))
+            )
 
         for j in range(n_reps):
             out = simulator(
@@ -422,6 +437,32 @@ def kde_vs_lan_likelihoods(  # ax_titles = [],
                             ax=ax[row_tmp, col_tmp],
                         )
 
+                # Plot predictions of the quantized network
+                if quantize is not None:
+                    if len(model_config[model]["choices"]) == 2:
+                        sns.lineplot(
+                            x=plot_data[:, 0] * plot_data[:, 1],
+                            y=np.exp(ll_out_quantized[:, 0]),
+                            color="orange",
+                            label="MLP " + quantize,
+                            alpha=1,
+                            linestyle="--",
+                            ax=ax[row_tmp, col_tmp],
+                        )
+                    else:
+                        for k in range(len(model_config[model]["choices"])):
+                            sns.lineplot(
+                                x=plot_data[1000 * k : 1000 * (k + 1), 0],
+                                y=np.exp(
+                                    ll_out_quantized[1000 * k : 1000 * (k + 1), 0]
+                                ),
+                                color="orange",
+                                label="MLP " + quantize if k == 0 else None,
+                                alpha=1,
+                                linestyle="--",
+                                ax=ax[row_tmp, col_tmp],
+                            )
+
         # Legend adjustments
         if row_tmp == 0 and col_tmp == 0:
             ax[row_tmp, col_tmp].legend(
@@ -439,7 +480,10 @@ def kde_vs_lan_likelihoods(  # ax_titles = [],
             ax[row_tmp, col_tmp].set_ylabel("likelihood", fontsize=20)
 
         # tmp title
-        ax[row_tmp, col_tmp].set_title(str(i), fontsize=20)  # ax_titles[i],
+        title = str(i)
+        if quantize is not None:
+            title += ", max. error " + quantize + ": " + "{:.2g}".format(quantize_error)
+        ax[row_tmp, col_tmp].set_title(title, fontsize=20)  # ax_titles[i],
         ax[row_tmp, col_tmp].tick_params(axis="y", size=14)
         ax[row_tmp, col_tmp].tick_params(axis="x", size=14)
 
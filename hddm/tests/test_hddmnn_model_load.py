@@ -171,6 +171,54 @@ class ModelLoad(unittest.TestCase):
                 print("Skipping n > 2 choice models for this test for now !")
         pass
 
+    def test_save_load_rl_network_backend(self):
+        data = hddm.load_csv(hddm.__path__[0] + "/examples/rlddm_data.csv")
+        data = data[data["subj_idx"] == data["subj_idx"].iloc[0]]
+
+        model_ = hddm.HDDMnnRL(
+            data,
+            model="ddm",
+            rl_rule="RWupdate",
+            network_backend="numpy",
+            include=["v", "a", "t", "z", "rl_alpha"],
+            is_group_model=False,
+            p_outlier=0.0,
+        )
+        self.assertEqual(model_.network_backend, "numpy")
+
+        # Save and load model
+        model_.save(self.filepath + "test_rl_numpy.pickle")
+        model__ = hddm.load(self.filepath + "test_rl_numpy.pickle")
+
+        # The network is rebuilt with the backend the model was fit with
+        self.assertEqual(model__.network_backend, "numpy")
+        self.assertIs(
+            model__.network,
+            hddm.torch.mlp_inference_numpy.get_mlp(model="ddm", backend="numpy"),
+        )
+
+    def test_batch_nodes_logp(self):
+        models = [
+            hddm.HDDMnn(
+                self.cav_data,
+                model="ddm",
+                informative=False,
+                include=["z", "p_outlier"],
+                batch_nodes=batch_nodes,
+            )
+            for batch_nodes in (False, True)
+        ]
+
+        # p_outlier is a parent of every observed node
+        for p_outlier in (0.05, 0.1, 0.2):
+            logps = []
+            for model_ in models:
+                model_.nodes_db.loc["p_outlier", "node"].value = p_outlier
+                logps.append(
+                    sum(node.logp for node in model_.get_observeds()["node"])
+                )
+            self.assertAlmostEqual(logps[0], logps[1], places=2)
+
 
 if __name__ == "__main__":
     unittest.main()
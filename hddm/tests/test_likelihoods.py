@@ -1,4 +1,8 @@
+import inspect
+import os
+
 import numpy as np
+import pandas as pd
 from numpy.random import rand
 import scipy as sp
 
@@ -57,6 +61,36 @@ class TestWfpt(unittest.TestCase):
             print(v, t, a, z, z_nonorm, rt, err, matlab_wfpt, python_wfpt)
             np.testing.assert_array_almost_equal(matlab_wfpt, python_wfpt, 9)
 
+    def test_pdf_fast(self):
+        # The fast mode has to stay within its documented relative error of 1e-9
+        from .matlab_values import vals
+
+        for v, t, a, z, z_nonorm, rt, err, matlab_wfpt in vals:
+            fast_wfpt = hddm.wfpt.full_pdf_fast(-rt, v, 0, a, z, 0, t, 0, err, 0)
+            np.testing.assert_allclose(fast_wfpt, matlab_wfpt, rtol=1e-6)
+
+        # the series cancels for starting points close to either bound
+        z_edge = np.linspace(1e-3, 0.05, 10)
+        for z in np.concatenate([z_edge, 1 - z_edge]):
+            for rt in np.linspace(0.25, 5, 20):
+                for x in (rt, -rt):
+                    for v, sv, a in [(-1.5, 0, 0.8), (0.5, 1, 1.5), (2, 0, 2.5)]:
+                        np.testing.assert_allclose(
+                            hddm.wfpt.full_pdf_fast(x, v, sv, a, z, 0, 0.2, 0, 1e-8),
+                            hddm.wfpt.full_pdf(x, v, sv, a, z, 0, 0.2, 0, 1e-8),
+                            rtol=1e-9,
+                        )
+
+        np.random.seed(123)
+        params = hddm.generate.gen_rand_params(include=("v", "a", "t", "z", "sv"))
+        rts = (params["t"] + rand(100) * 3) * np.sign(rand(100) - 0.3)
+        args = [params[name] for name in ("v", "sv", "a", "z")] + [0, params["t"], 0]
+        np.testing.assert_allclose(
+            hddm.wfpt.wiener_like(rts, *args, err=1e-8, fast=True),
+            hddm.wfpt.wiener_like(rts, *args, err=1e-8),
+            atol=len(rts) * 1e-9,
+        )
+
     def test_pdf(self):
         # Test if our wfpt pdf implementation yields the same results as the reference implementation by Navarro & Fuss 2009
         try:
@@ -126,6 +160,396 @@ class TestWfpt(unittest.TestCase):
             )
         ), "wiener_like_simple should have returned -np.Inf"
 
+    def test_wiener_like_array(self):
+        np.random.seed(123)
+        params = hddm.generate.gen_rand_params(
+            include=("v", "a", "t", "z", "sv", "sz", "st")
+        )
+        rts = (params["t"] + params["st"] + rand(50) * 2) * np.sign(rand(50) - 0.3)
+        v = params["v"] + rand(50) - 0.5
+
+        # per-trial drift rates must match evaluating every trial on its own
+        summed_logp = sum(
+            hddm.wfpt.wiener_like(
+                rts[i : i + 1],
+                v[i],
+                params["sv"],
+                params["a"],
+                params["z"],
+                params["sz"],
+                params["t"],
+                params["st"],
+                1e-4,
+            )
+            for i in range(len(rts))
+        )
+        summed_logp_array = hddm.wfpt.wiener_like_array(
+            rts,
+            v,
+            params["sv"],
+            params["a"],
+            params["z"],
+            params["sz"],
+            params["t"],
+            params["st"],
+            1e-4,
+            simps_err=1e-8,
+        )
+        np.testing.assert_almost_equal(summed_logp, summed_logp_array, 8)
+
+        self.assertRaises(
+            ValueError,
+            hddm.wfpt.wiener_like_array,
+            rts,
+            v[:10],
+            0,
+            1,
+            0.5,
+            0,
+            0.1,
+            0,
+            1e-4,
+        )
+
+    def test_wiener_like_batch(self):
+        np.random.seed(123)
+        theta = np.array(
+            [
+                [
+                    params[name]
+                    for name in ("v", "sv", "a", "z", "sz", "t", "st")
+                ]
+                for params in [
+                    hddm.generate.gen_rand_params(
+                        include=("v", "a", "t", "z", "sv", "sz", "st")
+                    )
+                    for _ in range(5)
+                ]
+            ]
+        )
+        rts = (theta[:, 5].max() + 0.2 + rand(50) * 2) * np.sign(rand(50) - 0.3)
+
+        batch_logp = hddm.wfpt.wiener_like_batch(rts, theta, 1e-4)
+        for k in range(theta.shape[0]):
+            np.testing.assert_almost_equal(
+                batch_logp[k], hddm.wfpt.wiener_like(rts, *theta[k], err=1e-4), 8
+            )
+
+    def test_nogil_noexcept(self):
+        # Cython 3 follows every call to a nogil function that is not noexcept with
+        # an error check that takes the GIL, once per density evaluation
+        import subprocess
+        import sys
+        import tempfile
+
+        import Cython
+
+        src = os.path.join(os.path.dirname(hddm.__file__), os.pardir, "src", "wfpt.pyx")
+        if not os.path.exists(src):
+            raise SkipTest("wfpt sources not available, not checking generated code.")
+        if int(Cython.__version__.split(".")[0]) < 3:
+            raise SkipTest("Cython < 3 does not check errors after nogil calls.")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "wfpt.cpp")
+            subprocess.check_call(
+                [sys.executable, "-m", "cython", "-3", "--cplus", src, "-o", out]
+            )
+            with open(out) as f:
+                self.assertNotIn("__Pyx_ErrOccurredWithGIL()", f.read())
+
+    def test_wiener_like_log(self):
+        np.random.seed(123)
+        params = hddm.generate.gen_rand_params(
+            include=("v", "a", "t", "z", "sv", "sz", "st")
+        )
+        rts = (params["t"] + params["st"] + rand(50) * 2) * np.sign(rand(50) - 0.3)
+        args = [params[name] for name in ("v", "sv", "a", "z", "sz", "t", "st")]
+        for p_outlier in (0, 0.05):
+            np.testing.assert_almost_equal(
+                hddm.wfpt.wiener_like_log(rts, *args, err=1e-8, p_outlier=p_outlier),
+                hddm.wfpt.wiener_like(rts, *args, err=1e-8, p_outlier=p_outlier),
+                8,
+            )
+
+        # the density of a very slow response underflows, its log does not
+        rts = np.array([0.5, 1.0, 100.0])
+        self.assertEqual(
+            hddm.wfpt.wiener_like(rts, 5, 0, 2, 0.5, 0, 0.3, 0, 1e-6), -np.inf
+        )
+        self.assertTrue(
+            np.isfinite(hddm.wfpt.wiener_like_log(rts, 5, 0, 2, 0.5, 0, 0.3, 0, 1e-6))
+        )
+
+    def test_unique_trials(self):
+        np.random.seed(123)
+        params = hddm.generate.gen_rand_params(
+            include=("v", "a", "t", "z", "sv", "sz", "st")
+        )
+        data, _ = hddm.generate.gen_rand_data(params, size=200)
+        # rounding to 10 ms leaves many repeated RTs
+        data["rt"] = np.round(data["rt"], 2)
+
+        (rts,), weights = hddm.utils.unique_trials(data, ("rt",))
+        self.assertLess(len(rts), len(data))
+        self.assertEqual(weights.sum(), len(data))
+        self.assertIs(hddm.utils.unique_trials(data, ("rt",))[0][0], rts)
+
+        all_rts = np.array(data["rt"])
+        args = [params[name] for name in ("v", "sv", "a", "z", "sz", "t", "st")]
+        np.testing.assert_almost_equal(
+            hddm.wfpt.wiener_like(rts, *args, err=1e-4, weights=weights),
+            hddm.wfpt.wiener_like(all_rts, *args, err=1e-4),
+            8,
+        )
+        np.testing.assert_array_equal(
+            hddm.wfpt.pdf_array(all_rts, *args, unique=True),
+            hddm.wfpt.pdf_array(all_rts, *args),
+        )
+
+    def test_memoize_logp(self):
+        calls = []
+
+        def like(x, v, a, t, p_outlier=0):
+            calls.append(v)
+            return hddm.wfpt.wiener_like(
+                np.array(x["rt"]), v, 0, a, 0.5, 0, t, 0, 1e-4, p_outlier=p_outlier
+            )
+
+        memoized_like = hddm.utils.memoize_logp(like)
+        data, _ = hddm.generate.gen_rand_data({"v": 1, "a": 2, "t": 0.3}, size=20)
+        other_data = data.copy()
+
+        logp = memoized_like(data, 1.0, 2.0, 0.3)
+        self.assertEqual(memoized_like(data, 1.0, 2.0, 0.3), logp)
+        self.assertEqual(len(calls), 1)
+        # the last value is kept per data object
+        memoized_like(other_data, 1.0, 2.0, 0.3)
+        memoized_like(data, 1.0, 2.0, 0.3)
+        self.assertEqual(len(calls), 2)
+        # any change of a parent is evaluated
+        memoized_like(data, 1.5, 2.0, 0.3)
+        memoized_like(data, 1.5, 2.0, 0.3, p_outlier=0.05)
+        self.assertEqual(len(calls), 4)
+
+    def test_likelihood_mlp_closures(self):
+        class Network:
+            weights = np.linspace(-1, 1, 6).astype(np.float32)[:, None]
+
+            def predict_on_batch(self, x):
+                return np.tanh(x @ self.weights) - 1
+
+        config = hddm.model_config.model_config["ddm"]
+        wiener_params = {"w_outlier": 0.1}
+        data, _ = hddm.generate.gen_rand_data({"v": 1, "a": 2, "t": 0.3}, size=50)
+        data["rt"] = np.abs(data["rt"])
+        data["response"] = data["response"] * 2.0 - 1
+        theta = dict(zip(config["params"], config["params_default"]))
+        trials = data[["rt", "response"]].values.astype(np.float32)
+
+        likelihood = hddm.utils.make_likelihood_mlp(config, wiener_params)
+        self.assertEqual(
+            list(inspect.signature(likelihood).parameters),
+            ["x"] + config["params"] + ["p_outlier", "w_outlier", "network"],
+        )
+        np.testing.assert_allclose(
+            likelihood(data, network=Network(), p_outlier=0.05, **theta),
+            hddm.wfpt.wiener_like_nn_mlp(
+                trials[:, 0],
+                trials[:, 1],
+                np.array(list(theta.values()), dtype=np.float32),
+                p_outlier=0.05,
+                w_outlier=0.1,
+                network=Network(),
+            ),
+            rtol=1e-5,
+        )
+        # parameters outside the bounds of the network, NaN included
+        for a in (100.0, np.nan):
+            self.assertEqual(
+                likelihood(data, network=Network(), **dict(theta, a=a)), -np.inf
+            )
+
+        v = pd.Series(np.linspace(0, 1, data.shape[0]), index=data.index)
+        likelihood = hddm.utils.make_reg_likelihood_mlp(config, wiener_params)
+        self.assertEqual(
+            list(inspect.signature(likelihood).parameters),
+            ["value"]
+            + config["params"]
+            + ["reg_outcomes", "p_outlier", "w_outlier", "kwargs"],
+        )
+        kwargs = dict(theta, v=v, reg_outcomes=["v"], network=Network())
+        inputs = np.column_stack(
+            [v.values if param == "v" else np.full(data.shape[0], value)
+             for param, value in theta.items()]
+            + [trials]
+        ).astype(np.float32)
+        np.testing.assert_allclose(
+            likelihood(data, **kwargs),
+            hddm.wfpt.wiener_like_multi_nn_mlp(inputs, w_outlier=0.1, network=Network()),
+            rtol=1e-5,
+        )
+        self.assertEqual(likelihood(data, **dict(kwargs, a=100.0)), -np.inf)
+        # regression targets are checked trial by trial after the regression
+        kwargs["reg_outcomes"] = ["v", "a"]
+        self.assertTrue(np.isfinite(likelihood(data, **dict(kwargs, a=v + 1))))
+        self.assertEqual(likelihood(data, **dict(kwargs, a=v + 100)), -np.inf)
+
+    def test_reg_values(self):
+        index = pd.Index(np.arange(0, 200, 2))
+        predictor = pd.Series(np.random.rand(100), index=index)
+        data = pd.DataFrame({"rt": np.ones(30)}, index=index[::-1][10:40])
+
+        for _ in range(2):
+            np.testing.assert_array_equal(
+                hddm.utils.reg_values(data, predictor),
+                predictor.loc[data.index].values,
+            )
+        predictor = np.exp(predictor)
+        np.testing.assert_array_equal(
+            hddm.utils.reg_values(data, predictor), predictor.loc[data.index].values
+        )
+        self.assertRaises(
+            KeyError, hddm.utils.reg_values, data.set_axis(index[:30] + 1), predictor
+        )
+
+    def test_rl_blocks(self):
+        split_by = np.random.permutation(np.repeat(np.arange(5), 40))
+        response = np.random.randint(0, 2, split_by.shape[0])
+        feedback = np.random.randint(0, 2, split_by.shape[0]).astype(float)
+        x = (0.3 + rand(split_by.shape[0])) * (2 * response - 1)
+        args = (0.5, -0.3, 0.4, 2.0, 0, 2.0, 0.5, 0, 0.2, 0, 1e-4)
+
+        order, offsets = hddm.wfpt.rl_blocks(split_by)
+        np.testing.assert_array_equal(offsets, np.arange(0, 201, 40))
+        for j in range(5):
+            block = order[offsets[j] : offsets[j + 1]]
+            self.assertTrue((split_by[block] == j).all())
+            self.assertTrue((np.diff(block) > 0).all())
+
+        # the likelihood does not depend on how the blocks are interleaved
+        sorted_args = (x[order], response[order], feedback[order], split_by[order])
+        logp = hddm.wfpt.wiener_like_rlddm(*sorted_args + args)
+        self.assertAlmostEqual(
+            hddm.wfpt.wiener_like_rlddm(x, response, feedback, split_by, *args), logp
+        )
+        self.assertAlmostEqual(
+            hddm.wfpt.wiener_like_rlddm(
+                x, response, feedback, split_by, *args, order=order, offsets=offsets
+            ),
+            logp,
+        )
+        self.assertAlmostEqual(
+            hddm.wfpt.wiener_like_rl(
+                response, feedback, split_by, 0.5, -0.3, 0.4, 2.0, 0.5
+            ),
+            hddm.wfpt.wiener_like_rl(*sorted_args[1:] + (0.5, -0.3, 0.4, 2.0, 0.5)),
+        )
+
+    def test_rl_learning_rate_limits(self):
+        split_by = np.repeat(np.arange(2), 20)
+        response = np.random.randint(0, 2, split_by.shape[0])
+        feedback = np.random.randint(0, 2, split_by.shape[0]).astype(float)
+
+        # alpha -> +inf learns the last feedback, alpha -> -inf does not learn
+        for alpha, limit in ((800.0, 40.0), (-800.0, -40.0)):
+            self.assertAlmostEqual(
+                hddm.wfpt.wiener_like_rl(
+                    response, feedback, split_by, 0.5, alpha, alpha, 2.0, 0.5
+                ),
+                hddm.wfpt.wiener_like_rl(
+                    response, feedback, split_by, 0.5, limit, limit, 2.0, 0.5
+                ),
+            )
+
+    def test_wiener_like_rlssm_nn(self):
+        class Network:
+            def predict_on_batch(self, x):
+                return np.tanh(x[:, :1] * x[:, -2:-1]) - x[:, 1:2] - 1
+
+        split_by = np.random.permutation(np.repeat(np.arange(4), 25))
+        response = 2 * np.random.randint(0, 2, split_by.shape[0]) - 1
+        feedback = np.random.randint(0, 2, split_by.shape[0]).astype(float)
+        rt = 0.3 + rand(split_by.shape[0])
+        params_ssm = np.array([2.0, 1.0, 0.5, 0.2])
+        params_bnds = np.array([[-3.0, 0.3, 0.1, 1e-3, 0.0], [3.0, 2.5, 0.9, 2.0, 1.0]])
+        data = np.column_stack(
+            [np.tile(params_ssm, (rt.shape[0], 1)), rt, response]
+        ).astype(np.float32)
+        rl_arr = np.full((rt.shape[0], 1), -0.3, dtype=np.float32)
+
+        # every trial keeps its own row when the blocks are interleaved
+        order, _ = hddm.wfpt.rl_blocks(split_by)
+        args = (rt, response, feedback, split_by, 0.5)
+        sorted_args = tuple(arg[order] for arg in args[:4]) + (0.5,)
+        kwargs = dict(params_bnds=params_bnds, p_outlier=0.05, network=Network())
+        logp = hddm.wfpt.wiener_like_rlssm_nn(
+            "ddm", *sorted_args, params_ssm, np.array([-0.3]), **kwargs
+        )
+        self.assertAlmostEqual(
+            hddm.wfpt.wiener_like_rlssm_nn(
+                "ddm", *args, params_ssm, np.array([-0.3]), **kwargs
+            ),
+            logp,
+            places=3,
+        )
+        self.assertAlmostEqual(
+            hddm.wfpt.wiener_like_rlssm_nn_reg(data, rl_arr, *args, **kwargs),
+            logp,
+            places=3,
+        )
+
+    def test_rl_q_values(self):
+        split_by = np.random.permutation(np.repeat(np.arange(3), 30))
+        response = np.random.randint(0, 4, split_by.shape[0])
+        feedback = np.random.randint(0, 2, split_by.shape[0]).astype(float)
+        alpha, decay = 1 / (1 + np.exp(-np.array([0.2, -1.0])))
+
+        q_values = hddm.wfpt.rl_q_values(
+            response, feedback, split_by, 0.5, 4, "rw_decay", np.array([0.2, -1.0])
+        )
+        for s in range(3):
+            qs = np.full(4, 0.5)
+            for i in np.flatnonzero(split_by == s):
+                np.testing.assert_allclose(q_values[i], qs)
+                unchosen = np.arange(4) != response[i]
+                qs[response[i]] += alpha * (feedback[i] - qs[response[i]])
+                qs[unchosen] += decay * (0.5 - qs[unchosen])
+
+        self.assertRaises(
+            ValueError,
+            hddm.wfpt.rl_q_values,
+            response,
+            feedback,
+            split_by,
+            0.5,
+            3,
+            "rw",
+            np.array([0.2]),
+        )
+
+    def test_wiener_like_multi_rlddm(self):
+        split_by = np.repeat(np.arange(4), 25)
+        response = np.random.randint(0, 2, split_by.shape[0])
+        feedback = np.random.randint(0, 2, split_by.shape[0]).astype(float)
+        x = (0.3 + rand(split_by.shape[0])) * (2 * response - 1)
+        params = dict(v=2.0, sv=0, a=2.0, z=0.5, sz=0, t=0.2, st=0, alpha=-0.3)
+
+        logp = hddm.wfpt.wiener_like_multi_rlddm(
+            x, response, feedback, split_by, 0.5, err=1e-4, **params
+        )
+        self.assertTrue(np.isfinite(logp))
+        # per-trial parameters with the same values give the same result
+        for param in ("v", "alpha"):
+            params_trial = dict(params)
+            params_trial[param] = np.full(x.shape[0], params[param])
+            self.assertAlmostEqual(
+                hddm.wfpt.wiener_like_multi_rlddm(
+                    x, response, feedback, split_by, 0.5, err=1e-4, **params_trial
+                ),
+                logp,
+            )
+
     def test_pdf_sv(self, samples=50):
         """Test if our wfpt pdf_sv implementation produces the same value as numerical integration over v"""
         func = lambda v_i, value, err, v, sv, z, a: hddm.wfpt.full_pdf(
@@ -154,6 +578,76 @@ class TestWfpt(unittest.TestCase):
 
 
 class TestWfptFull(unittest.TestCase):
+    def test_gauss_legendre(self):
+        np.random.seed(123)
+        for i in range(20):
+            sv = rand() * 0.4 + 0.1
+            v = (rand() - 0.5) * 4
+            st = rand() * 0.3
+            t = rand() * 0.5 + (st / 2)
+            a = 1.5 + rand()
+            rt = (rand() * 4 + t + st) * np.sign(rand() - 0.5)
+            sz = rand() * 0.3
+            z = 0.5 * rand() + sz / 2
+
+            gl_res = hddm.wfpt.full_pdf(
+                rt, v, sv, a, z, sz, t, st, 1e-9, n_st=12, n_sz=12, use_adaptive=2
+            )
+            res = hddm.wfpt.full_pdf(
+                rt,
+                v,
+                sv,
+                a,
+                z,
+                sz,
+                t,
+                st,
+                1e-9,
+                n_st=20,
+                n_sz=20,
+                use_adaptive=1,
+                simps_err=1e-10,
+            )
+            np.testing.assert_almost_equal(gl_res, res, 6)
+
+    def test_st_closed_form(self):
+        # without sv, the integral over st is computed from the cdf
+        np.random.seed(123)
+        cases = []
+        for i in range(20):
+            v = (rand() - 0.5) * 4
+            st = rand() * 0.3 + 0.01
+            t = rand() * 0.5 + (st / 2)
+            a = 1.5 + rand()
+            rt = (rand() * 4 + t) * np.sign(rand() - 0.5)
+            z = 0.3 + 0.4 * rand()
+            cases.append((rt, v, a, z, t, st))
+        # long RTs in the tail, where the density is far below the rounding error of the cdf
+        for rt in (5.0, -5.0, 12.0):
+            cases.append((rt, 1, 0.8, 0.5, 0.3, 0.2))
+
+        for rt, v, a, z, t, st in cases:
+            my_res = hddm.wfpt.full_pdf(rt, v, 0, a, z, 0, t, st, 1e-8)
+            res = (
+                quad(
+                    lambda t_i: hddm.wfpt.full_pdf(rt, v, 0, a, z, 0, t_i, 0, 1e-12),
+                    t - st / 2.0,
+                    t + st / 2.0,
+                    epsabs=0,
+                    epsrel=1e-12,
+                )[0]
+                / st
+            )
+            np.testing.assert_allclose(my_res, res, rtol=1e-7)
+
+        self.assertAlmostEqual(
+            hddm.wfpt.wiener_like(
+                np.array([0.6, 0.8, 1.0, 5.0]), 1, 0, 0.8, 0.5, 0, 0.3, 0.2, 1e-8
+            ),
+            -42.50208861,
+            6,
+        )
+
     def test_adaptive(self):
         for i in range(20):
             sv = rand() * 0.4 + 0.1
@@ -54,6 +54,140 @@ class NetworkInspectorTest(unittest.TestCase):
             print(torch_model.predict_on_batch(tmp_data).shape)
             pass
 
+    def test_numpy_backend_parity(self):
+        for model in self.models:
+            torch_model = hddm.torch.mlp_inference_numpy.load_mlp(
+                model=model, backend="torch"
+            )
+            numpy_model = hddm.torch.mlp_inference_numpy.load_mlp(
+                model=model, backend="numpy"
+            )
+
+            theta = np.array(
+                hddm.model_config.model_config[model]["params_default"],
+                dtype=np.float32,
+            )
+            rts = np.arange(self.rt_range[0], self.rt_range[1], 0.1)
+            choices = np.resize(
+                hddm.model_config.model_config[model]["choices"], rts.shape[0]
+            )
+            trials = np.column_stack([rts, choices]).astype(np.float32)
+            data = np.column_stack(
+                [np.tile(theta, (trials.shape[0], 1)), trials]
+            ).astype(np.float32)
+
+            np.testing.assert_allclose(
+                numpy_model.predict_on_batch(data),
+                torch_model.predict_on_batch(data),
+                rtol=1e-4,
+                atol=1e-4,
+            )
+            np.testing.assert_allclose(
+                numpy_model.predict_on_batch_factorized(theta, trials),
+                torch_model.predict_on_batch(data),
+                rtol=1e-4,
+                atol=1e-4,
+            )
+
+    def test_torchscript_backend_parity(self):
+        for model in self.models:
+            torch_model = hddm.torch.mlp_inference_numpy.load_mlp(
+                model=model, backend="torch"
+            )
+            compiled_model = hddm.torch.mlp_inference_numpy.load_mlp(
+                model=model, backend="torchscript"
+            )
+
+            theta = np.array(
+                hddm.model_config.model_config[model]["params_default"],
+                dtype=np.float32,
+            )
+            trials = np.column_stack(
+                [
+                    np.arange(self.rt_range[0], self.rt_range[1], 0.1),
+                    np.ones(int((self.rt_range[1] - self.rt_range[0]) / 0.1)),
+                ]
+            ).astype(np.float32)
+            data = np.column_stack(
+                [np.tile(theta, (trials.shape[0], 1)), trials]
+            ).astype(np.float32)
+
+            np.testing.assert_allclose(
+                compiled_model.predict_on_batch(data),
+                torch_model.predict_on_batch(data),
+                rtol=1e-4,
+                atol=1e-4,
+            )
+            np.testing.assert_allclose(
+                compiled_model.predict_on_batch_factorized(theta, trials),
+                torch_model.predict_on_batch(data),
+                rtol=1e-4,
+                atol=1e-4,
+            )
+
+            # read from the cache, without the state dict
+            cached_model = hddm.torch.mlp_inference_numpy.load_mlp(
+                model=model, backend="torchscript"
+            )
+            np.testing.assert_allclose(
+                cached_model.predict_on_batch_factorized(theta, trials),
+                torch_model.predict_on_batch(data),
+                rtol=1e-4,
+                atol=1e-4,
+            )
+
+    def test_quantized_inference(self):
+        torch_model = hddm.torch.mlp_inference_numpy.load_mlp(model="ddm")
+        theta = np.array(
+            hddm.model_config.model_config["ddm"]["params_default"], dtype=np.float32
+        )
+        rts = np.arange(0.3, 5, 0.01)
+        trials = np.column_stack([rts, np.resize([-1, 1], rts.shape[0])]).astype(
+            np.float32
+        )
+        data = np.column_stack([np.tile(theta, (trials.shape[0], 1)), trials]).astype(
+            np.float32
+        )
+
+        for quantize in ("int8", "bfloat16"):
+            quantized_model = hddm.torch.mlp_inference_numpy.load_mlp(
+                model="ddm", quantize=quantize
+            )
+            np.testing.assert_allclose(
+                np.exp(quantized_model.predict_on_batch(data)),
+                np.exp(torch_model.predict_on_batch(data)),
+                atol=0.05,
+            )
+            np.testing.assert_allclose(
+                np.exp(quantized_model.predict_on_batch_factorized(theta, trials)),
+                np.exp(torch_model.predict_on_batch(data)),
+                atol=0.05,
+            )
+
+    def test_get_mlp_shared(self):
+        network = hddm.torch.mlp_inference_numpy.get_mlp(model="ddm", backend="numpy")
+        self.assertIs(
+            network,
+            hddm.torch.mlp_inference_numpy.get_mlp(model="ddm", backend="numpy"),
+        )
+        self.assertTrue(hddm.torch.mlp_inference_numpy.is_shared_mlp(network))
+        self.assertFalse(
+            hddm.torch.mlp_inference_numpy.is_shared_mlp(
+                hddm.torch.mlp_inference_numpy.load_mlp(model="ddm", backend="numpy")
+            )
+        )
+        # registered torch networks are loaded before any worker is forked
+        network = hddm.torch.mlp_inference_numpy.get_mlp(model="ddm")
+        self.assertIsNotNone(network._net)
+
+    def test_load_torch_mlp_threads(self):
+        import torch
+
+        n_threads = torch.get_num_threads()
+        hddm.network_inspectors.load_torch_mlp(model="ddm", n_threads=1)
+        self.assertEqual(torch.get_num_threads(), 1)
+        torch.set_num_threads(n_threads)
+
 
 if __name__ == "__main__":
     unittest.main()
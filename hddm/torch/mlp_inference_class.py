@@ -1,44 +1,251 @@
 try:
+    import os
+    import multiprocessing
     import torch
     from .torch_config import TorchConfig
     from .mlp_model_class import TorchMLP
     import hddm
 
+    def set_torch_threads(n_threads=None):
+        """Set the number of threads torch uses on the CPU.
+
+        torch parallelizes every forward pass over all cores by default. With several
+        chains in parallel processes, this oversubscribes the cores, so inside
+        multiprocessing workers a single thread per process is used unless
+        n_threads is given.
+
+        :Arguments:
+            n_threads: int <default=None>
+                Number of intra-op threads. None keeps the torch default in the main
+                process and uses 1 thread in multiprocessing workers.
+        """
+        if n_threads is None:
+            if multiprocessing.parent_process() is None:
+                return
+            n_threads = 1
+        torch.set_num_threads(n_threads)
+        try:
+            torch.set_num_interop_threads(n_threads)
+        except RuntimeError:
+            # can only be set before the first parallel work of the process
+            pass
+
+    def compiled_model_path(model_file_path=None, quantize=None):
+        """Path of the TorchScript version of the network in model_file_path.
+
+        The compiled networks are cached next to the state dicts in hddm/torch_models,
+        or in ~/.cache/hddm/torch_models if the package folder is not writable.
+        """
+        folder, file_name = os.path.split(model_file_path)
+        if not os.access(folder, os.W_OK):
+            folder = os.path.join(os.path.expanduser("~"), ".cache", "hddm", "torch_models")
+            os.makedirs(folder, exist_ok=True)
+        if quantize is not None:
+            file_name = file_name.replace(".pt", "_" + quantize + ".pt")
+        return os.path.join(
+            folder,
+            file_name.replace(".pt", "") + "_torchscript_" + torch.__version__ + ".pt",
+        )
+
+    def compile_torch_mlp(
+        net=None,
+        input_dim=None,
+        file_path=None,
+        dev=None,
+        dtype=torch.float32,
+        first_weight=None,
+        first_bias=None,
+    ):
+        """Trace net (a TorchMLP in eval mode) into a frozen TorchScript module.
+
+        Freezing inlines the weights as constants, which lets the JIT fuse the linear
+        layers with their activations. The module keeps forward() and forward_hidden(),
+        and the float32 weight and bias of the first layer as first_weight and
+        first_bias. If file_path is given, the module is saved there. dev and dtype
+        are the device and type of the inputs.
+        """
+        net.register_buffer("first_weight", first_weight)
+        net.register_buffer("first_bias", first_bias)
+        hidden_dim = net.network_config["layer_sizes"][0]
+        traced = torch.jit.trace_module(
+            net,
+            {
+                "forward": torch.zeros((2, input_dim), device=dev, dtype=dtype),
+                "forward_hidden": torch.zeros((2, hidden_dim), device=dev, dtype=dtype),
+            },
+        )
+        compiled = torch.jit.freeze(
+            traced, preserved_attrs=["forward_hidden", "first_weight", "first_bias"]
+        )
+        if file_path is not None:
+            # write to a temporary file first, other processes may be loading it
+            tmp_path = file_path + "." + str(os.getpid())
+            torch.jit.save(compiled, tmp_path)
+            os.replace(tmp_path, file_path)
+        return compiled
+
     class LoadTorchMLPInfer:
-        def __init__(self, model_file_path=None, network_config=None, input_dim=None):
+        """Inference for the LANs of hddm.torch.mlp_model_class.TorchMLP.
+
+        The network is loaded when it is first evaluated or load() is called. With
+        compiled=True the TorchScript version of the network (see compile_torch_mlp) is
+        used, which is compiled when it is loaded and then read from the cache.
+
+        quantize='int8' evaluates the linear layers with dynamically quantized int8
+        weights, quantize='bfloat16' evaluates the network in bfloat16 (both on the
+        CPU). This is faster at the price of a small error in the log-likelihoods,
+        which can be checked with hddm.network_inspectors.kde_vs_lan_likelihoods().
+        """
+
+        quantize_options = (None, "int8", "bfloat16")
+
+        def __init__(
+            self,
+            model_file_path=None,
+            network_config=None,
+            input_dim=None,
+            n_threads=None,
+            compiled=False,
+            quantize=None,
+        ):
+            if quantize not in self.quantize_options:
+                raise ValueError("Unknown quantize option: " + str(quantize))
             torch.backends.cudnn.benchmark = True
             self.dev = (
                 torch.device("cuda")
-                if torch.cuda.is_available()
+                if torch.cuda.is_available() and quantize is None
                 else torch.device("cpu")
             )
+            self.quantize = quantize
+            self.dtype = torch.bfloat16 if quantize == "bfloat16" else torch.float32
             self.model_file_path = model_file_path
             self.network_config = network_config
             self.input_dim = input_dim
+            self.n_threads = n_threads
+            self.compiled = compiled
+            self._configure_threads()
+            self._net = None
 
-            self.net = TorchMLP(
-                network_config=self.network_config,
-                input_shape=self.input_dim,
-                generative_model_id=None,
-            )
-            self.net.load_state_dict(
-                torch.load(self.model_file_path, map_location=self.dev)
-            )
-            self.net.to(self.dev)
-            # AF Q: IS THIS REDUNDANT NOW?
+        @property
+        def net(self):
+            self.load()
+            return self._net
+
+        def load(self):
+            """Load the network now instead of on first use."""
+            if self._net is None:
+                self._load()
+
+        def _load(self):
+            net = None
+            if self.compiled:
+                compiled_path = compiled_model_path(
+                    self.model_file_path, quantize=self.quantize
+                )
+                if os.path.isfile(compiled_path) and os.path.getmtime(
+                    compiled_path
+                ) >= os.path.getmtime(self.model_file_path):
+                    net = torch.jit.load(compiled_path, map_location=self.dev)
+                    if hasattr(net, "first_weight"):
+                        first_weight = net.first_weight
+                        first_bias = net.first_bias
+                    else:  # cached before the first layer was stored with it
+                        net = None
+            if net is None:
+                state_dict = torch.load(self.model_file_path, map_location=self.dev)
+                first_weight = state_dict["layers.0.weight"]
+                first_bias = state_dict["layers.0.bias"]
+                net = TorchMLP(
+                    network_config=self.network_config,
+                    input_shape=self.input_dim,
+                    generative_model_id=None,
+                )
+                net.load_state_dict(state_dict)
+                net.to(self.dev)
+                net.eval()
+                net.requires_grad_(False)
+                if self.quantize == "int8":
+                    net = torch.quantization.quantize_dynamic(
+                        net, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                elif self.quantize == "bfloat16":
+                    net.to(torch.bfloat16)
+                if self.compiled:
+                    net = compile_torch_mlp(
+                        net=net,
+                        input_dim=self.input_dim,
+                        file_path=compiled_path,
+                        dev=self.dev,
+                        dtype=self.dtype,
+                        first_weight=first_weight,
+                        first_bias=first_bias,
+                    )
+
+            # The first layer splits into the columns acting on the model parameters
+            # and the columns acting on (rt, response).
+            n_params = self.input_dim - 2
+            self.first_weight_params = first_weight[:, :n_params]
+            self.first_weight_trials_t = first_weight[:, n_params:].t()
+            self.first_bias = first_bias
+            self._net = net
+
+        def __getstate__(self):
+            # TorchScript modules can not be pickled, the network is reloaded on first use
+            d = self.__dict__.copy()
+            d["_net"] = None
+            for key in ("first_weight_params", "first_weight_trials_t", "first_bias"):
+                d.pop(key, None)
+            return d
 
-            self.net.eval()
+        def _configure_threads(self):
+            set_torch_threads(self.n_threads)
+            self.pid = os.getpid()
+
+        def set_threads(self, n_threads=None):
+            self.n_threads = n_threads
+            self._configure_threads()
 
         @torch.no_grad()
         def predict_on_batch(self, x=None):
-            return self.net(torch.from_numpy(x).to(self.dev)).cpu().numpy()
+            if self.pid != os.getpid():  # copied into a worker process
+                self._configure_threads()
+            out = self.net(torch.from_numpy(x).to(self.dev, self.dtype))
+            return out.float().cpu().numpy()
+
+        @torch.no_grad()
+        def predict_on_batch_factorized(self, params=None, trials=None):
+            """Forward pass for the rows (params, trials[i]), i.e. for one parameter
+            vector shared by all trials. The parameter part of the first layer,
+            W_params @ params + b, is computed once instead of once per trial.
+
+            :Arguments:
+                params: np.ndarray (float32)
+                    Model parameters of shape (input_dim - 2,).
+                trials: np.ndarray (float32)
+                    rt and response of every trial, shape (n_trials, 2).
+            """
+            if self.pid != os.getpid():
+                self._configure_threads()
+            net = self.net
+            offset = torch.addmv(
+                self.first_bias,
+                self.first_weight_params,
+                torch.from_numpy(params).to(self.dev),
+            )
+            x = torch.addmm(
+                offset, torch.from_numpy(trials).to(self.dev), self.first_weight_trials_t
+            )
+            return net.forward_hidden(x.to(self.dtype)).float().cpu().numpy()
 
-    def load_torch_mlp(model=None):
+    def load_torch_mlp(model=None, n_threads=None, compiled=False, quantize=None):
         cfg = TorchConfig(model=model)
         infer_model = LoadTorchMLPInfer(
             model_file_path=cfg.network_path,
             network_config=cfg.network_config,
             input_dim=len(hddm.model_config.model_config[model]["params"]) + 2,
+            n_threads=n_threads,
+            compiled=compiled,
+            quantize=quantize,
         )
 
         return infer_model
@@ -0,0 +1,226 @@
+import pickle
+import zipfile
+
+import numpy as np
+
+import hddm
+from .torch_config import TorchConfig
+
+
+class _TorchStorage(object):
+    """Stands in for the torch storage classes referenced by a state dict."""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+
+
+class _StateDictUnpickler(pickle.Unpickler):
+    """Reads the tensors of a torch state dict file (zip format) as numpy arrays."""
+
+    storage_dtypes = {
+        "FloatStorage": np.float32,
+        "DoubleStorage": np.float64,
+        "HalfStorage": np.float16,
+        "LongStorage": np.int64,
+        "IntStorage": np.int32,
+    }
+
+    def __init__(self, archive, prefix, file):
+        super(_StateDictUnpickler, self).__init__(file)
+        self.archive = archive
+        self.prefix = prefix
+
+    def find_class(self, module, name):
+        if module == "torch._utils" and name == "_rebuild_tensor_v2":
+            return _rebuild_tensor
+        if module == "torch" and name in self.storage_dtypes:
+            return _TorchStorage(self.storage_dtypes[name])
+        if module == "collections" and name == "OrderedDict":
+            return super(_StateDictUnpickler, self).find_class(module, name)
+        raise pickle.UnpicklingError(
+            "Unsupported object in state dict: " + module + "." + name
+        )
+
+    def persistent_load(self, saved_id):
+        # ('storage', storage_type, key, location, numel)
+        storage_type, key = saved_id[1], saved_id[2]
+        data = self.archive.read(self.prefix + "data/" + key)
+        return np.frombuffer(data, dtype=np.dtype(storage_type.dtype).newbyteorder("<"))
+
+
+def _rebuild_tensor(storage, storage_offset, size, stride, *args):
+    itemsize = storage.dtype.itemsize
+    return np.lib.stride_tricks.as_strided(
+        storage[storage_offset:],
+        shape=tuple(size),
+        strides=tuple(s * itemsize for s in stride),
+    ).copy()
+
+
+def load_state_dict_numpy(file_path=None):
+    """Load a state dict saved with torch.save() as a dict of numpy arrays,
+    without importing torch.
+
+    :Arguments:
+        file_path: str
+            Path to the .pt file.
+    :Returns:
+        dict:
+            Maps the parameter names (e.g. 'layers.0.weight') to numpy arrays.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        pkl_name = [name for name in archive.namelist() if name.endswith("data.pkl")][0]
+        prefix = pkl_name[: -len("data.pkl")]
+        with archive.open(pkl_name) as f:
+            return dict(_StateDictUnpickler(archive, prefix, f).load())
+
+
+class LoadNumpyMLPInfer:
+    """Inference for the LANs of hddm.torch.mlp_model_class.TorchMLP in numpy.
+
+    Has the interface of LoadTorchMLPInfer, but evaluates the network with numpy
+    (BLAS) on the weights of the torch state dict. This avoids the tensor conversions
+    of torch for the small batches of a single node and does not require torch.
+    """
+
+    activations = {
+        "tanh": lambda x: np.tanh(x, out=x),
+        "relu": lambda x: np.maximum(x, 0, out=x),
+    }
+
+    def __init__(self, model_file_path=None, network_config=None, input_dim=None):
+        self.model_file_path = model_file_path
+        self.network_config = network_config
+        self.input_dim = input_dim
+
+        state_dict = load_state_dict_numpy(self.model_file_path)
+        layer_ids = sorted(
+            int(name.split(".")[1]) for name in state_dict if name.endswith(".weight")
+        )
+        # weights are stored transposed, so every layer is x @ W + b
+        self.weights = [
+            np.ascontiguousarray(state_dict["layers.%d.weight" % i].T, dtype=np.float32)
+            for i in layer_ids
+        ]
+        self.biases = [
+            state_dict["layers.%d.bias" % i].astype(np.float32) for i in layer_ids
+        ]
+        for array in self.weights + self.biases:
+            array.flags.writeable = False
+        # TorchMLP applies no activation after the last layer
+        self.layer_activations = [
+            self.activations[name]
+            for name in self.network_config["activations"][: len(self.weights) - 1]
+        ]
+
+        n_params = self.input_dim - 2
+        self.first_weight_params = self.weights[0][:n_params]
+        self.first_weight_trials = self.weights[0][n_params:]
+
+    def _forward(self, x):
+        for weight, bias, activation in zip(
+            self.weights[1:], self.biases[1:], self.layer_activations
+        ):
+            x = activation(x) @ weight
+            x += bias
+        return x
+
+    def predict_on_batch(self, x=None):
+        x = x @ self.weights[0]
+        x += self.biases[0]
+        return self._forward(x)
+
+    def predict_on_batch_factorized(self, params=None, trials=None):
+        """Forward pass for the rows (params, trials[i]) with the parameter part
+        of the first layer computed once (see LoadTorchMLPInfer)."""
+        x = trials @ self.first_weight_trials
+        x += params @ self.first_weight_params + self.biases[0]
+        return self._forward(x)
+
+
+def load_numpy_mlp(model=None):
+    cfg = TorchConfig(model=model)
+    infer_model = LoadNumpyMLPInfer(
+        model_file_path=cfg.network_path,
+        network_config=cfg.network_config,
+        input_dim=len(hddm.model_config.model_config[model]["params"]) + 2,
+    )
+
+    return infer_model
+
+
+def load_mlp(model=None, backend="torch", n_threads=None, quantize=None):
+    """Load the LAN for model.
+
+    :Arguments:
+        model: str
+            Model string as in hddm.model_config.model_config.
+        backend: str <default='torch'>
+            'torch' evaluates the network with pytorch (LoadTorchMLPInfer),
+            'numpy' with numpy (LoadNumpyMLPInfer), which does not need pytorch and is
+            faster for the small batches of single subjects,
+            'torchscript' with the compiled TorchScript version of the torch network.
+        n_threads: int <default=None>
+            Number of CPU threads of the torch backend (see set_torch_threads).
+            The numpy backend uses the threads of the BLAS library, which are set
+            with the OMP_NUM_THREADS environment variable.
+        quantize: str <default=None>
+            'int8' or 'bfloat16' to evaluate the torch backends in reduced precision
+            (see LoadTorchMLPInfer). Not available for the numpy backend.
+    """
+    if backend == "numpy":
+        if quantize is not None:
+            raise ValueError("The numpy backend does not support quantize")
+        return load_numpy_mlp(model=model)
+    elif backend in ("torch", "torchscript"):
+        from .mlp_inference_class import load_torch_mlp
+
+        return load_torch_mlp(
+            model=model,
+            n_threads=n_threads,
+            compiled=backend == "torchscript",
+            quantize=quantize,
+        )
+    raise ValueError("Unknown network backend: " + str(backend))
+
+
+_networks = {}
+
+
+def get_mlp(model=None, backend="torch", n_threads=None, quantize=None):
+    """Shared LAN for model from a process-wide registry.
+
+    The network is loaded with load_mlp() on the first call for (model, backend, quantize)
+    and the same instance is returned afterwards, so the weights are read from disk
+    once per process. Torch networks are loaded when they are registered, not on first
+    use (see LoadTorchMLPInfer), so networks registered before worker processes are
+    forked are shared with the workers. The returned network is used read-only by all
+    models.
+
+    :Arguments:
+        model: str
+            Model string as in hddm.model_config.model_config.
+        backend: str <default='torch'>
+            See load_mlp().
+        n_threads: int <default=None>
+            See load_mlp(). Applies to the shared network if given.
+        quantize: str <default=None>
+            See load_mlp().
+    """
+    key = (model, backend, quantize)
+    network = _networks.get(key)
+    if network is None:
+        network = _networks[key] = load_mlp(
+            model=model, backend=backend, n_threads=n_threads, quantize=quantize
+        )
+        if backend != "numpy":
+            network.load()
+    elif n_threads is not None and backend != "numpy":
+        network.set_threads(n_threads)
+    return network
+
+
+def is_shared_mlp(network=None):
+    """Whether network was returned by get_mlp(). Models do not pickle shared
+    networks but get them from the registry again when they are loaded."""
+    return any(network is shared for shared in _networks.values())
@@ -54,6 +54,12 @@ try:
                 x = self.layers[i](x)
             return self.layers[-1](x)
 
+        def forward_hidden(self, x):
+            """Forward pass starting after the first linear layer."""
+            for i in range(1, self.len_layers - 1):
+                x = self.layers[i](x)
+            return self.layers[-1](x)
+
 except:
     print(
         "Error loading pytorch capabilities. Neural network functionality cannot be used."
@@ -11,6 +11,10 @@ from kabuki.analyze import post_pred_gen, post_pred_compare_stats
 import pymc.progressbar as pbar
 import tqdm
 import warnings
+import weakref
+import functools
+import inspect
+import re
 
 from scipy.stats import scoreatpercentile
 from scipy.stats.mstats import mquantiles
@@ -20,470 +24,370 @@ from scipy.stats.mstats import mquantiles
 make_likelihood_fun_from_str = exec
 
 
-def make_likelihood_str_mlp_rlssm(
-    model,
-    config=None,
-    config_rl=None,
-    wiener_params=None,
-    fun_name="custom_likelihood",
-):
-    """Define string for a likelihood function for RLSSMs. This can be used as an mlp-likelihood
-    in the HDDMnnRL class. Also useful if you want to supply a custom LAN.
+def _likelihood_signature(data_arg, params, defaults, varkw=False):
+    """Signature of a likelihood closure. PyMC2 takes the parent names from it."""
+    kind = inspect.Parameter.POSITIONAL_OR_KEYWORD
+    parameters = [inspect.Parameter(name, kind) for name in [data_arg] + params]
+    parameters += [
+        inspect.Parameter(name, kind, default=default)
+        for name, default in defaults.items()
+    ]
+    if varkw:
+        parameters.append(inspect.Parameter("kwargs", inspect.Parameter.VAR_KEYWORD))
+    return inspect.Signature(parameters)
+
+
+def _bind_arguments(names, defaults, args, kwargs):
+    """Arguments of a call to a likelihood closure by name (PyMC2 passes the parents
+    as keyword arguments)."""
+    arguments = dict(defaults)
+    arguments.update(zip(names, args))
+    arguments.update(kwargs)
+    return arguments
+
+
+def rl_update_rule(config_rl):
+    """Name of the Q-learning update rule of a config of hddm.model_config_rl (see
+    hddm.wfpt.rl_update_rules). Configs without 'update_rule' use the Rescorla-Wagner
+    update, with a second (positive) learning rate if they have two parameters."""
+    if "update_rule" in config_rl:
+        return config_rl["update_rule"]
+    return "rw_dual" if len(config_rl["params"]) == 2 else "rw"
+
+
+def make_likelihood_mlp(config=None, wiener_params=None):
+    """Define a likelihood function that can be used as an mlp-likelihood in the
+    HDDMnn and HDDMnnStimCoding classes. Parameters outside the parameter bounds of
+    the network return -np.inf before the network input is filled in.
 
     :Arguments:
-        model : str
-            Name of the sequential sampling model used.
         config : dict <default = None>
-            Config dictionary for the sequential sampling model for which you would like to construct a custom
+            Config dictionary for the model for which you would like to construct a custom
             likelihood. In the style of what you find under hddm.model_config.
-        config_rl : dict <default = None>
-            Config dictionary for the reinforcement learning model for which you would like to construct a custom
-            likelihood. In the style of what you find under hddm.model_config_rl.
+        wiener_params : dict <default = None>
+            Holds the 'w_outlier' of the model.
     :Returns:
-        str:
-            A string that holds the code to define a likelihood function as needed by HDDM to pass
-            to PyMC2. (Serves as a wrapper around the LAN forward pass)
+        function:
+            The likelihood with arguments (x, *params, p_outlier, w_outlier, network).
 
     """
+    params = list(config["params"])
+    n_params = len(params)
+    bounds = list(zip(params, *config["param_bounds"]))
+    defaults = {
+        "p_outlier": 0.0,
+        "w_outlier": wiener_params["w_outlier"],
+        "network": None,
+    }
+    names = ["x"] + params
+    theta = np.empty(n_params, dtype=np.float32)
+
+    def likelihood(*args, **kwargs):
+        arguments = _bind_arguments(names, defaults, args, kwargs)
+        for i, (param, lower, upper) in enumerate(bounds):
+            value = arguments[param]
+            if not lower <= value <= upper:
+                return -np.inf
+            theta[i] = value
+
+        data, weights = lan_input_buffer(arguments["x"], n_params)
+        return hddm.wfpt.wiener_like_nn_mlp(
+            data[:, n_params],
+            data[:, n_params + 1],
+            theta,
+            p_outlier=arguments["p_outlier"],
+            w_outlier=arguments["w_outlier"],
+            network=arguments["network"],
+            weights=weights,
+            data=data,
+        )
 
-    param_bounds_lower = config["param_bounds"][0]
-    param_bounds_lower.extend(config_rl["param_bounds"][0])
-    param_bounds_upper = config["param_bounds"][1]
-    param_bounds_upper.extend(config_rl["param_bounds"][1])
-    param_bounds = [param_bounds_lower, param_bounds_upper]
-
-    params_str_ssm = ", ".join(config["params"])
-    params_str_rl = ", ".join(config_rl["params"])
-
-    t_params = deepcopy(config["params"])
-    t_params.extend(config_rl["params"])
-    all_params_str = ", ".join(t_params)
-
-    w_outlier_str = str(wiener_params["w_outlier"])
-
-    fun_str = (
-        "def "
-        + fun_name
-        + "(x, "
-        + all_params_str
-        + ", p_outlier=0.0, w_outlier="
-        + w_outlier_str
-        + ", network = None):\n    "
-        + "return hddm.wfpt.wiener_like_rlssm_nn('"
-        + model
-        + "', "
-        + 'x["rt"].values.astype(float), '
-        + 'x["response"].values.astype(int), '
-        + 'x["feedback"].values, '
-        + 'x["split_by"].values.astype(int), '
-        + 'x["q_init"].iloc[0], '
-        + "np.array(["
-        + params_str_ssm
-        + "]), "
-        + "np.array(["
-        + params_str_rl
-        + "]), "
-        + "params_bnds="
-        + "np.array("
-        + str(param_bounds)
-        + "), "
-        + "network=network, "
-        + "p_outlier=p_outlier, w_outlier=w_outlier)"
-    )
+    likelihood.__signature__ = _likelihood_signature("x", params, defaults)
+    return likelihood
 
-    return fun_str
 
+def make_likelihood_mlp_rlssm(model, config=None, config_rl=None, wiener_params=None):
+    """Define a likelihood function for RLSSMs that can be used as an mlp-likelihood in
+    the HDDMnnRL class. The trial columns are converted once per data object instead
+    of on every call.
 
-def make_reg_likelihood_str_mlp_basic_nn_rl(
-    model=None,
-    config=None,
-    config_rl=None,
-    wiener_params=None,
-    fun_name="custom_likelihood_reg",
-):
-    """Define string for a likelihood function that can be used as a
-    mlp-likelihood in the HDDMnnRLRegressor class. Useful if you want to supply a custom LAN.
+    Tasks with more than two options (models with one drift per option, e.g.
+    race_no_bias_4 with responses 0 .. 3) and the update rules of config_rl other
+    than the Rescorla-Wagner rules of hddm.wfpt.wiener_like_rlssm_nn are evaluated by
+    hddm.wfpt.wiener_like_rlssm_nn_options.
 
     :Arguments:
         model : str
             Name of the sequential sampling model used.
         config : dict <default = None>
-            Config dictionary for the sequential sampling model for which you would like to construct a custom
-            likelihood. In the style of what you find under hddm.model_config.
+            Config dictionary for the sequential sampling model. In the style of what you
+            find under hddm.model_config.
         config_rl : dict <default = None>
-            Config dictionary for the reinforcement learning model for which you would like to construct a custom
-            likelihood. In the style of what you find under hddm.model_config.
-
+            Config dictionary for the reinforcement learning model. In the style of what
+            you find under hddm.model_config_rl.
+        wiener_params : dict <default = None>
+            Holds the 'w_outlier' of the model.
     :Returns:
-        str:
-            A string that holds the code to define a likelihood function as needed by HDDM to pass
-            to PyMC2. (Serves as a wrapper around the LAN forward pass)
+        function:
+            The likelihood with arguments (x, *params, *params_rl, p_outlier, w_outlier, network).
 
     """
-    param_bounds_lower = config["param_bounds"][0]
-    param_bounds_lower.extend(config_rl["param_bounds"][0])
-    param_bounds_upper = config["param_bounds"][1]
-    param_bounds_upper.extend(config_rl["param_bounds"][1])
-    param_bounds = [param_bounds_lower, param_bounds_upper]
-
-    t_params = deepcopy(config["params"])
-    t_params.extend(config_rl["params"])
-    all_params_str = ", ".join(t_params)
-
-    w_outlier_str = str(wiener_params["w_outlier"])
-
-    # For regressors-
-    w_outlier_str = str(wiener_params["w_outlier"])
-    data_frame_width_str = str(len(config["params"]) + 2)
-
-    upper_bounds_ssm_str = str(config["param_bounds"][1])
-    lower_bounds_ssm_str = str(config["param_bounds"][0])
-    n_params_ssm_str = str(len(config["params"]))
-    params_ssm_str = str(config["params"])
-
-    n_params_rl_str = str(len(config_rl["params"]))
-    params_rl_str = str(config_rl["params"])
-
-    fun_str = (
-        "def "
-        + fun_name
-        + "(value, "
-        + all_params_str
-        + ", reg_outcomes, p_outlier=0, w_outlier="
-        + w_outlier_str
-        + ", **kwargs):"
-        + "\n    if 'v' in reg_outcomes:"
-        + "\n        print('hello world')"
-        + "\n        raise Exception('For RLSSM models, v cannot be the regression target.')"
-        + "\n    params = locals()"
-        + "\n    size = int(value.shape[0])"
-        + "\n    data = np.zeros(((size, "
-        + data_frame_width_str
-        + ")), dtype=np.float32)"
-        + "\n    data[:, "
-        + n_params_ssm_str
-        + ':] = np.stack([np.absolute(value["rt"]).astype(np.float32), value["response"].astype(np.float32)], axis=1)'
-        + "\n    cnt=0"
-        + "\n    for tmp_str in "
-        + params_ssm_str
-        + ":"
-        + "\n        if tmp_str in reg_outcomes:"
-        + '\n            data[:, cnt] = params[tmp_str].loc[value["rt"].index].values'
-        + "\n            if tmp_str != 'v' and ((data[:, cnt].min() < "
-        + lower_bounds_ssm_str
-        + "[cnt]) or (data[:, cnt].max() > "
-        + upper_bounds_ssm_str
-        + "[cnt])):"
-        + '\n                warnings.warn("Boundary violation of regressor part.")'
-        + "\n                return -np.inf"
-        + "\n        else:"
-        + "\n            data[:, cnt] = params[tmp_str]"
-        + "\n        cnt += 1"
-        # for rl part -
-        + "\n    rl_arr = np.zeros(((size, "
-        + n_params_rl_str
-        + ")), dtype=np.float32)"
-        + "\n    cnt=0"
-        + "\n    for tmp_str in "
-        + params_rl_str
-        + ":"
-        + "\n        if tmp_str in reg_outcomes:"
-        + '\n            rl_arr[:, cnt] = params[tmp_str].loc[value["rt"].index].values'
-        + "\n        else:"
-        + "\n            rl_arr[:, cnt] = params[tmp_str]"
-        + "\n        cnt += 1"
-        + "\n    return hddm.wfpt.wiener_like_rlssm_nn_reg(data, rl_arr,"
-        + 'value["rt"].values.astype(float), '
-        + 'value["response"].values.astype(int), '
-        + 'value["feedback"].values, '
-        + 'value["split_by"].values.astype(int), '
-        + 'value["q_init"].iloc[0], '
-        + "params_bnds="
-        + "np.array("
-        + str(param_bounds)
-        + "), "
-        + 'network=kwargs["network"], '
-        + "p_outlier=p_outlier, w_outlier=w_outlier)"
+    params_ssm = list(config["params"])
+    n_params_ssm = len(params_ssm)
+    params_rl = list(config_rl["params"])
+    update_rule = rl_update_rule(config_rl)
+    n_options = len(config.get("choices", (-1, 1)))
+    # one drift per option (v0, v1, ...) or a single drift scaled by the Q-value difference
+    q_difference = not all(
+        re.match(r"v\d+$", param) for param in params_ssm[:n_options]
     )
-
-    return fun_str
-
-
-# AF-COMMENT: Includes check for missing values
-# TODO: Train choice probability models to make this useful
-# at the moment it just makes sampling slower
-
-# def make_likelihood_str_mlp(
-#     config=None, wiener_params=None, fun_name="custom_likelihood"
-# ):
-#     """Define string for a likelihood function that can be used as an mlp-likelihood
-#     in the HDDMnn and HDDMnnStimCoding classes Useful if you want to supply a custom LAN.
-
-#     :Arguments:
-#         config : dict <default = None>
-#             Config dictionary for the model for which you would like to construct a custom
-#             likelihood. In the style of what you find under hddm.model_config.
-#     :Returns:
-#         str:
-#             A string that holds the code to define a likelihood function as needed by HDDM to pass
-#             to PyMC2. (Serves as a wrapper around the LAN forward pass)
-
-#     """
-#     params_str = ", ".join(config["params"])
-#     w_outlier_str = str(wiener_params["w_outlier"])
-
-#     fun_str = (
-#         "def "
-#         + fun_name
-#         + "(x, "
-#         + params_str
-#         + ", p_outlier=0.0, w_outlier="
-#         + w_outlier_str
-#         + ", network = None):"
-#         + '\n    if x["rt"].abs().max() < 998:'
-#         + '\n        return hddm.wfpt.wiener_like_nn_mlp(x["rt"].values, x["response"].values, '
-#         + "np.array([" + params_str + "], dtype = np.float32), "
-#         + "p_outlier=p_outlier, w_outlier=w_outlier, network=network)"
-#         + "\n    else:"
-#         + '\n        raise NotImplementedError("LAN based likelihoods can currently not deal with missing data")'
-#     )
-#     return fun_str
-
-
-def make_likelihood_str_mlp(
-    config=None, wiener_params=None, fun_name="custom_likelihood"
-):
-    """Define string for a likelihood function that can be used as an mlp-likelihood
-    in the HDDMnn and HDDMnnStimCoding classes Useful if you want to supply a custom LAN.
-
-    :Arguments:
-        config : dict <default = None>
-            Config dictionary for the model for which you would like to construct a custom
-            likelihood. In the style of what you find under hddm.model_config.
-    :Returns:
-        str:
-            A string that holds the code to define a likelihood function as needed by HDDM to pass
-            to PyMC2. (Serves as a wrapper around the LAN forward pass)
-
-    """
-    params_str = ", ".join(config["params"])
-    w_outlier_str = str(wiener_params["w_outlier"])
-
-    fun_str = (
-        "def "
-        + fun_name
-        + "(x, "
-        + params_str
-        + ", p_outlier=0.0, w_outlier="
-        + w_outlier_str
-        + ", network = None):"
-        + '\n    return hddm.wfpt.wiener_like_nn_mlp(x["rt"].values, x["response"].values, '
-        + "np.array(["
-        + params_str
-        + "], dtype = np.float32), "
-        + "p_outlier=p_outlier, w_outlier=w_outlier, network=network)"
+    options_engine = not q_difference or update_rule not in ("rw", "rw_dual")
+    params_bnds = np.array(
+        [
+            list(config["param_bounds"][i][: len(params_ssm)])
+            + list(config_rl["param_bounds"][i])
+            for i in range(2)
+        ]
     )
+    defaults = {
+        "p_outlier": 0.0,
+        "w_outlier": wiener_params["w_outlier"],
+        "network": None,
+    }
+    names = ["x"] + params_ssm + params_rl
+
+    def likelihood(*args, **kwargs):
+        arguments = _bind_arguments(names, defaults, args, kwargs)
+        x = arguments["x"]
+        (rt, feedback) = data_columns(x, ("rt", "feedback"))
+        (response, split_by) = data_columns(x, ("response", "split_by"), np.int_)
+        order, offsets = split_by_blocks(x)
+        data, _ = lan_input_buffer(x, n_params_ssm, unique=False)
+        if options_engine:
+            return hddm.wfpt.wiener_like_rlssm_nn_options(
+                rt,
+                response,
+                feedback,
+                split_by,
+                x["q_init"].iloc[0],
+                np.array([arguments[param] for param in params_ssm]),
+                np.array([arguments[param] for param in params_rl]),
+                params_bnds=params_bnds,
+                n_options=n_options,
+                update_rule=update_rule,
+                q_difference=q_difference,
+                network=arguments["network"],
+                p_outlier=arguments["p_outlier"],
+                w_outlier=arguments["w_outlier"],
+                order=order,
+                offsets=offsets,
+                data=data,
+            )
+        return hddm.wfpt.wiener_like_rlssm_nn(
+            model,
+            rt,
+            response,
+            feedback,
+            split_by,
+            x["q_init"].iloc[0],
+            np.array([arguments[param] for param in params_ssm]),
+            np.array([arguments[param] for param in params_rl]),
+            params_bnds=params_bnds,
+            network=arguments["network"],
+            p_outlier=arguments["p_outlier"],
+            w_outlier=arguments["w_outlier"],
+            order=order,
+            offsets=offsets,
+            data=data,
+        )
 
-    return fun_str
+    likelihood.__signature__ = _likelihood_signature(
+        "x", params_ssm + params_rl, defaults
+    )
+    return likelihood
 
 
-def make_likelihood_str_mlp_info(
-    config=None, wiener_params=None, fun_name="custom_likelihood"
+def make_reg_likelihood_mlp(
+    config=None, wiener_params=None, param_links=None, param_links_betas=None
 ):
-    """Define string for a likelihood function that can be used as an mlp-likelihood
-    in the HDDMnn and HDDMnnStimCoding classes Useful if you want to supply a custom LAN.
+    """Define a likelihood function that can be used as a mlp-likelihood in the
+    HDDMnnRegressor class. The links between parameters and indirect regressors and
+    betas are resolved when the likelihood is created and the network input is kept
+    per data object (see reg_input_buffer), so that a call only fills in the parameter
+    columns.
 
     :Arguments:
         config : dict <default = None>
             Config dictionary for the model for which you would like to construct a custom
             likelihood. In the style of what you find under hddm.model_config.
+        wiener_params : dict <default = None>
+            Holds the 'w_outlier' of the model.
+        param_links : dict <default = None>
+            Indirect regressors added to each parameter (see hddm.likelihoods_mlp).
+        param_links_betas : dict <default = None>
+            (beta, covariate) pairs added to each parameter (see hddm.likelihoods_mlp).
     :Returns:
-        str:
-            A string that holds the code to define a likelihood function as needed by HDDM to pass
-            to PyMC2. (Serves as a wrapper around the LAN forward pass)
+        function:
+            The likelihood with arguments (value, *params, *indirect regressors,
+            *indirect betas, reg_outcomes, p_outlier, w_outlier, **kwargs).
 
     """
-    params_str = ", ".join(config["params"])
-    w_outlier_str = str(wiener_params["w_outlier"])
-    upper_bounds_str = (
-        "np.array(" + str(config["param_bounds"][1]) + ", dtype = np.float32)"
-    )
-    lower_bounds_str = (
-        "np.array(" + str(config["param_bounds"][0]) + ", dtype = np.float32)"
+    params = list(config["params"])
+    n_params = len(params)
+    bounds = list(zip(params, *config["param_bounds"]))
+    param_links = param_links or {}
+    param_links_betas = param_links_betas or {}
+
+    extra_params = list(config.get("indirect_regressors", {}).keys())
+    extra_params += list(config.get("indirect_betas", {}).keys())
+    defaults = {"p_outlier": 0, "w_outlier": wiener_params["w_outlier"]}
+    names = ["value"] + params + extra_params + ["reg_outcomes"]
+
+    # per parameter: (column, name, lower, upper, indirect regressors, (beta, covariate) pairs)
+    columns = [
+        (
+            i,
+            param,
+            lower,
+            upper,
+            sorted(param_links.get(param, ())),
+            sorted(param_links_betas.get(param, ())),
+        )
+        for i, (param, lower, upper) in enumerate(bounds)
+    ]
+    covariates = sorted(
+        set(covariate for _, _, _, _, _, betas in columns for _, covariate in betas)
     )
 
-    fun_str = (
-        "def "
-        + fun_name
-        + "(x, "
-        + params_str
-        + ", p_outlier=0.0, w_outlier="
-        + w_outlier_str
-        + ", network = None):"
-        + '\n    return hddm.wfpt.wiener_like_nn_mlp_info(x["rt"].values, x["response"].values, '
-        + "np.array(["
-        + params_str
-        + "], dtype = np.float32), "
-        + "upper_bounds = "
-        + upper_bounds_str
-        + ", "
-        + "lower_bounds = "
-        + lower_bounds_str
-        + ", "
-        + "p_outlier=p_outlier, w_outlier=w_outlier, "
-        + "network=network)"
-    )
+    def likelihood(*args, **kwargs):
+        arguments = _bind_arguments(names, defaults, args, kwargs)
+        reg_outcomes = arguments["reg_outcomes"]
+        for param, lower, upper in bounds:
+            if param not in reg_outcomes and not lower <= arguments[param] <= upper:
+                return -np.inf
+
+        value = arguments["value"]
+        data = reg_input_buffer(value, n_params)
+        value_covariates = dict(
+            zip(covariates, data_columns(value, covariates, np.float32))
+        )
+        for i, param, lower, upper, regressors, betas in columns:
+            if param in reg_outcomes:
+                column = data[:, i]
+                column[:] = reg_values(value, arguments[param])
+                for regressor in regressors:
+                    column += reg_values(value, arguments[regressor])
+                for beta, covariate in betas:
+                    column += arguments[beta] * value_covariates[covariate]
+                if column.min() < lower or column.max() > upper:
+                    warnings.warn("Boundary violation of regressor part.")
+                    return -np.inf
+            else:
+                data[:, i] = arguments[param]
 
-    print(fun_str)
-    return fun_str
+        return hddm.wfpt.wiener_like_multi_nn_mlp(
+            data,
+            p_outlier=arguments["p_outlier"],
+            w_outlier=arguments["w_outlier"],
+            network=arguments["network"],
+        )
+
+    likelihood.__signature__ = _likelihood_signature(
+        "value", params + extra_params + ["reg_outcomes"], defaults, varkw=True
+    )
+    return likelihood
 
 
-def make_reg_likelihood_str_mlp(
-    config=None,
-    wiener_params=None,
-    param_links=None,
-    param_links_betas=None,
-    fun_name="custom_likelihood_reg",
+def make_reg_likelihood_mlp_nn_rl(
+    model=None, config=None, config_rl=None, wiener_params=None
 ):
-    """Define string for a likelihood function that can be used as a
-    mlp-likelihood in the HDDMnnRegressor class. Useful if you want to supply a custom LAN.
+    """Define a likelihood function that can be used as a mlp-likelihood in the
+    HDDMnnRLRegressor class. The bounds are prepared when the likelihood is created
+    and the trial columns are converted once per data object (see reg_input_buffer).
 
     :Arguments:
+        model : str
+            Name of the sequential sampling model used.
         config : dict <default = None>
-            Config dictionary for the model for which you would like to construct a custom
-            likelihood. In the style of what you find under hddm.model_config.
-
+            Config dictionary for the sequential sampling model. In the style of what you
+            find under hddm.model_config.
+        config_rl : dict <default = None>
+            Config dictionary for the reinforcement learning model. In the style of what
+            you find under hddm.model_config_rl.
+        wiener_params : dict <default = None>
+            Holds the 'w_outlier' of the model.
     :Returns:
-        str:
-            A string that holds the code to define a likelihood function as needed by HDDM to pass
-            to PyMC2. (Serves as a wrapper around the LAN forward pass)
+        function:
+            The likelihood with arguments (value, *params, *params_rl, reg_outcomes,
+            p_outlier, w_outlier, **kwargs).
 
     """
+    if len(config.get("choices", ())) > 2 or rl_update_rule(config_rl) == "rw_decay":
+        raise NotImplementedError(
+            "RLSSM regressions support two options and the Rescorla-Wagner updates only."
+        )
 
-    param_links_betas_str = str(param_links_betas)
-    param_links_str = str(param_links)
-    params_fun_def_str = ", ".join(config["params"])
-
-    if "indirect_regressors" in config:
-        for indirect_regressor in config["indirect_regressors"].keys():
-            params_fun_def_str += ", " + indirect_regressor
-
-    if "indirect_betas" in config:
-        for indirect_beta in config["indirect_betas"].keys():
-            params_fun_def_str += ", " + indirect_beta
-
-    w_outlier_str = str(wiener_params["w_outlier"])
-    upper_bounds_str = str(config["param_bounds"][1])
-    lower_bounds_str = str(config["param_bounds"][0])
-    n_params_str = str(len(config["params"]))
-    data_frame_width_str = str(len(config["params"]) + 2)
-    params_str = str(config["params"])
-
-    fun_str = (
-        "def "
-        + fun_name
-        + "(value, "
-        + params_fun_def_str
-        + ", reg_outcomes, p_outlier=0, w_outlier="
-        + w_outlier_str
-        + ", **kwargs):"
-        + "\n    params = locals()"
-        + "\n    size = int(value.shape[0])"
-        + "\n    data = np.zeros(((size, "
-        + data_frame_width_str
-        + ")), dtype=np.float32)"
-        + "\n    param_links = "  # indirect regressor part
-        + param_links_str  # indirect regressor part
-        + "\n    param_links_betas = "  # indirect betas part
-        + param_links_betas_str  # indirect betas part
-        + "\n    data[:, "
-        + n_params_str
-        + ':] = np.stack([np.absolute(value["rt"]).astype(np.float32), value["response"].astype(np.float32)], axis=1)'
-        + "\n    cnt=0"
-        + "\n    for tmp_str in "
-        + params_str
-        + ":"
-        + "\n        if tmp_str in reg_outcomes:"
-        + '\n            data[:, cnt] = params[tmp_str].loc[value["rt"].index].values'
-        + "\n            for linked_indirect_regressor in param_links[tmp_str]:"
-        + '\n                data[:, cnt] = data[:, cnt] + params[linked_indirect_regressor].loc[value["rt"].index].values'
-        + "\n            for linked_indirect_beta in param_links_betas[tmp_str]:"
-        + "\n                data[:, cnt] = data[:, cnt] + params[linked_indirect_beta[0]] * value[linked_indirect_beta[1]]"
-        + "\n            if (data[:, cnt].min() < "
-        + lower_bounds_str
-        + "[cnt]) or (data[:, cnt].max() > "
-        + upper_bounds_str
-        + "[cnt]):"
-        + '\n                warnings.warn("Boundary violation of regressor part.")'
-        + "\n                return -np.inf"
-        + "\n        else:"
-        + "\n            data[:, cnt] = params[tmp_str]"
-        + "\n        cnt += 1"
-        + '\n    return hddm.wfpt.wiener_like_multi_nn_mlp(data, p_outlier=p_outlier, w_outlier=w_outlier, network=kwargs["network"])'
+    params_ssm = list(config["params"])
+    params_rl = list(config_rl["params"])
+    n_params_ssm = len(params_ssm)
+    bounds_ssm = list(zip(params_ssm, *config["param_bounds"]))
+    params_bnds = np.array(
+        [
+            list(config["param_bounds"][i][:n_params_ssm])
+            + list(config_rl["param_bounds"][i])
+            for i in range(2)
+        ]
     )
-    return fun_str
-
-
-def make_reg_likelihood_str_mlp_basic(
-    config=None, wiener_params=None, fun_name="custom_likelihood_reg"
-):
-    """Define string for a likelihood function that can be used as a
-    mlp-likelihood in the HDDMnnRegressor class. Useful if you want to supply a custom LAN.
-
-    :Arguments:
-        config : dict <default = None>
-            Config dictionary for the model for which you would like to construct a custom
-            likelihood. In the style of what you find under hddm.model_config.
+    defaults = {"p_outlier": 0, "w_outlier": wiener_params["w_outlier"]}
+    names = ["value"] + params_ssm + params_rl + ["reg_outcomes"]
+
+    def likelihood(*args, **kwargs):
+        arguments = _bind_arguments(names, defaults, args, kwargs)
+        reg_outcomes = arguments["reg_outcomes"]
+        if "v" in reg_outcomes:
+            raise Exception("For RLSSM models, v cannot be the regression target.")
+
+        value = arguments["value"]
+        data = reg_input_buffer(value, n_params_ssm)
+        for i, (param, lower, upper) in enumerate(bounds_ssm):
+            if param in reg_outcomes:
+                data[:, i] = reg_values(value, arguments[param])
+                if data[:, i].min() < lower or data[:, i].max() > upper:
+                    warnings.warn("Boundary violation of regressor part.")
+                    return -np.inf
+            else:
+                data[:, i] = arguments[param]
 
-    :Returns:
-        str:
-            A string that holds the code to define a likelihood function as needed by HDDM to pass
-            to PyMC2. (Serves as a wrapper around the LAN forward pass)
+        rl_arr = np.empty((data.shape[0], len(params_rl)), dtype=np.float32)
+        for i, param in enumerate(params_rl):
+            if param in reg_outcomes:
+                rl_arr[:, i] = reg_values(value, arguments[param])
+            else:
+                rl_arr[:, i] = arguments[param]
+
+        (rt, feedback) = data_columns(value, ("rt", "feedback"))
+        (response, split_by) = data_columns(value, ("response", "split_by"), np.int_)
+        order, offsets = split_by_blocks(value)
+        return hddm.wfpt.wiener_like_rlssm_nn_reg(
+            data,
+            rl_arr,
+            rt,
+            response,
+            feedback,
+            split_by,
+            value["q_init"].iloc[0],
+            params_bnds=params_bnds,
+            network=arguments["network"],
+            p_outlier=arguments["p_outlier"],
+            w_outlier=arguments["w_outlier"],
+            order=order,
+            offsets=offsets,
+        )
 
-    """
-    params_fun_def_str = ", ".join(config["params"])
-    w_outlier_str = str(wiener_params["w_outlier"])
-    upper_bounds_str = str(config["param_bounds"][1])
-    lower_bounds_str = str(config["param_bounds"][0])
-    n_params_str = str(len(config["params"]))
-    data_frame_width_str = str(len(config["params"]) + 2)
-    params_str = str(config["params"])
-
-    fun_str = (
-        "def "
-        + fun_name
-        + "(value, "
-        + params_fun_def_str
-        + ", reg_outcomes, p_outlier=0, w_outlier="
-        + w_outlier_str
-        + ", **kwargs):"
-        + "\n    params = locals()"
-        + "\n    size = int(value.shape[0])"
-        + "\n    data = np.zeros(((size, "
-        + data_frame_width_str
-        + ")), dtype=np.float32)"
-        + "\n    data[:, "
-        + n_params_str
-        + ':] = np.stack([np.absolute(value["rt"]).astype(np.float32), value["response"].astype(np.float32)], axis=1)'
-        + "\n    cnt=0"
-        + "\n    for tmp_str in "
-        + params_str
-        + ":"
-        + "\n        if tmp_str in reg_outcomes:"
-        + '\n            data[:, cnt] = params[tmp_str].loc[value["rt"].index].values'
-        + "\n            if (data[:, cnt].min() < "
-        + lower_bounds_str
-        + "[cnt]) or (data[:, cnt].max() > "
-        + upper_bounds_str
-        + "[cnt]):"
-        + '\n                warnings.warn("Boundary violation of regressor part.")'
-        + "\n                return -np.inf"
-        + "\n        else:"
-        + "\n            data[:, cnt] = params[tmp_str]"
-        + "\n        cnt += 1"
-        + '\n    return hddm.wfpt.wiener_like_multi_nn_mlp(data, p_outlier=p_outlier, w_outlier=w_outlier, network=kwargs["network"])'
+    likelihood.__signature__ = _likelihood_signature(
+        "value", params_ssm + params_rl + ["reg_outcomes"], defaults, varkw=True
     )
-    return fun_str
+    return likelihood
 
 
 def flip_errors(data):
@@ -544,6 +448,309 @@ def flip_errors_nn(data):
     return data
 
 
+_unique_trials_cache = {}
+
+
+def unique_trials(data, columns=("rt",), weights_dtype=np.float64):
+    """Collapse the rows of data to its distinct values in columns.
+
+    Likelihoods only have to be evaluated once per distinct trial and can weight
+    each log-likelihood by how often the trial occurs. The result is cached per
+    data object (observed data are fixed during sampling), so data must not be
+    modified in place afterwards.
+
+    :Arguments:
+        data : pandas.DataFrame
+            Observed data of a node.
+        columns : tuple <default = ("rt",)>
+            Columns which together define a trial.
+        weights_dtype : numpy dtype <default = np.float64>
+            dtype of the returned counts.
+    :Returns:
+        tuple:
+            One array per column holding the distinct values and an array with the number of
+            occurrences of each of them. If all trials are distinct the original columns are
+            returned and the counts are None.
+
+    """
+    columns = tuple(columns)
+    key = (id(data), columns, np.dtype(weights_dtype).str)
+    if key in _unique_trials_cache:
+        return _unique_trials_cache[key]
+
+    values = [data[col].values for col in columns]
+    unique_rows, counts = np.unique(
+        np.column_stack(values), axis=0, return_counts=True
+    )
+    if unique_rows.shape[0] == values[0].shape[0]:
+        result = (tuple(values), None)
+    else:
+        result = (
+            tuple(
+                np.ascontiguousarray(unique_rows[:, i], dtype=value.dtype)
+                for i, value in enumerate(values)
+            ),
+            counts.astype(weights_dtype),
+        )
+
+    if _track_data(data, _unique_trials_cache, key):
+        _unique_trials_cache[key] = result
+    return result
+
+
+_lan_input_cache = {}
+
+
+def lan_input_buffer(data, n_params, unique=True):
+    """Persistent network input for the trials in data.
+
+    LAN forward passes take one float32 row (params, rt, response) per trial.
+    The rt and response columns are written once per data object and the
+    likelihoods only overwrite the parameter columns in place on every call
+    (see hddm.wfpt.wiener_like_nn_mlp), so no input is allocated per call.
+
+    :Arguments:
+        data : pandas.DataFrame
+            Observed data of a node with columns rt and response.
+        n_params : int
+            Number of model parameters in front of the rt and response columns.
+        unique : bool <default = True>
+            Hold one row per distinct trial (see unique_trials).
+    :Returns:
+        tuple:
+            The float32 buffer of shape (n_trials, n_params + 2) and the number of occurrences
+            of each row (None if every row is a single trial).
+
+    """
+    key = (id(data), n_params, unique)
+    if key in _lan_input_cache:
+        return _lan_input_cache[key]
+
+    if unique:
+        (rt, response), weights = unique_trials(data, ("rt", "response"), np.float32)
+    else:
+        rt, response, weights = data["rt"].values, data["response"].values, None
+    buffer = np.zeros((len(rt), n_params + 2), dtype=np.float32)
+    buffer[:, n_params] = rt
+    buffer[:, n_params + 1] = response
+
+    result = (buffer, weights)
+    if _track_data(data, _lan_input_cache, key):
+        _lan_input_cache[key] = result
+    return result
+
+
+_data_columns_cache = {}
+
+
+def data_columns(data, columns, dtype=np.float64):
+    """Columns of data as contiguous arrays of type dtype.
+
+    The arrays are converted once per data object and column selection, so
+    likelihoods can pass them to the cython functions on every call.
+
+    :Arguments:
+        data : pandas.DataFrame
+            Observed data of a node.
+        columns : tuple
+            Names of the columns.
+        dtype : numpy.dtype <default = np.float64>
+            Type of the returned arrays.
+    :Returns:
+        tuple:
+            One array per column.
+
+    """
+    key = (id(data), tuple(columns), np.dtype(dtype).str)
+    if key in _data_columns_cache:
+        return _data_columns_cache[key]
+
+    result = tuple(np.array(data[column].values, dtype=dtype) for column in columns)
+    if _track_data(data, _data_columns_cache, key):
+        _data_columns_cache[key] = result
+    return result
+
+
+_reg_input_cache = {}
+
+
+def reg_input_buffer(data, n_params):
+    """Persistent network input of the LAN regression likelihoods.
+
+    Like lan_input_buffer(), but with one row per trial and absolute rts, as the
+    regression likelihoods need trial-wise parameters.
+
+    :Arguments:
+        data : pandas.DataFrame
+            Observed data of a node with columns rt and response.
+        n_params : int
+            Number of model parameters in front of the rt and response columns.
+    :Returns:
+        numpy.ndarray:
+            The float32 buffer of shape (n_trials, n_params + 2).
+
+    """
+    key = (id(data), n_params)
+    if key in _reg_input_cache:
+        return _reg_input_cache[key]
+
+    buffer = np.zeros((data.shape[0], n_params + 2), dtype=np.float32)
+    buffer[:, n_params] = np.absolute(data["rt"].values)
+    buffer[:, n_params + 1] = data["response"].values
+
+    if _track_data(data, _reg_input_cache, key):
+        _reg_input_cache[key] = buffer
+    return buffer
+
+
+_reg_positions_cache = {}
+
+
+def reg_values(data, predictor):
+    """Values of a regression outcome at the trials of data.
+
+    Regression nodes return a pandas.Series over the trials of their own data,
+    which can include more trials than the observed node. Instead of aligning
+    the labels with .loc on every call, the positions of the trials of data in
+    the index of predictor are looked up once per data object and index
+    (hddm.models.hddm_regression.KnodeRegress returns the same index object on
+    every evaluation, unless the link function creates a new one).
+
+    :Arguments:
+        data : pandas.DataFrame
+            Observed data of a node.
+        predictor : pandas.Series
+            Output of the regression node.
+    :Returns:
+        numpy.ndarray:
+            The values of predictor in the trial order of data.
+
+    """
+    index = predictor.index
+    key = id(data)
+    entries = _reg_positions_cache.get(key)
+    for entry in entries or ():
+        if entry[0] is index:
+            positions = entry[1]
+            break
+    else:
+        for entry in entries or ():
+            if entry[0].equals(index):
+                positions = entry[1]
+                break
+        else:
+            if index.equals(data.index):
+                positions = None
+            else:
+                positions = index.get_indexer(data.index)
+                if (positions < 0).any():
+                    raise KeyError("Regression outcome is missing trials of the data.")
+            entry = [index, positions]
+            if entries is None and _track_data(data, _reg_positions_cache, key):
+                entries = _reg_positions_cache[key] = []
+            if entries is not None:
+                entries.append(entry)
+                # one entry per regression outcome of the node is enough
+                del entries[:-8]
+        # identity check hits on the next call
+        entry[0] = index
+
+    values = predictor.values
+    if positions is None:
+        return values
+    return values.take(positions)
+
+
+_split_by_blocks_cache = {}
+
+
+def split_by_blocks(data):
+    """Trial order and block offsets of the split_by column of data, as taken by the
+    RL likelihoods of hddm.wfpt (see hddm.wfpt.rl_blocks). They are computed once
+    per data object instead of grouping the trials on every call.
+
+    :Arguments:
+        data : pandas.DataFrame
+            Observed data of a node with a split_by column.
+    :Returns:
+        tuple:
+            The arrays order and offsets.
+
+    """
+    key = id(data)
+    if key in _split_by_blocks_cache:
+        return _split_by_blocks_cache[key]
+
+    (split_by,) = data_columns(data, ("split_by",), np.int_)
+    result = hddm.wfpt.rl_blocks(split_by)
+    if _track_data(data, _split_by_blocks_cache, key):
+        _split_by_blocks_cache[key] = result
+    return result
+
+
+def memoize_logp(logp):
+    """Remember the last log-likelihood logp returned for each observed data object.
+
+    PyMC2 re-evaluates the likelihood of an observed node whenever it is asked
+    for the model logp, although in hierarchical models most updates (e.g. of
+    group parameters or other subjects) leave the parents of the node unchanged.
+    The wrapped function returns the cached value if it is called with the same
+    data object and parent values as the last time for that data object.
+
+    The data object identifies the data version: PyMC2 assigns a new object when
+    the value of a node changes, so observed data must not be modified in place.
+
+    :Arguments:
+        logp : function
+            Likelihood taking the data as first argument and the parent values
+            as the remaining arguments.
+    :Returns:
+        function:
+            logp with the same signature, so it can be passed to stochastic_from_dist.
+
+    """
+    data_arg = next(iter(inspect.signature(logp).parameters))
+    last_call = {}
+
+    @functools.wraps(logp)
+    def memoized_logp(*args, **kwargs):
+        if args:
+            data, args = args[0], args[1:]
+        else:
+            kwargs = dict(kwargs)
+            data = kwargs.pop(data_arg)
+        params = (args, kwargs)
+
+        key = id(data)
+        if key in last_call:
+            last_params, last_logp = last_call[key]
+            try:
+                if last_params == params:
+                    return last_logp
+            except ValueError:  # array valued parents
+                pass
+        elif not _track_data(data, last_call, key):
+            return logp(data, *args, **kwargs)
+
+        value = logp(data, *args, **kwargs)
+        last_call[key] = (params, value)
+        return value
+
+    # stochastic_from_dist reads the parents from the signature
+    memoized_logp.__signature__ = inspect.signature(logp)
+    return memoized_logp
+
+
+def _track_data(data, cache, key):
+    """Drop cache[key] once data is garbage collected. Returns False if data
+    does not support weak references and should not be cached."""
+    try:
+        weakref.finalize(data, cache.pop, key, None)
+    except TypeError:
+        return False
+    return True
+
+
 def bin_rts_pointwise(data, max_rt=10.0, nbins=512):
     data = pd.DataFrame(data.copy())
     data["response_binned"] = data["response"].values.astype(np.int_)
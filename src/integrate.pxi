@@ -9,32 +9,55 @@ cimport cython
 
 include 'pdf.pxi'
 
+cdef inline double pdf_sz_node(double x, double v, double sv, double a, double z, double t, double st,
+                               ftt_terms terms, double err) noexcept nogil:
+    """Integrand of the integration over sz at start point z. If st > 0 (sv=0 only) the
+    density is averaged over the non-decision time window in closed form.
+    """
+    if st > 0:
+        return pdf_st(x, v, a, z, t, st, err)
+    return pdf_sv_terms(x - t, v, sv, a, z, terms)
+
 cdef double simpson_1D(double x, double v, double sv, double a, double z, double t, double err,
-                        double lb_z, double ub_z, int n_sz, double lb_t, double ub_t, int n_st) nogil:
+                        double lb_z, double ub_z, int n_sz, double lb_t, double ub_t, int n_st,
+                        double st) noexcept nogil:
     #assert ((n_sz&1)==0 and (n_st&1)==0), "n_st and n_sz have to be even"
     #assert ((ub_t-lb_t)*(ub_z-lb_z)==0 and (n_sz*n_st)==0), "the function is defined for 1D-integration only"
 
     cdef double ht, hz
+    cdef ftt_terms terms
     cdef int n = max(n_st, n_sz)
     if n_st==0: #integration over z
         hz = (ub_z-lb_z)/n
         ht = 0
         lb_t = t
         ub_t = t
+        # the normalized time is the same for all nodes, so the series terms are too
+        terms = ftt_01w_terms((x - t)/(a**2), err)
     else: #integration over t
         hz = 0
         ht = (ub_t-lb_t)/n
+        terms.small_t = 0 # unused, terms vary with t
+        terms.K = 0
         lb_z = z
         ub_z = z
 
-    cdef double S = pdf_sv(x - lb_t, v, sv, a, lb_z, err)
+    cdef double S
     cdef double z_tag, t_tag, y
     cdef int i
 
+    if n_st==0:
+        S = pdf_sz_node(x, v, sv, a, lb_z, t, st, terms, err)
+    else:
+        S = pdf_sv(x - lb_t, v, sv, a, lb_z, err)
+
     for i from 1 <= i <= n:
         z_tag = lb_z + hz * i
         t_tag = lb_t + ht * i
-        y = pdf_sv(x - t_tag, v, sv, a, z_tag, err)
+        if n_st==0:
+            y = pdf_sz_node(x, v, sv, a, z_tag, t, st, terms, err)
+        else:
+            y = pdf_sv(x - t_tag, v, sv, a, z_tag, err)
         if i&1: #check if i is odd
             S += (4 * y)
         else:
@@ -44,7 +67,7 @@ cdef double simpson_1D(double x, double v, double sv, double a, double z, double
 
     return ((ht+hz) * S / 3)
 
-cdef double simpson_2D(double x, double v, double sv, double a, double z, double t, double err, double lb_z, double ub_z, int n_sz, double lb_t, double ub_t, int n_st) nogil:
+cdef double simpson_2D(double x, double v, double sv, double a, double z, double t, double err, double lb_z, double ub_z, int n_sz, double lb_t, double ub_t, int n_st) noexcept nogil:
     #assert ((n_sz&1)==0 and (n_st&1)==0), "n_st and n_sz have to be even"
     #assert ((ub_t-lb_t)*(ub_z-lb_z)>0 and (n_sz*n_st)>0), "the function is defined for 2D-integration only, lb_t: %f, ub_t %f, lb_z %f, ub_z %f, n_sz: %d, n_st %d" % (lb_t, ub_t, lb_z, ub_z, n_sz, n_st)
 
@@ -55,11 +78,11 @@ cdef double simpson_2D(double x, double v, double sv, double a, double z, double
 
     ht = (ub_t-lb_t)/n_st
 
-    S = simpson_1D(x, v, sv, a, z, lb_t, err, lb_z, ub_z, n_sz, 0, 0, 0)
+    S = simpson_1D(x, v, sv, a, z, lb_t, err, lb_z, ub_z, n_sz, 0, 0, 0, 0)
 
     for i_t  from 1 <= i_t <= n_st:
         t_tag = lb_t + ht * i_t
-        y = simpson_1D(x, v, sv, a, z, t_tag, err, lb_z, ub_z, n_sz, 0, 0, 0)
+        y = simpson_1D(x, v, sv, a, z, t_tag, err, lb_z, ub_z, n_sz, 0, 0, 0, 0)
         if i_t&1: #check if i is odd
             S += (4 * y)
         else:
@@ -71,7 +94,8 @@ cdef double simpson_2D(double x, double v, double sv, double a, double z, double
 
 cdef double adaptiveSimpsonsAux(double x, double v, double sv, double a, double z, double t, double pdf_err,
                                  double lb_z, double ub_z, double lb_t, double ub_t, double ZT, double simps_err,
-                                 double S, double f_beg, double f_end, double f_mid, int bottom) nogil:
+                                 double S, double f_beg, double f_end, double f_mid, int bottom,
+                                 ftt_terms terms, double st) noexcept nogil:
 
     cdef double z_c, z_d, z_e, t_c, t_d, t_e, h
     cdef double fd, fe
@@ -96,8 +120,12 @@ cdef double adaptiveSimpsonsAux(double x, double v, double sv, double a, double
         z_d = z
         z_e = z
 
-    fd = pdf_sv(x - t_d, v, sv, a, z_d, pdf_err)/ZT
-    fe = pdf_sv(x - t_e, v, sv, a, z_e, pdf_err)/ZT
+    if (ub_t-lb_t) == 0: #integration over sz, terms are fixed by x - t
+        fd = pdf_sz_node(x, v, sv, a, z_d, t, st, terms, pdf_err)/ZT
+        fe = pdf_sz_node(x, v, sv, a, z_e, t, st, terms, pdf_err)/ZT
+    else:
+        fd = pdf_sv(x - t_d, v, sv, a, z_d, pdf_err)/ZT
+        fe = pdf_sv(x - t_e, v, sv, a, z_e, pdf_err)/ZT
 
     Sleft = (h/12)*(f_beg + 4*fd + f_mid)
     Sright = (h/12)*(f_mid + 4*fe + f_end)
@@ -106,22 +134,27 @@ cdef double adaptiveSimpsonsAux(double x, double v, double sv, double a, double
         return S2 + (S2 - S)/15
     return adaptiveSimpsonsAux(x, v, sv, a, z, t, pdf_err,
                                  lb_z, z_c, lb_t, t_c, ZT, simps_err/2,
-                                 Sleft, f_beg, f_mid, fd, bottom-1) + \
+                                 Sleft, f_beg, f_mid, fd, bottom-1, terms, st) + \
             adaptiveSimpsonsAux(x, v, sv, a, z, t, pdf_err,
                                  z_c, ub_z, t_c, ub_t, ZT, simps_err/2,
-                                 Sright, f_mid, f_end, fe, bottom-1)
+                                 Sright, f_mid, f_end, fe, bottom-1, terms, st)
 
 cdef double adaptiveSimpsons_1D(double x, double v, double sv, double a, double z, double t,
                               double pdf_err, double lb_z, double ub_z, double lb_t, double ub_t,
-                              double simps_err, int maxRecursionDepth) nogil:
+                              double simps_err, int maxRecursionDepth, double st) noexcept nogil:
 
     cdef double h
+    cdef ftt_terms terms
 
     if (ub_t - lb_t) == 0: #integration over z
         lb_t = t
         ub_t = t
         h = ub_z - lb_z
+        # the normalized time is the same for all nodes, so the series terms are too
+        terms = ftt_01w_terms((x - t)/(a**2), pdf_err)
     else: #integration over t
+        terms.small_t = 0 # unused, terms vary with t
+        terms.K = 0
         h = (ub_t-lb_t)
         lb_z = z
         ub_z = z
@@ -131,13 +164,18 @@ cdef double adaptiveSimpsons_1D(double x, double v, double sv, double a, double
     cdef double c_z = (lb_z + ub_z)/2.
 
     cdef double f_beg, f_end, f_mid, S
-    f_beg = pdf_sv(x - lb_t, v, sv, a, lb_z, pdf_err)/ZT
-    f_end = pdf_sv(x - ub_t, v, sv, a, ub_z, pdf_err)/ZT
-    f_mid = pdf_sv(x - c_t, v, sv, a, c_z, pdf_err)/ZT
+    if (ub_t - lb_t) == 0:
+        f_beg = pdf_sz_node(x, v, sv, a, lb_z, t, st, terms, pdf_err)/ZT
+        f_end = pdf_sz_node(x, v, sv, a, ub_z, t, st, terms, pdf_err)/ZT
+        f_mid = pdf_sz_node(x, v, sv, a, c_z, t, st, terms, pdf_err)/ZT
+    else:
+        f_beg = pdf_sv(x - lb_t, v, sv, a, lb_z, pdf_err)/ZT
+        f_end = pdf_sv(x - ub_t, v, sv, a, ub_z, pdf_err)/ZT
+        f_mid = pdf_sv(x - c_t, v, sv, a, c_z, pdf_err)/ZT
     S = (h/6)*(f_beg + 4*f_mid + f_end)
     cdef double res =  adaptiveSimpsonsAux(x, v, sv, a, z, t, pdf_err,
                                  lb_z, ub_z, lb_t, ub_t, ZT, simps_err,
-                                 S, f_beg, f_end, f_mid, maxRecursionDepth)
+                                 S, f_beg, f_end, f_mid, maxRecursionDepth, terms, st)
     return res
 
 cdef double adaptiveSimpsonsAux_2D(double x, double v, double sv,
@@ -147,7 +185,7 @@ cdef double adaptiveSimpsonsAux_2D(double x, double v, double sv,
                                    ub_t, double st, double err_2d, double
                                    S, double f_beg, double f_end, double
                                    f_mid, int maxRecursionDepth_sz, int
-                                   bottom) nogil:
+                                   bottom) noexcept nogil:
 
     cdef double fd, fe
     cdef double Sleft, Sright, S2
@@ -159,9 +197,9 @@ cdef double adaptiveSimpsonsAux_2D(double x, double v, double sv,
     cdef double h = ub_t - lb_t
 
     fd = adaptiveSimpsons_1D(x, v, sv, a, z, t_d, pdf_err, lb_z, ub_z,
-                              0, 0, err_1d, maxRecursionDepth_sz)/st
+                              0, 0, err_1d, maxRecursionDepth_sz, 0)/st
     fe = adaptiveSimpsons_1D(x, v, sv, a, z, t_e, pdf_err, lb_z, ub_z,
-                              0, 0, err_1d, maxRecursionDepth_sz)/st
+                              0, 0, err_1d, maxRecursionDepth_sz, 0)/st
 
     Sleft = (h/12)*(f_beg + 4*fd + f_mid)
     Sright = (h/12)*(f_mid + 4*fe + f_end)
@@ -180,7 +218,7 @@ cdef double adaptiveSimpsonsAux_2D(double x, double v, double sv,
 
 cdef double adaptiveSimpsons_2D(double x, double v, double sv, double a, double z, double t,
                                  double pdf_err, double lb_z, double ub_z, double lb_t, double ub_t,
-                                 double simps_err, int maxRecursionDepth_sz, int maxRecursionDepth_st) nogil:
+                                 double simps_err, int maxRecursionDepth_sz, int maxRecursionDepth_st) noexcept nogil:
 
     cdef double h = (ub_t-lb_t)
 
@@ -193,14 +231,81 @@ cdef double adaptiveSimpsons_2D(double x, double v, double sv, double a, double
     cdef double err_2d = simps_err
 
     f_beg = adaptiveSimpsons_1D(x, v, sv, a, z, lb_t, pdf_err, lb_z, ub_z,
-                              0, 0, err_1d, maxRecursionDepth_sz)/st
+                              0, 0, err_1d, maxRecursionDepth_sz, 0)/st
 
     f_end = adaptiveSimpsons_1D(x, v, sv, a, z, ub_t, pdf_err, lb_z, ub_z,
-                              0, 0, err_1d, maxRecursionDepth_sz)/st
+                              0, 0, err_1d, maxRecursionDepth_sz, 0)/st
     f_mid = adaptiveSimpsons_1D(x, v, sv, a, z, (lb_t+ub_t)/2, pdf_err, lb_z, ub_z,
-                              0, 0, err_1d, maxRecursionDepth_sz)/st
+                              0, 0, err_1d, maxRecursionDepth_sz, 0)/st
     S = (h/6)*(f_beg + 4*f_mid + f_end)
     cdef double res =  adaptiveSimpsonsAux_2D(x, v, sv, a, z, t, pdf_err, err_1d,
                                  lb_z, ub_z, lb_t, ub_t, st, err_2d,
                                  S, f_beg, f_end, f_mid, maxRecursionDepth_sz, maxRecursionDepth_st)
     return res
+
+# Gauss-Legendre nodes and weights on [-1, 1] for orders 1 to GL_MAX_ORDER,
+# row n holds the n nodes of order n.
+cdef int GL_MAX_ORDER = 32
+
+def _gauss_legendre_table(int max_order):
+    nodes = np.zeros((max_order + 1, max_order))
+    weights = np.zeros((max_order + 1, max_order))
+    for order in range(1, max_order + 1):
+        nodes[order, :order], weights[order, :order] = np.polynomial.legendre.leggauss(order)
+    return nodes, weights
+
+cdef double[:, ::1] gl_nodes
+cdef double[:, ::1] gl_weights
+gl_nodes, gl_weights = _gauss_legendre_table(GL_MAX_ORDER)
+
+cdef inline int gl_order(int n) noexcept nogil:
+    """Clip the requested number of Gauss-Legendre nodes to the tabulated orders."""
+    if n < 1:
+        return 1
+    if n > GL_MAX_ORDER:
+        return GL_MAX_ORDER
+    return n
+
+cdef double gauss_legendre_1D(double x, double v, double sv, double a, double z, double t, double err,
+                              double lb_z, double ub_z, int n_sz, double lb_t, double ub_t, int n_st,
+                              double st) noexcept nogil:
+    """Average of pdf_sv over a uniform z or t window with a fixed-node Gauss-Legendre rule.
+    n_sz (n_st) is the number of nodes when integrating over z (t), the other one has to be 0.
+    st is passed on to pdf_sz_node when integrating over z.
+    """
+    cdef int n, i
+    cdef double c, h, S = 0
+    cdef ftt_terms terms
+
+    if n_st==0: #integration over z
+        n = gl_order(n_sz)
+        c = (ub_z + lb_z)/2.
+        h = (ub_z - lb_z)/2.
+        # the normalized time is the same for all nodes, so the series terms are too
+        terms = ftt_01w_terms((x - t)/(a**2), err)
+        for i in range(n):
+            S += gl_weights[n, i] * pdf_sz_node(x, v, sv, a, c + h * gl_nodes[n, i], t, st, terms, err)
+    else: #integration over t
+        n = gl_order(n_st)
+        c = (ub_t + lb_t)/2.
+        h = (ub_t - lb_t)/2.
+        for i in range(n):
+            S += gl_weights[n, i] * pdf_sv(x - (c + h * gl_nodes[n, i]), v, sv, a, z, err)
+
+    # weights sum to 2 on [-1, 1], dividing by it gives the mean over the window
+    return S / 2.
+
+cdef double gauss_legendre_2D(double x, double v, double sv, double a, double z, double t, double err,
+                              double lb_z, double ub_z, int n_sz, double lb_t, double ub_t, int n_st) noexcept nogil:
+    """Average of pdf_sv over uniform z and t windows with a tensor Gauss-Legendre rule."""
+    cdef int n = gl_order(n_st)
+    cdef int i_t
+    cdef double c = (ub_t + lb_t)/2.
+    cdef double h = (ub_t - lb_t)/2.
+    cdef double S = 0
+
+    for i_t in range(n):
+        S += gl_weights[n, i_t] * gauss_legendre_1D(x, v, sv, a, z, c + h * gl_nodes[n, i_t], err,
+                                                     lb_z, ub_z, n_sz, 0, 0, 0, 0)
+
+    return S / 2.
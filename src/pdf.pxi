@@ -20,17 +20,31 @@ cdef extern from "math.h" nogil:
     double ceil(double)
     double floor(double)
     double fabs(double)
+    double erfc(double)
+    double log1p(double)
+    double expm1(double)
     double M_PI
+    double INFINITY
 
 cdef extern from "<algorithm>" namespace "std" nogil:
     T max[T](T a, T b)
 
-cdef double ftt_01w(double tt, double w, double err) nogil:
-    """Compute f(t|0,1,w) for the likelihood of the drift diffusion model using the method
-    and implementation of Navarro & Fuss, 2009.
+cdef struct ftt_terms:
+    bint small_t # use the small time series
+    int K # number of terms needed to meet the error bound
+
+cdef inline ftt_terms ftt_01w_terms(double tt, double err) noexcept nogil:
+    """Choose the series and number of terms used by ftt_01w at normalized time tt.
+    Does not depend on w, so the result can be reused for every starting point
+    evaluated at the same normalized time.
     """
-    cdef double kl, ks, p
-    cdef int k, K, lower, upper
+    cdef double kl, ks
+    cdef ftt_terms terms
+
+    if tt <= 0: # density is zero, no terms needed
+        terms.small_t = 0
+        terms.K = 0
+        return terms
 
     # calculate number of terms needed for large t
     if M_PI*tt*err<1: # if error threshold is set low enough
@@ -46,65 +60,285 @@ cdef double ftt_01w(double tt, double w, double err) nogil:
     else: # if error threshold was set too high
         ks=2 # minimal kappa for that case
 
+    if ks<kl: # if small t is better (i.e., lambda<0)
+        terms.small_t = 1
+        terms.K=<int>(ceil(ks)) # round to smallest integer meeting error
+    else: # if large t is better...
+        terms.small_t = 0
+        terms.K=<int>(ceil(kl)) # round to smallest integer meeting error
+
+    return terms
+
+cdef double ftt_01w_series(double tt, double w, ftt_terms terms) noexcept nogil:
+    """Compute f(t|0,1,w) with the series and number of terms given by ftt_01w_terms."""
+    cdef double p
+    cdef int k, lower, upper
+
     # compute f(tt|0,1,w)
     p=0 #initialize density
-    if ks<kl: # if small t is better (i.e., lambda<0)
-        K=<int>(ceil(ks)) # round to smallest integer meeting error
-        lower = <int>(-floor((K-1)/2.))
-        upper = <int>(ceil((K-1)/2.))
+    if terms.small_t:
+        lower = <int>(-floor((terms.K-1)/2.))
+        upper = <int>(ceil((terms.K-1)/2.))
         for k from lower <= k <= upper: # loop over k
             p+=(w+2*k)*exp(-(pow((w+2*k),2))/2/tt) # increment sum
         p/=sqrt(2*M_PI*pow(tt,3)) # add con_stant term
 
-    else: # if large t is better...
-        K=<int>(ceil(kl)) # round to smallest integer meeting error
-        for k from 1 <= k <= K:
+    else:
+        for k from 1 <= k <= terms.K:
             p+=k*exp(-(pow(k,2))*(M_PI**2)*tt/2)*sin(k*M_PI*w) # increment sum
         p*=M_PI # add con_stant term
 
     return p
 
-cdef inline double prob_ub(double v, double a, double z) nogil:
+cdef double ftt_01w(double tt, double w, double err) noexcept nogil:
+    """Compute f(t|0,1,w) for the likelihood of the drift diffusion model using the method
+    and implementation of Navarro & Fuss, 2009.
+    """
+    return ftt_01w_series(tt, w, ftt_01w_terms(tt, err))
+
+cdef inline double prob_ub(double v, double a, double z) noexcept nogil:
     """Probability of hitting upper boundary."""
     if v == 0:
         return z
     else:
         return (exp(-2 * a * z * v) - 1) / (exp(-2 * a * v) - 1)
 
-cdef double pdf(double x, double v, double a, double w, double err) nogil:
+cdef double pdf_terms(double x, double v, double a, double w, ftt_terms terms) noexcept nogil:
     """Compute the likelihood of the drift diffusion model f(t|v,a,z) using the method
-    and implementation of Navarro & Fuss, 2009.
+    and implementation of Navarro & Fuss, 2009, with precomputed series terms.
     """
     if x <= 0:
         return 0
 
     cdef double tt = x/a**2 # use normalized time
-    cdef double p = ftt_01w(tt, w, err) #get f(t|0,1,w)
+    cdef double p = ftt_01w_series(tt, w, terms) #get f(t|0,1,w)
 
     # convert to f(t|v,a,w)
     return p*exp(-v*a*w -(pow(v,2))*x/2.)/(pow(a,2))
 
-cdef double pdf_sv(double x, double v, double sv, double a, double z, double err) nogil:
-    """Compute the likelihood of the drift diffusion model f(t|v,a,z,sv) using the method
+cdef double pdf(double x, double v, double a, double w, double err) noexcept nogil:
+    """Compute the likelihood of the drift diffusion model f(t|v,a,z) using the method
     and implementation of Navarro & Fuss, 2009.
+    """
+    if x <= 0:
+        return 0
+
+    return pdf_terms(x, v, a, w, ftt_01w_terms(x/a**2, err))
+
+cdef double pdf_sv_terms(double x, double v, double sv, double a, double z, ftt_terms terms) noexcept nogil:
+    """Compute the likelihood of the drift diffusion model f(t|v,a,z,sv) with
+    precomputed series terms (see ftt_01w_terms).
     sv is the std of the drift rate
     """
     if x <= 0:
         return 0
 
     if sv==0:
-        return pdf(x, v, a, z, err)
+        return pdf_terms(x, v, a, z, terms)
 
     cdef double tt = x/(pow(a,2)) # use normalized time
-    cdef double p  = ftt_01w(tt, z, err) #get f(t|0,1,w)
+    cdef double p  = ftt_01w_series(tt, z, terms) #get f(t|0,1,w)
 
     # convert to f(t|v,a,w)
     return exp(log(p) + ((a*z*sv)**2 - 2*a*v*z - (v**2)*x)/(2*(sv**2)*x+2))/sqrt((sv**2)*x+1)/(a**2)
 
+cdef double pdf_sv(double x, double v, double sv, double a, double z, double err) noexcept nogil:
+    """Compute the likelihood of the drift diffusion model f(t|v,a,z,sv) using the method
+    and implementation of Navarro & Fuss, 2009.
+    sv is the std of the drift rate
+    """
+    if x <= 0:
+        return 0
+
+    return pdf_sv_terms(x, v, sv, a, z, ftt_01w_terms(x/(pow(a,2)), err))
+
+cdef inline double logaddexp(double x, double y) noexcept nogil:
+    """log(exp(x) + exp(y)) without overflow or underflow."""
+    if x == -INFINITY:
+        return y
+    if x > y:
+        return x + log1p(exp(y - x))
+    return y + log1p(exp(x - y))
+
+cdef double log_ftt_01w(double tt, double w, ftt_terms terms) noexcept nogil:
+    """log f(t|0,1,w) of ftt_01w, computed in log space.
+
+    The exponent of the largest term is factored out of the series (log-sum-exp),
+    so the result stays finite where f(t|0,1,w) underflows.
+    """
+    cdef double p = 0
+    cdef int k, lower, upper
+
+    if tt <= 0:
+        return -INFINITY
+
+    if terms.small_t:
+        # the k=0 term has the largest exponent -w**2/(2*tt); relative to it the
+        # exponent of term k is -((w+2k)**2 - w**2)/(2*tt) = -2k(w+k)/tt
+        lower = <int>(-floor((terms.K-1)/2.))
+        upper = <int>(ceil((terms.K-1)/2.))
+        for k from lower <= k <= upper:
+            p += (w+2*k)*exp(-2*k*(w+k)/tt)
+        if p <= 0:
+            return -INFINITY
+        return log(p) - w*w/2/tt - 0.5*log(2*M_PI*tt*tt*tt)
+
+    else:
+        # the k=1 term has the largest exponent -pi**2*tt/2
+        for k from 1 <= k <= terms.K:
+            p += k*exp(-(k*k - 1)*(M_PI**2)*tt/2)*sin(k*M_PI*w)
+        if p <= 0:
+            return -INFINITY
+        return log(p*M_PI) - (M_PI**2)*tt/2
+
+cdef double log_pdf_sv(double x, double v, double sv, double a, double z, double err) noexcept nogil:
+    """log of pdf_sv, computed in log space (see log_ftt_01w)."""
+    if x <= 0:
+        return -INFINITY
+
+    cdef double tt = x/(pow(a,2)) # use normalized time
+    cdef double logp = log_ftt_01w(tt, z, ftt_01w_terms(tt, err))
+
+    # convert to f(t|v,a,w), for sv=0 this reduces to the transform in pdf_terms
+    return logp + ((a*z*sv)**2 - 2*a*v*z - (v**2)*x)/(2*(sv**2)*x+2) - 0.5*log((sv**2)*x+1) - 2*log(a)
+
+cdef double ftt_01w_fast(double tt, double w, ftt_terms terms, double* log_scale) noexcept nogil:
+    """f(t|0,1,w) as in ftt_01w, computed as the returned sum times exp(log_scale[0]).
+
+    Fast mode: the exponent of the leading term is factored out into log_scale, so
+    the remaining terms lie in [0, 1]. Their exponentials and sines follow from
+    recurrences, so the series costs three transcendental calls for any number of
+    terms K instead of K (or 2K). The result stays within a relative 1e-9 of
+    ftt_01w, the largest differences occur where the sum cancels (w close to 1).
+    """
+    cdef double p = 0
+    cdef double e, r, B, sin_k, sin_km1, sin_km2, cos_1
+    cdef int k, lower, upper
+
+    if terms.small_t:
+        # the term for k relative to k=0 is exp(-2k(w+k)/tt), its ratio to the term
+        # for k-1 (k+1 for negative k) shrinks by B = exp(-4/tt) with every step
+        lower = <int>(-floor((terms.K-1)/2.))
+        upper = <int>(ceil((terms.K-1)/2.))
+        B = exp(-4/tt)
+        p = w
+        e = 1
+        r = exp(-2*(w + 1)/tt)
+        for k from 1 <= k <= upper:
+            e *= r
+            r *= B
+            p += (w + 2*k)*e
+        e = 1
+        r = exp(-2*(1 - w)/tt)
+        for k from 1 <= k <= -lower:
+            e *= r
+            r *= B
+            p += (w - 2*k)*e
+        log_scale[0] = -w*w/2/tt
+        return p/sqrt(2*M_PI*tt*tt*tt)
+
+    else:
+        # the term for k relative to k=1 is exp(-(k**2-1)*pi**2*tt/2), the ratio to
+        # the term for k-1 shrinks by B = exp(-pi**2*tt) with every step; sin(k*pi*w)
+        # follows the Chebyshev recurrence
+        B = exp(-(M_PI**2)*tt)
+        r = B*exp(-(M_PI**2)*tt/2)
+        sin_km1 = 0
+        sin_k = sin(M_PI*w)
+        cos_1 = cos(M_PI*w)
+        e = 1
+        for k from 1 <= k <= terms.K:
+            p += k*e*sin_k
+            e *= r
+            r *= B
+            sin_km2 = sin_km1
+            sin_km1 = sin_k
+            sin_k = 2*cos_1*sin_km1 - sin_km2
+        log_scale[0] = -(M_PI**2)*tt/2
+        return p*M_PI
+
+cdef double pdf_sv_fast(double x, double v, double sv, double a, double z, double err) noexcept nogil:
+    """pdf_sv in fast mode (see ftt_01w_fast)."""
+    if x <= 0:
+        return 0
+
+    cdef double tt = x/(pow(a,2)) # use normalized time
+    cdef double log_scale
+    cdef double p = ftt_01w_fast(tt, z, ftt_01w_terms(tt, err), &log_scale)
+
+    # convert to f(t|v,a,w), for sv=0 this reduces to the transform in pdf_terms
+    return p*exp(log_scale + ((a*z*sv)**2 - 2*a*v*z - (v**2)*x)/(2*(sv**2)*x+2))/sqrt((sv**2)*x+1)/(a**2)
+
+cdef inline double log_norm_cdf(double x) noexcept nogil:
+    """log of the standard normal cdf, using the asymptotic expansion in the far left tail."""
+    if x > -30:
+        return log(0.5*erfc(-x/sqrt(2)))
+    return -x*x/2 - log(-x) - 0.5*log(2*M_PI) + log(1 - 1/(x*x) + 3/(x*x*x*x))
+
+cdef double cdf_lb(double x, double v, double a, double w, double err) noexcept nogil:
+    """Probability F(x|v,a,w) of hitting the lower boundary before time x.
+
+    Uses the same small time / large time series as ftt_01w, integrated over time
+    term by term (see Blurton, Kesselmeier & Gondan, 2012).
+    """
+    if x <= 0:
+        return 0
+
+    cdef double tt = x/(a**2) # use normalized time
+    cdef ftt_terms terms = ftt_01w_terms(tt, err)
+    cdef double F = 0
+    cdef double sqrt_x = sqrt(x)
+    cdef double xk, lam
+    cdef int k, K
+
+    if terms.small_t:
+        # every image of the small time series integrates to a first passage cdf of
+        # Brownian motion with drift -v to the level xk
+        K = <int>(ceil((sqrt(-2*tt*log(err)) + 1)/2.)) + 1
+        for k from -K <= k <= K:
+            xk = a*(w + 2*k)
+            if xk > 0:
+                F += exp(2*v*a*k + log_norm_cdf((-v*x - xk)/sqrt_x)) + \
+                     exp(-2*v*a*(w + k) + log_norm_cdf((v*x - xk)/sqrt_x))
+            else:
+                F -= exp(2*v*a*k + log_norm_cdf((v*x + xk)/sqrt_x)) + \
+                     exp(-2*v*a*(w + k) + log_norm_cdf((-v*x + xk)/sqrt_x))
+    else:
+        # large time: the series gives the probability mass still to come
+        for k from 1 <= k <= terms.K:
+            lam = v**2 + (k*M_PI/a)**2
+            F += 2*k*sin(k*M_PI*w)*exp(-v*a*w - lam*x/2)/lam
+        F = 1 - prob_ub(v, a, w) - F*M_PI/(a**2)
+
+    return F
+
+cdef double pdf_st(double x, double v, double a, double z, double t, double st, double err) noexcept nogil:
+    """Density of the drift diffusion model averaged over a uniform non-decision time
+    window [t-st/2, t+st/2], computed exactly as a difference of cdf_lb. Only valid for sv=0.
+    """
+    cdef double lo = x - (t + st/2.) # decision time at the end of the window
+    cdef double F = 0
+    cdef double lam
+    cdef ftt_terms terms
+    cdef int k
+
+    if lo > 0:
+        terms = ftt_01w_terms(lo/(a**2), err)
+        if not terms.small_t:
+            # both ends use the large time series, whose constant 1 - prob_ub cancels
+            # in the difference. Subtracting the two cdfs would lose all digits of
+            # small densities, so the series terms are differenced one by one instead.
+            for k from 1 <= k <= terms.K:
+                lam = v**2 + (k*M_PI/a)**2
+                F += 2*k*sin(k*M_PI*z)*exp(-v*a*z - lam*lo/2)*(-expm1(-lam*st/2))/lam
+            return F*M_PI/(a**2)/st
+
+    return (cdf_lb(x - (t - st/2.), v, a, z, err) - cdf_lb(lo, v, a, z, err))/st
+
 cpdef double full_pdf(double x, double v, double sv, double a, double
                       z, double sz, double t, double st, double err, int
-                      n_st=2, int n_sz=2, bint use_adaptive=1, double
-                      simps_err=1e-3) nogil:
+                      n_st=2, int n_sz=2, int use_adaptive=1, double
+                      simps_err=1e-3) noexcept nogil:
     """full pdf"""
 
     # Check if parpameters are valid
@@ -124,23 +358,87 @@ cpdef double full_pdf(double x, double v, double sv, double a, double
     if sz <1e-3:
         sz = 0
 
+    # use_adaptive selects the integration over sz and st:
+    # 0 fixed Simpson, 1 adaptive Simpson, 2 Gauss-Legendre with n_sz/n_st nodes
+    # Without sv the integral over st is computed exactly from the cdf instead.
     if (sz==0):
         if (st==0): #sv=0,sz=0,st=0
             return pdf_sv(x - t, v, sv, a, z, err)
-        else:      #sv=0,sz=0,st=$
-            if use_adaptive>0:
-                return adaptiveSimpsons_1D(x,  v, sv, a, z, t, err, z, z, t-st/2., t+st/2., simps_err, n_st)
+        elif (sv==0): #sv=0,sz=0,st=$
+            return pdf_st(x, v, a, z, t, st, err)
+        else:      #sv=$,sz=0,st=$
+            if use_adaptive==2:
+                return gauss_legendre_1D(x, v, sv, a, z, t, err, z, z, 0, t-st/2., t+st/2., n_st, 0)
+            elif use_adaptive>0:
+                return adaptiveSimpsons_1D(x,  v, sv, a, z, t, err, z, z, t-st/2., t+st/2., simps_err, n_st, 0)
             else:
-                return simpson_1D(x, v, sv, a, z, t, err, z, z, 0, t-st/2., t+st/2., n_st)
+                return simpson_1D(x, v, sv, a, z, t, err, z, z, 0, t-st/2., t+st/2., n_st, 0)
 
     else: #sz=$
-        if (st==0): #sv=0,sz=$,st=0
-            if use_adaptive:
-                return adaptiveSimpsons_1D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., t, t, simps_err, n_sz)
+        if (st==0) or (sv==0): #sv=$,sz=$,st=0 or sv=0,sz=$,st=$ (st in closed form)
+            if use_adaptive==2:
+                return gauss_legendre_1D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., n_sz, t, t, 0, st)
+            elif use_adaptive:
+                return adaptiveSimpsons_1D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., t, t, simps_err, n_sz, st)
             else:
-                return simpson_1D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., n_sz, t, t , 0)
-        else:      #sv=0,sz=$,st=$
-            if use_adaptive:
+                return simpson_1D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., n_sz, t, t , 0, st)
+        else:      #sv=$,sz=$,st=$
+            if use_adaptive==2:
+                return gauss_legendre_2D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., n_sz, t-st/2., t+st/2., n_st)
+            elif use_adaptive:
                 return adaptiveSimpsons_2D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., t-st/2., t+st/2., simps_err, n_sz, n_st)
             else:
                 return simpson_2D(x, v, sv, a, z, t, err, z-sz/2., z+sz/2., n_sz, t-st/2., t+st/2., n_st)
+
+cpdef double full_pdf_fast(double x, double v, double sv, double a, double
+                           z, double sz, double t, double st, double err, int
+                           n_st=2, int n_sz=2, int use_adaptive=1, double
+                           simps_err=1e-3) noexcept nogil:
+    """full pdf in fast mode: without sz and st the density is computed by
+    pdf_sv_fast (see ftt_01w_fast), everything else is delegated to full_pdf.
+    """
+    if sz >= 1e-3 or st >= 1e-3:
+        return full_pdf(x, v, sv, a, z, sz, t, st, err, n_st, n_sz, use_adaptive, simps_err)
+
+    # Check if parpameters are valid
+    if (z<0) or (z>1) or (a<0) or (t<0) or (st<0) or (sv<0) or (sz<0) or \
+       ((fabs(x)-(t-st/2.))<0) or (z+sz/2.>1) or (z-sz/2.<0) or (t-st/2.<0):
+        return 0
+
+    # transform x,v,z if x is upper bound response
+    if x > 0:
+        v = -v
+        z = 1.-z
+
+    return pdf_sv_fast(fabs(x) - t, v, sv, a, z, err)
+
+cpdef double full_logpdf(double x, double v, double sv, double a, double
+                         z, double sz, double t, double st, double err, int
+                         n_st=2, int n_sz=2, int use_adaptive=1, double
+                         simps_err=1e-3) noexcept nogil:
+    """log of full_pdf. Without sz and st the density is computed in log space
+    (see log_pdf_sv) and does not underflow in the tails, otherwise this is
+    log(full_pdf(...)).
+    """
+    if sz >= 1e-3 or st >= 1e-3:
+        return log(full_pdf(x, v, sv, a, z, sz, t, st, err, n_st, n_sz, use_adaptive, simps_err))
+
+    # Check if parpameters are valid
+    if (z<0) or (z>1) or (a<0) or (t<0) or (st<0) or (sv<0) or (sz<0) or \
+       ((fabs(x)-(t-st/2.))<0) or (z+sz/2.>1) or (z-sz/2.<0) or (t-st/2.<0):
+        return -INFINITY
+
+    # transform x,v,z if x is upper bound response
+    if x > 0:
+        v = -v
+        z = 1.-z
+
+    return log_pdf_sv(fabs(x) - t, v, sv, a, z, err)
+
+cdef inline double log_outlier_mixture(double logp, double p_outlier, double w_outlier) noexcept nogil:
+    """log((1 - p_outlier)*exp(logp) + p_outlier*w_outlier)"""
+    if p_outlier == 0:
+        return logp
+    if p_outlier == 1:
+        return log(w_outlier)
+    return logaddexp(logp + log1p(-p_outlier), log(p_outlier*w_outlier))
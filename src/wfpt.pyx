@@ -30,18 +30,42 @@ from cython.parallel import *
 include 'integrate.pxi'
 
 def pdf_array(np.ndarray[double, ndim=1] x, double v, double sv, double a, double z, double sz,
-              double t, double st, double err=1e-4, bint logp=0, int n_st=2, int n_sz=2, bint use_adaptive=1,
-              double simps_err=1e-3, double p_outlier=0, double w_outlier=0):
+              double t, double st, double err=1e-4, bint logp=0, int n_st=2, int n_sz=2, int use_adaptive=1,
+              double simps_err=1e-3, double p_outlier=0, double w_outlier=0, bint unique=0,
+              bint fast=0):
+    """Density of the full DDM at every value of x. If unique is set, the density is only
+    evaluated once per distinct value of x, which pays off for data with many repeated RTs.
+    If fast is set, densities are computed by full_pdf_fast. The log-densities returned
+    for logp are computed in log space by full_logpdf unless fast is set.
+    """
+    cdef np.ndarray[np.intp_t, ndim = 1] inverse
+    if unique:
+        x, inverse = np.unique(x, return_inverse=True)
 
     cdef Py_ssize_t size = x.shape[0]
     cdef Py_ssize_t i
     cdef np.ndarray[double, ndim = 1] y = np.empty(size, dtype=np.double)
 
+    if logp and not fast:
+        for i in prange(size, nogil=True):
+            y[i] = log_outlier_mixture(full_logpdf(x[i], v, sv, a, z, sz, t, st, err,
+                                                   n_st, n_sz, use_adaptive, simps_err),
+                                       p_outlier, w_outlier)
+        if unique:
+            y = y[inverse]
+        return y
+
     for i in prange(size, nogil=True):
-        y[i] = full_pdf(x[i], v, sv, a, z, sz, t, st, err,
-                        n_st, n_sz, use_adaptive, simps_err)
+        if fast:
+            y[i] = full_pdf_fast(x[i], v, sv, a, z, sz, t, st, err,
+                                 n_st, n_sz, use_adaptive, simps_err)
+        else:
+            y[i] = full_pdf(x[i], v, sv, a, z, sz, t, st, err,
+                            n_st, n_sz, use_adaptive, simps_err)
 
     y = y * (1 - p_outlier) + (w_outlier * p_outlier)
+    if unique:
+        y = y[inverse]
     if logp == 1:
         return np.log(y)
     else:
@@ -51,105 +75,427 @@ cdef inline bint p_outlier_in_range(double p_outlier):
     return (p_outlier >= 0) & (p_outlier <= 1)
 
 
+cdef inline double* weights_ptr(np.ndarray weights, Py_ssize_t size) except? NULL:
+    """Pointer to the per-trial weights of a summed log-likelihood, NULL if there are none."""
+    if weights is None:
+        return NULL
+    if weights.shape[0] != size:
+        raise ValueError("weights need one value per trial, got %d values for %d trials"
+                         % (weights.shape[0], size))
+    return <double*> weights.data
+
 def wiener_like(np.ndarray[double, ndim=1] x, double v, double sv, double a, double z, double sz, double t,
-                double st, double err, int n_st=10, int n_sz=10, bint use_adaptive=1, double simps_err=1e-8,
-                double p_outlier=0, double w_outlier=0.1):
+                double st, double err, int n_st=10, int n_sz=10, int use_adaptive=1, double simps_err=1e-8,
+                double p_outlier=0, double w_outlier=0.1, np.ndarray[double, ndim=1, mode='c'] weights=None,
+                bint fast=0):
+    """Summed log-likelihood of the full DDM. The log-probability of trial i is multiplied
+    by weights[i] if given, e.g. the number of times a unique RT occurs in the data.
+
+    If fast is set, the series of the density is summed with recurrences for models
+    without sz and st (see full_pdf_fast). Each density stays within a relative 1e-9
+    of the default, i.e. within 1e-9 per trial of the log-likelihood.
+    """
+
+    if not p_outlier_in_range(p_outlier):
+        return -np.inf
+
+    return wiener_like_core(x, &v, 0, &sv, 0, &a, 0, &z, 0, &sz, 0, &t, 0, &st, 0,
+                            err, n_st, n_sz, use_adaptive, simps_err,
+                            p_outlier, w_outlier, 0, weights_ptr(weights, x.shape[0]), fast)
+
+cdef double wiener_like_core(double[:] x,
+                             double* v, Py_ssize_t s_v, double* sv, Py_ssize_t s_sv,
+                             double* a, Py_ssize_t s_a, double* z, Py_ssize_t s_z,
+                             double* sz, Py_ssize_t s_sz, double* t, Py_ssize_t s_t,
+                             double* st, Py_ssize_t s_st, double err, int n_st, int n_sz,
+                             int use_adaptive, double simps_err, double p_outlier,
+                             double w_outlier, bint missing_rt, double* weights, bint fast) noexcept nogil:
+    """Summed log-likelihood over trials, evaluated in parallel.
+
+    Every parameter is given as a pointer plus a stride: a stride of 0 broadcasts a
+    single value over all trials, a stride of 1 reads one value per trial. If weights
+    is not NULL, the log-probability of each trial is multiplied by its weight. If fast
+    is set, densities are computed by full_pdf_fast.
+    """
     cdef Py_ssize_t size = x.shape[0]
     cdef Py_ssize_t i
     cdef double p
     cdef double sum_logp = 0
     cdef double wp_outlier = w_outlier * p_outlier
 
+    for i in prange(size):
+        if missing_rt and fabs(x[i]) == 999.:
+            # no-response trials only carry information about the boundary
+            p = prob_ub(v[i*s_v], a[i*s_a], z[i*s_z])
+            if x[i] < 0:
+                p = 1 - p
+        else:
+            if fast:
+                p = full_pdf_fast(x[i], v[i*s_v], sv[i*s_sv], a[i*s_a], z[i*s_z], sz[i*s_sz],
+                                  t[i*s_t], st[i*s_st], err, n_st, n_sz, use_adaptive, simps_err)
+            else:
+                p = full_pdf(x[i], v[i*s_v], sv[i*s_sv], a[i*s_a], z[i*s_z], sz[i*s_sz],
+                             t[i*s_t], st[i*s_st], err, n_st, n_sz, use_adaptive, simps_err)
+            p = p * (1 - p_outlier) + wp_outlier
+        # If one probability = 0, the log sum will be -Inf
+        if weights != NULL:
+            sum_logp += weights[i] * log(p)
+        else:
+            sum_logp += log(p)
+
+    return sum_logp
+
+cdef inline np.ndarray param_array(param, Py_ssize_t size):
+    """Convert a scalar or per-trial parameter to a contiguous double array."""
+    cdef np.ndarray arr = np.ascontiguousarray(param, dtype=np.double).ravel()
+    if arr.shape[0] != 1 and arr.shape[0] != size:
+        raise ValueError("per-trial parameters need one value per trial, got %d values for %d trials"
+                         % (arr.shape[0], size))
+    return arr
+
+def wiener_like_array(np.ndarray[double, ndim=1] x, v, sv, a, z, sz, t, st, double err,
+                      int n_st=10, int n_sz=10, int use_adaptive=1, double simps_err=1e-3,
+                      double p_outlier=0, double w_outlier=0, bint missing_rt=1,
+                      np.ndarray[double, ndim=1, mode='c'] weights=None, bint fast=0):
+    """Log-likelihood of the full DDM where each of v, sv, a, z, sz, t and st can
+    either be a scalar or an array holding one value per trial.
+
+    Trials are evaluated in parallel without the GIL. If missing_rt is set, RTs
+    of 999 (-999) are scored by the probability of hitting the upper (lower) boundary.
+    The log-probability of trial i is multiplied by weights[i] if given. See
+    wiener_like for fast.
+    """
+    cdef Py_ssize_t size = x.shape[0]
+
     if not p_outlier_in_range(p_outlier):
         return -np.inf
 
-    for i in range(size):
-        p = full_pdf(x[i], v, sv, a, z, sz, t, st, err,
-                     n_st, n_sz, use_adaptive, simps_err)
-        # If one probability = 0, the log sum will be -Inf
-        p = p * (1 - p_outlier) + wp_outlier
-        if p == 0:
-            return -np.inf
+    cdef np.ndarray v_arr = param_array(v, size)
+    cdef np.ndarray sv_arr = param_array(sv, size)
+    cdef np.ndarray a_arr = param_array(a, size)
+    cdef np.ndarray z_arr = param_array(z, size)
+    cdef np.ndarray sz_arr = param_array(sz, size)
+    cdef np.ndarray t_arr = param_array(t, size)
+    cdef np.ndarray st_arr = param_array(st, size)
+
+    return wiener_like_core(x,
+                            <double*> v_arr.data, v_arr.shape[0] > 1,
+                            <double*> sv_arr.data, sv_arr.shape[0] > 1,
+                            <double*> a_arr.data, a_arr.shape[0] > 1,
+                            <double*> z_arr.data, z_arr.shape[0] > 1,
+                            <double*> sz_arr.data, sz_arr.shape[0] > 1,
+                            <double*> t_arr.data, t_arr.shape[0] > 1,
+                            <double*> st_arr.data, st_arr.shape[0] > 1,
+                            err, n_st, n_sz, use_adaptive, simps_err,
+                            p_outlier, w_outlier, missing_rt, weights_ptr(weights, size), fast)
+
+def wiener_like_log(np.ndarray[double, ndim=1] x, double v, double sv, double a, double z, double sz,
+                    double t, double st, double err, int n_st=10, int n_sz=10, int use_adaptive=1,
+                    double simps_err=1e-8, double p_outlier=0, double w_outlier=0.1,
+                    np.ndarray[double, ndim=1, mode='c'] weights=None):
+    """Summed log-likelihood of the full DDM like wiener_like, but every trial is
+    evaluated in log space by full_logpdf and mixed with the outlier distribution via
+    log-sum-exp. Trials in the far tails keep a finite log-likelihood instead of
+    underflowing to -inf.
+    """
+    cdef Py_ssize_t size = x.shape[0]
+    cdef Py_ssize_t i
+    cdef double logp
+    cdef double sum_logp = 0
+    cdef double[:] x_view = x
+    cdef double* w = weights_ptr(weights, size)
 
-        sum_logp += log(p)
+    if not p_outlier_in_range(p_outlier):
+        return -np.inf
+
+    for i in prange(size, nogil=True):
+        logp = log_outlier_mixture(full_logpdf(x_view[i], v, sv, a, z, sz, t, st, err,
+                                               n_st, n_sz, use_adaptive, simps_err),
+                                   p_outlier, w_outlier)
+        if w != NULL:
+            sum_logp += w[i] * logp
+        else:
+            sum_logp += logp
 
     return sum_logp
 
+def wiener_like_batch(np.ndarray[double, ndim=1] x, np.ndarray[double, ndim=2] theta, double err=1e-4,
+                      int n_st=10, int n_sz=10, int use_adaptive=1, double simps_err=1e-8,
+                      double p_outlier=0, double w_outlier=0.1):
+    """Summed log-likelihood of the same RTs under K parameter vectors.
+
+    Each row of theta holds (v, sv, a, z, sz, t, st). Returns an array of K
+    log-likelihoods, one per row, computed in parallel over the rows. This
+    amortizes the Python call overhead when many parameter vectors have to be
+    evaluated, e.g. for likelihood surfaces or bootstrap fits.
+    """
+    cdef Py_ssize_t size = x.shape[0]
+    cdef Py_ssize_t n_theta = theta.shape[0]
+    cdef Py_ssize_t i, k
+    cdef double p
+    cdef double wp_outlier = w_outlier * p_outlier
+    cdef np.ndarray[double, ndim=1] sum_logp = np.zeros(n_theta, dtype=np.double)
+    cdef double[:, :] theta_view
+    cdef double[:] x_view = x
+    cdef double[:] sum_logp_view = sum_logp
+
+    if theta.shape[1] != 7:
+        raise ValueError("theta needs the 7 columns (v, sv, a, z, sz, t, st), got %d" % theta.shape[1])
+
+    if not p_outlier_in_range(p_outlier):
+        sum_logp[:] = -np.inf
+        return sum_logp
+
+    theta_view = np.ascontiguousarray(theta)
+
+    for k in prange(n_theta, nogil=True, schedule='dynamic'):
+        for i in range(size):
+            p = full_pdf(x_view[i], theta_view[k, 0], theta_view[k, 1], theta_view[k, 2],
+                         theta_view[k, 3], theta_view[k, 4], theta_view[k, 5], theta_view[k, 6],
+                         err, n_st, n_sz, use_adaptive, simps_err)
+            p = p * (1 - p_outlier) + wp_outlier
+            # If one probability = 0, the log sum will be -Inf
+            if p == 0:
+                sum_logp_view[k] = -INFINITY
+                break
+            sum_logp_view[k] += log(p)
+
+    return sum_logp
+
+def rl_blocks(np.ndarray split_by):
+    """Trial order and block boundaries of the split_by groups of the RL likelihoods.
+
+    Returns (order, offsets), both of type np.intp: order sorts the trials by
+    split_by and keeps the trial order within a block, so the trials of block j
+    are order[offsets[j]:offsets[j + 1]]. The likelihoods compute them on every
+    call if they are not given (see hddm.utils.split_by_blocks).
+    """
+    cdef Py_ssize_t size = split_by.shape[0]
+    cdef np.ndarray order = np.argsort(split_by, kind='stable').astype(np.intp)
+    cdef np.ndarray sorted_split_by = split_by[order]
+    cdef np.ndarray offsets = np.concatenate(
+        ([0], np.flatnonzero(sorted_split_by[1:] != sorted_split_by[:size - 1]) + 1, [size])
+    ).astype(np.intp)
+    return order, offsets
+
+cdef inline double logistic(double x) noexcept nogil:
+    """Learning rate exp(x) / (1 + exp(x)) of the unbounded alpha of the RL models,
+    evaluated without overflow for large |x|."""
+    cdef double e
+    if x >= 0:
+        return 1 / (1 + exp(-x))
+    e = exp(x)
+    return e / (1 + e)
+
+cdef np.ndarray logistic_array(x):
+    """logistic() of every element of x as a new double array."""
+    cdef np.ndarray[double, ndim=1] out = np.array(x, dtype=np.double).ravel()
+    cdef double[:] out_view = out
+    cdef Py_ssize_t i
+    for i in range(out_view.shape[0]):
+        out_view[i] = logistic(out_view[i])
+    return out
+
+cdef void q_learning(const long[:] response, const double[:] feedback, const Py_ssize_t[:] order,
+                     Py_ssize_t start, Py_ssize_t stop, double q,
+                     double* alfa, Py_ssize_t s_alfa, double* pos_alfa, Py_ssize_t s_pos_alfa,
+                     double* q_diff) noexcept nogil:
+    """Q-learning over the trials order[start:stop] of one split_by block.
+
+    Both options start at q. Before trial i updates the chosen option, q_diff[i]
+    is set to the value of the upper (response 1) minus the lower option. The
+    learning rate is pos_alfa if the feedback exceeds the value of the chosen
+    option and alfa otherwise. Rates are in [0, 1] and given as pointer plus
+    stride (see wiener_like_core).
+    """
+    cdef Py_ssize_t k, i
+    cdef double q_lower = q
+    cdef double q_upper = q
+    cdef double rate
+
+    for k in range(start, stop):
+        i = order[k]
+        q_diff[i] = q_upper - q_lower
+        # qs[1] is upper bound, qs[0] is lower bound. feedback is reward
+        # received on current trial.
+        if response[i] == 1:
+            rate = pos_alfa[i*s_pos_alfa] if feedback[i] > q_upper else alfa[i*s_alfa]
+            q_upper = q_upper + rate * (feedback[i] - q_upper)
+        else:
+            rate = pos_alfa[i*s_pos_alfa] if feedback[i] > q_lower else alfa[i*s_alfa]
+            q_lower = q_lower + rate * (feedback[i] - q_lower)
+
+cdef bint scale_drift(float[:, :] data, const double* q_diff, double lower, double upper,
+                      bint positive_scale) noexcept nogil:
+    """Multiply the drift scale in the first column of the network input data by the
+    Q-value difference of each trial, in place. Returns False at the first drift
+    outside [lower, upper], or negative scale if positive_scale is set."""
+    cdef Py_ssize_t i
+    cdef float drift
+
+    for i in range(data.shape[0]):
+        if positive_scale and data[i, 0] < 0:
+            return False
+        drift = q_diff[i] * data[i, 0]
+        if drift < lower or drift > upper:
+            return False
+        data[i, 0] = drift
+    return True
+
+# update rules of q_learning_options, selected by the "update_rule" of hddm.model_config_rl
+cdef enum:
+    RL_RW = 0
+    RL_RW_DUAL = 1
+    RL_RW_DECAY = 2
+
+rl_update_rules = {"rw": RL_RW, "rw_dual": RL_RW_DUAL, "rw_decay": RL_RW_DECAY}
+
+cdef void q_learning_options(const long[:] response, const double[:] feedback,
+                             const Py_ssize_t[:] order, Py_ssize_t start, Py_ssize_t stop,
+                             double q, int rule, const double* rates,
+                             double[:, :] q_values) noexcept nogil:
+    """Q-learning with one Q-value per option over the trials order[start:stop] of one
+    split_by block.
+
+    Row i of q_values receives the Q-values before trial i updates the chosen option
+    response[i] (negative responses choose option 0). rates are the learning rates of
+    the update rule, in [0, 1]:
+        RL_RW: (alpha,)
+        RL_RW_DUAL: (alpha, pos_alpha), pos_alpha if the feedback exceeds the Q-value
+        RL_RW_DECAY: (alpha, decay), the unchosen options decay towards q
+    """
+    cdef Py_ssize_t n_options = q_values.shape[1]
+    cdef Py_ssize_t k, i, n, o, c
+    cdef double delta
+
+    if start == stop:
+        return
+    for o in range(n_options):
+        q_values[order[start], o] = q
+
+    for k in range(start, stop - 1):
+        i = order[k]
+        n = order[k + 1]
+        for o in range(n_options):
+            q_values[n, o] = q_values[i, o]
+
+        c = response[i] if response[i] > 0 else 0
+        delta = feedback[i] - q_values[n, c]
+        if rule == RL_RW_DUAL and delta > 0:
+            q_values[n, c] += rates[1] * delta
+        else:
+            q_values[n, c] += rates[0] * delta
+
+        if rule == RL_RW_DECAY:
+            for o in range(n_options):
+                if o != c:
+                    q_values[n, o] += rates[1] * (q - q_values[n, o])
+
+cdef np.ndarray q_values_all(np.ndarray response, np.ndarray feedback, np.ndarray split_by,
+                             double q, Py_ssize_t n_options, update_rule, params_rl,
+                             np.ndarray order, np.ndarray offsets):
+    """Q-values of every trial (see q_learning_options) as array of shape (n_trials, n_options)."""
+    cdef int rule = rl_update_rules[update_rule]
+    cdef np.ndarray[double, ndim=1] rates = logistic_array(params_rl)
+    cdef np.ndarray[double, ndim=2] q_values = np.empty((response.shape[0], n_options), dtype=np.double)
+    cdef Py_ssize_t j
+
+    if rates.shape[0] < (1 if rule == RL_RW else 2):
+        raise ValueError("update rule %s needs %d learning rates, got %d"
+                         % (update_rule, 1 if rule == RL_RW else 2, rates.shape[0]))
+    if response.shape[0] > 0 and response.max() >= n_options:
+        raise ValueError("responses have to be option indices below %d" % n_options)
+
+    if order is None:
+        order, offsets = rl_blocks(split_by)
+    cdef const Py_ssize_t[:] order_view = order
+    cdef const Py_ssize_t[:] offsets_view = offsets
+    cdef const long[:] response_view = response
+    cdef const double[:] feedback_view = feedback
+    cdef double[:, :] q_values_view = q_values
+    cdef double* rates_ptr = <double*> rates.data
+
+    for j in prange(offsets_view.shape[0] - 1, nogil=True, schedule='dynamic'):
+        q_learning_options(response_view, feedback_view, order_view, offsets_view[j],
+                           offsets_view[j + 1], q, rule, rates_ptr, q_values_view)
+    return q_values
+
+def rl_q_values(np.ndarray[long, ndim=1] response,
+                np.ndarray[double, ndim=1] feedback,
+                np.ndarray[long, ndim=1] split_by,
+                double q, Py_ssize_t n_options, str update_rule, params_rl,
+                np.ndarray order=None, np.ndarray offsets=None):
+    """Q-values of a K-armed bandit task before each trial.
+
+    The options are the responses 0 .. n_options - 1 and the Q-values are learned
+    separately within each split_by block, starting at q. update_rule is one of
+    rl_update_rules ('rw', 'rw_dual', 'rw_decay') and params_rl holds its
+    parameters on the scale of the RL models, i.e. before the logistic transform.
+    See wiener_like_rlddm for order and offsets.
+
+    Returns an array of shape (n_trials, n_options).
+    """
+    return q_values_all(response, feedback, split_by, q, n_options, update_rule,
+                        params_rl, order, offsets)
+
 def wiener_like_rlddm(np.ndarray[double, ndim=1] x,
                       np.ndarray[long, ndim=1] response,
                       np.ndarray[double, ndim=1] feedback,
                       np.ndarray[long, ndim=1] split_by,
                       double q, double alpha, double pos_alpha, double v, 
                       double sv, double a, double z, double sz, double t,
-                      double st, double err, int n_st=10, int n_sz=10, bint use_adaptive=1, double simps_err=1e-8,
-                      double p_outlier=0, double w_outlier=0):
+                      double st, double err, int n_st=10, int n_sz=10, int use_adaptive=1, double simps_err=1e-8,
+                      double p_outlier=0, double w_outlier=0, np.ndarray order=None, np.ndarray offsets=None):
+    """Log-likelihood of the RLDDM. The drift of a trial is v times the difference of the
+    Q-values of the two options, which are learned separately within each split_by block.
+    The first trial of a block only updates the Q-values. order and offsets are the
+    result of rl_blocks(split_by) and computed if not given.
+
+    The blocks are independent and evaluated in parallel without the GIL.
+    """
     cdef Py_ssize_t size = x.shape[0]
-    cdef Py_ssize_t i, j
-    cdef Py_ssize_t s_size
-    cdef int s
+    cdef Py_ssize_t i, j, k
     cdef double p
     cdef double sum_logp = 0
     cdef double wp_outlier = w_outlier * p_outlier
     cdef double alfa
     cdef double pos_alfa
-    cdef np.ndarray[double, ndim=1] qs = np.array([q, q])
-    cdef np.ndarray[double, ndim=1] xs
-    cdef np.ndarray[double, ndim=1] feedbacks
-    cdef np.ndarray[long, ndim=1] responses
-    cdef np.ndarray[long, ndim=1] unique = np.unique(split_by)
+    cdef np.ndarray[double, ndim=1] q_diff = np.empty(size, dtype=np.double)
+    cdef double* q_diff_ptr = <double*> q_diff.data
+    cdef const double[:] x_view = x
+    cdef const long[:] response_view = response
+    cdef const double[:] feedback_view = feedback
 
     if not p_outlier_in_range(p_outlier):
         return -np.inf
 
     if pos_alpha==100.00:
-        pos_alfa = alpha
-    else:
-        pos_alfa = pos_alpha
-
-    # unique represent # of conditions
-    for j in range(unique.shape[0]):
-        s = unique[j]
-        # select trials for current condition, identified by the split_by-array
-        feedbacks = feedback[split_by == s]
-        responses = response[split_by == s]
-        xs = x[split_by == s]
-        s_size = xs.shape[0]
-        qs[0] = q
-        qs[1] = q
-
-        # don't calculate pdf for first trial but still update q
-        if feedbacks[0] > qs[responses[0]]:
-            alfa = (2.718281828459**pos_alfa) / (1 + 2.718281828459**pos_alfa)
-        else:
-            alfa = (2.718281828459**alpha) / (1 + 2.718281828459**alpha)
-
-        # qs[1] is upper bound, qs[0] is lower bound. feedbacks is reward
-        # received on current trial.
-        qs[responses[0]] = qs[responses[0]] + \
-            alfa * (feedbacks[0] - qs[responses[0]])
-
-        # loop through all trials in current condition
-        for i in range(1, s_size):
-            p = full_pdf(xs[i], ((qs[1] - qs[0]) * v), sv, a, z,
+        pos_alpha = alpha
+
+    # get learning rate for current trial. if pos_alpha is not in
+    # include it will be same as alpha
+    alfa = logistic(alpha)
+    pos_alfa = logistic(pos_alpha)
+
+    if order is None:
+        order, offsets = rl_blocks(split_by)
+    cdef const Py_ssize_t[:] order_view = order
+    cdef const Py_ssize_t[:] offsets_view = offsets
+
+    # blocks represent # of conditions
+    for j in prange(offsets_view.shape[0] - 1, nogil=True, schedule='dynamic'):
+        q_learning(response_view, feedback_view, order_view, offsets_view[j], offsets_view[j + 1], q,
+                   &alfa, 0, &pos_alfa, 0, q_diff_ptr)
+
+        # don't calculate pdf for first trial
+        for k in range(offsets_view[j] + 1, offsets_view[j + 1]):
+            i = order_view[k]
+            p = full_pdf(x_view[i], q_diff_ptr[i] * v, sv, a, z,
                          sz, t, st, err, n_st, n_sz, use_adaptive, simps_err)
             # If one probability = 0, the log sum will be -Inf
             p = p * (1 - p_outlier) + wp_outlier
-            if p == 0:
-                return -np.inf
             sum_logp += log(p)
 
-            # get learning rate for current trial. if pos_alpha is not in
-            # include it will be same as alpha so can still use this
-            # calculation:
-            if feedbacks[i] > qs[responses[i]]:
-                alfa = (2.718281828459**pos_alfa) / (1 + 2.718281828459**pos_alfa)
-            else:
-                alfa = (2.718281828459**alpha) / (1 + 2.718281828459**alpha)
-
-            # qs[1] is upper bound, qs[0] is lower bound. feedbacks is reward
-            # received on current trial.
-            qs[responses[i]] = qs[responses[i]] + \
-                alfa * (feedbacks[i] - qs[responses[i]])
     return sum_logp
 
 
@@ -162,229 +508,207 @@ def wiener_like_rlssm_nn(str model,
                       np.ndarray[double, ndim=1] params_ssm,
                       np.ndarray[double, ndim=1] params_rl,
                       np.ndarray[double, ndim=2] params_bnds,
-                      double p_outlier=0, double w_outlier=0, network = None):
-
+                      double p_outlier=0, double w_outlier=0, network = None,
+                      np.ndarray order=None, np.ndarray offsets=None,
+                      np.ndarray[float, ndim=2] data=None):
+    """Log-likelihood of an RLSSM with a LAN. The drift v is scaled by the difference of
+    the Q-values learned within each split_by block (response -1 chooses the lower
+    option), the remaining parameters of the sequential sampling model are params_ssm[1:].
+    order and offsets are the result of rl_blocks(split_by) and computed if not given.
+
+    data is the network input with rt and response in its last two columns (see
+    hddm.utils.lan_input_buffer), the parameter columns are overwritten. It is
+    allocated if not given. All trials go through the network in one forward pass.
+    """
     cdef double v = params_ssm[0]
     cdef double rl_alpha = params_rl[0]
 
     cdef Py_ssize_t size = x.shape[0]
-    cdef Py_ssize_t i, j, i_p
-    cdef Py_ssize_t s_size
-    cdef int s
-    cdef double log_p = 0
-    cdef double sum_logp = 0
-    cdef double wp_outlier = w_outlier * p_outlier
+    cdef Py_ssize_t j, i_p
     cdef double alfa
     cdef double pos_alfa
-    cdef np.ndarray[double, ndim=1] qs = np.array([q, q])
-    cdef np.ndarray[double, ndim=1] xs
-    cdef np.ndarray[double, ndim=1] feedbacks
-    cdef np.ndarray[long, ndim=1] responses
-    cdef np.ndarray[long, ndim=1] responses_qs
-    cdef np.ndarray[long, ndim=1] unique = np.unique(split_by)
+    cdef np.ndarray[double, ndim=1] q_diff = np.empty(size, dtype=np.double)
     cdef Py_ssize_t n_params = params_ssm.shape[0] #+ params_rl.shape[0]
-    cdef np.ndarray[float, ndim=2] data = np.zeros((size, n_params + 2), dtype = np.float32)
-    cdef float ll_min = -16.11809
-    cdef int cumm_s_size = 0
 
     if not p_outlier_in_range(p_outlier):
         return -np.inf
     
     # Check for boundary violations -- if true, return -np.inf
-    for i_p in np.arange(1, len(params_ssm)):
-        lower_bnd = params_bnds[0][i_p]
-        upper_bnd = params_bnds[1][i_p]
-
-        if params_ssm[i_p] < lower_bnd or params_ssm[i_p] > upper_bnd:
+    for i_p in range(1, n_params):
+        if params_ssm[i_p] < params_bnds[0, i_p] or params_ssm[i_p] > params_bnds[1, i_p]:
             return -np.inf
 
-
     if len(params_rl) == 2:
         pos_alfa = params_rl[1]
     else:
         pos_alfa = params_rl[0]
 
+    # get learning rate for current trial. if pos_alpha is not in
+    # include it will be same as alpha
+    alfa = logistic(rl_alpha)
+    pos_alfa = logistic(pos_alfa)
 
-    # unique represent # of conditions
-    for j in range(unique.shape[0]):
-        s = unique[j]
-        # select trials for current condition, identified by the split_by-array
-        feedbacks = feedback[split_by == s]
-        responses = response[split_by == s]
-        xs = x[split_by == s]
-        s_size = xs.shape[0]
-        qs[0] = q
-        qs[1] = q
+    if order is None:
+        order, offsets = rl_blocks(split_by)
+    cdef const Py_ssize_t[:] order_view = order
+    cdef const Py_ssize_t[:] offsets_view = offsets
 
-        responses_qs = responses
-        responses_qs[responses_qs == -1] = 0
+    if data is None:
+        data = np.empty((size, n_params + 2), dtype = np.float32)
+        data[:, n_params] = x
+        data[:, n_params + 1] = response
+    data[:, :n_params] = params_ssm
 
-        # don't calculate pdf for first trial but still update q
-        if feedbacks[0] > qs[responses_qs[0]]:
-            alfa = (2.718281828459**pos_alfa) / (1 + 2.718281828459**pos_alfa)
-        else:
-            alfa = (2.718281828459**rl_alpha) / (1 + 2.718281828459**rl_alpha)
-        
-
-        # qs[1] is upper bound, qs[0] is lower bound. feedbacks is reward
-        # received on current trial.
-        qs[responses_qs[0]] = qs[responses_qs[0]] + \
-            alfa * (feedbacks[0] - qs[responses_qs[0]])
+    # blocks represent # of conditions, the first trial of a block has drift 0
+    for j in range(offsets_view.shape[0] - 1):
+        q_learning(response, feedback, order_view, offsets_view[j], offsets_view[j + 1], q,
+                   &alfa, 0, &pos_alfa, 0, <double*> q_diff.data)
 
+    # Check for boundary violations -- if true, return -np.inf
+    if not scale_drift(data, <double*> q_diff.data, params_bnds[0, 0], params_bnds[1, 0], 0):
+        return -np.inf
 
-        data[0, 0] = 0.0
-        # loop through all trials in current condition
-        for i in range(1, s_size):
-            data[cumm_s_size + i, 0] = (qs[1] - qs[0]) * v
-            # Check for boundary violations -- if true, return -np.inf
-            if data[cumm_s_size + i, 0] < params_bnds[0][0] or data[cumm_s_size + i, 0] > params_bnds[1][0]:
-                return -np.inf
+    # Call to network:
+    return nn_mlp_log_p(network.predict_on_batch(data), p_outlier, w_outlier)
+
+
+def wiener_like_rlssm_nn_options(np.ndarray[double, ndim=1] x,
+                                 np.ndarray[long, ndim=1] response,
+                                 np.ndarray[double, ndim=1] feedback,
+                                 np.ndarray[long, ndim=1] split_by,
+                                 double q,
+                                 np.ndarray[double, ndim=1] params_ssm,
+                                 np.ndarray[double, ndim=1] params_rl,
+                                 np.ndarray[double, ndim=2] params_bnds,
+                                 Py_ssize_t n_options, str update_rule='rw',
+                                 bint q_difference=0, double p_outlier=0, double w_outlier=0, network = None,
+                                 np.ndarray order=None, np.ndarray offsets=None,
+                                 np.ndarray[float, ndim=2] data=None):
+    """Log-likelihood of an RLSSM with a LAN for tasks with n_options options and any
+    update rule of rl_update_rules (see rl_q_values).
+
+    For models with one accumulator per option (e.g. race_no_bias_4, lca_no_bias_4),
+    params_ssm starts with the n_options drift scales and the drift of accumulator k is
+    params_ssm[k] times the Q-value of option k. If q_difference is set (two options and
+    a model with a single drift v), the drift is v times the difference of the Q-values
+    as in wiener_like_rlssm_nn. See wiener_like_rlssm_nn for order, offsets and data.
+    """
+    cdef Py_ssize_t size = x.shape[0]
+    cdef Py_ssize_t n_params = params_ssm.shape[0]
+    cdef Py_ssize_t n_drifts = 1 if q_difference else n_options
+    cdef Py_ssize_t i, k, i_p
+    cdef double lower, upper
+    cdef float drift
 
-            # get learning rate for current trial. if pos_alpha is not in
-            # include it will be same as alpha so can still use this
-            # calculation:
-            if feedbacks[i] > qs[responses_qs[i]]:
-                alfa = (2.718281828459**pos_alfa) / (1 + 2.718281828459**pos_alfa)
-            else:
-                alfa = (2.718281828459**rl_alpha) / (1 + 2.718281828459**rl_alpha)
+    if q_difference and n_options != 2:
+        raise ValueError("q_difference needs two options, got %d" % n_options)
 
-            # qs[1] is upper bound, qs[0] is lower bound. feedbacks is reward
-            # received on current trial.
-            qs[responses_qs[i]] = qs[responses_qs[i]] + \
-                alfa * (feedbacks[i] - qs[responses_qs[i]])
-        cumm_s_size += s_size
+    if not p_outlier_in_range(p_outlier):
+        return -np.inf
 
+    # Check for boundary violations -- if true, return -np.inf
+    for i_p in range(n_drifts, n_params):
+        if params_ssm[i_p] < params_bnds[0, i_p] or params_ssm[i_p] > params_bnds[1, i_p]:
+            return -np.inf
 
-    data[:, 1:n_params] = np.tile(params_ssm[1:], (size, 1)).astype(np.float32)
-    data[:, n_params:] = np.stack([x, response], axis = 1)
+    cdef np.ndarray[double, ndim=2] q_values = q_values_all(
+        response, feedback, split_by, q, n_options, update_rule, params_rl, order, offsets)
+    cdef double[:, :] q_view = q_values
+
+    if data is None:
+        data = np.empty((size, n_params + 2), dtype = np.float32)
+        data[:, n_params] = x
+        data[:, n_params + 1] = response
+    data[:, :n_params] = params_ssm
+    cdef float[:, :] data_view = data
+
+    # drifts from the Q-values, with boundary checks
+    for k in range(n_drifts):
+        lower = params_bnds[0, k]
+        upper = params_bnds[1, k]
+        for i in range(size):
+            if q_difference:
+                drift = (q_view[i, 1] - q_view[i, 0]) * data_view[i, 0]
+            else:
+                drift = q_view[i, k] * data_view[i, k]
+            if drift < lower or drift > upper:
+                return -np.inf
+            data_view[i, k] = drift
 
     # Call to network:
-    if p_outlier == 0:
-        sum_logp = np.sum(np.core.umath.maximum(network.predict_on_batch(data), ll_min))
-    else:
-        sum_logp = np.sum(np.log(np.exp(np.core.umath.maximum(network.predict_on_batch(data), ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier)))
-
-    return sum_logp
+    return nn_mlp_log_p(network.predict_on_batch(data), p_outlier, w_outlier)
 
 
 def wiener_like_rl(np.ndarray[long, ndim=1] response,
                    np.ndarray[double, ndim=1] feedback,
                    np.ndarray[long, ndim=1] split_by,
                    double q, double alpha, double pos_alpha, double v, double z,
-                   double err=1e-4, int n_st=10, int n_sz=10, bint use_adaptive=1, double simps_err=1e-8,
-                   double p_outlier=0, double w_outlier=0):
+                   double err=1e-4, int n_st=10, int n_sz=10, int use_adaptive=1, double simps_err=1e-8,
+                   double p_outlier=0, double w_outlier=0, np.ndarray order=None, np.ndarray offsets=None):
+    """Log-likelihood of the choices of a Q-learning model, scored by the probability
+    of hitting the upper boundary of a DDM with drift v times the Q-value difference.
+    See wiener_like_rlddm for order and offsets. Blocks are evaluated in parallel.
+    """
     cdef Py_ssize_t size = response.shape[0]
-    cdef Py_ssize_t i, j
-    cdef Py_ssize_t s_size
-    cdef int s
+    cdef Py_ssize_t i, j, k
     cdef double drift
     cdef double p
     cdef double sum_logp = 0
     cdef double wp_outlier = w_outlier * p_outlier
     cdef double alfa
     cdef double pos_alfa
-    cdef np.ndarray[double, ndim=1] qs = np.array([q, q])
-    cdef np.ndarray[double, ndim=1] feedbacks
-    cdef np.ndarray[long, ndim=1] responses
-    cdef np.ndarray[long, ndim=1] unique = np.unique(split_by)
+    cdef np.ndarray[double, ndim=1] q_diff = np.empty(size, dtype=np.double)
+    cdef double* q_diff_ptr = <double*> q_diff.data
+    cdef const long[:] response_view = response
+    cdef const double[:] feedback_view = feedback
 
     if not p_outlier_in_range(p_outlier):
         return -np.inf
 
     if pos_alpha==100.00:
-        pos_alfa = alpha
-    else:
-        pos_alfa = pos_alpha
-        
-    # unique represent # of conditions
-    for j in range(unique.shape[0]):
-        s = unique[j]
-        # select trials for current condition, identified by the split_by-array
-        feedbacks = feedback[split_by == s]
-        responses = response[split_by == s]
-        s_size = responses.shape[0]
-        qs[0] = q
-        qs[1] = q
-
-        # don't calculate pdf for first trial but still update q
-        if feedbacks[0] > qs[responses[0]]:
-            alfa = (2.718281828459**pos_alfa) / (1 + 2.718281828459**pos_alfa)
-        else:
-            alfa = (2.718281828459**alpha) / (1 + 2.718281828459**alpha)
+        pos_alpha = alpha
 
-        # qs[1] is upper bound, qs[0] is lower bound. feedbacks is reward
-        # received on current trial.
-        qs[responses[0]] = qs[responses[0]] + \
-            alfa * (feedbacks[0] - qs[responses[0]])
+    # get learning rate for current trial. if pos_alpha is not in
+    # include it will be same as alpha
+    alfa = logistic(alpha)
+    pos_alfa = logistic(pos_alpha)
 
-        # loop through all trials in current condition
-        for i in range(1, s_size):
+    if order is None:
+        order, offsets = rl_blocks(split_by)
+    cdef const Py_ssize_t[:] order_view = order
+    cdef const Py_ssize_t[:] offsets_view = offsets
 
-            drift = (qs[1] - qs[0]) * v
+    # blocks represent # of conditions
+    for j in prange(offsets_view.shape[0] - 1, nogil=True, schedule='dynamic'):
+        q_learning(response_view, feedback_view, order_view, offsets_view[j], offsets_view[j + 1], q,
+                   &alfa, 0, &pos_alfa, 0, q_diff_ptr)
+
+        # don't calculate pdf for first trial
+        for k in range(offsets_view[j] + 1, offsets_view[j + 1]):
+            i = order_view[k]
+            drift = q_diff_ptr[i] * v
 
             if drift == 0:
                 p = 0.5
             else:
-                if responses[i] == 1:
-                    p = (2.718281828459**(-2 * z * drift) - 1) / \
-                        (2.718281828459**(-2 * drift) - 1)
+                if response_view[i] == 1:
+                    p = (exp(-2 * z * drift) - 1) / (exp(-2 * drift) - 1)
                 else:
-                    p = 1 - (2.718281828459**(-2 * z * drift) - 1) / \
-                        (2.718281828459**(-2 * drift) - 1)
+                    p = 1 - (exp(-2 * z * drift) - 1) / (exp(-2 * drift) - 1)
 
             # If one probability = 0, the log sum will be -Inf
             p = p * (1 - p_outlier) + wp_outlier
-            if p == 0:
-                return -np.inf
-
             sum_logp += log(p)
 
-            # get learning rate for current trial. if pos_alpha is not in
-            # include it will be same as alpha so can still use this
-            # calculation:
-            if feedbacks[i] > qs[responses[i]]:
-                alfa = (2.718281828459**pos_alfa) / (1 + 2.718281828459**pos_alfa)
-            else:
-                alfa = (2.718281828459**alpha) / (1 + 2.718281828459**alpha)
-
-            # qs[1] is upper bound, qs[0] is lower bound. feedbacks is reward
-            # received on current trial.
-            qs[responses[i]] = qs[responses[i]] + \
-                alfa * (feedbacks[i] - qs[responses[i]])
     return sum_logp
 
 
 def wiener_like_multi(np.ndarray[double, ndim=1] x, v, sv, a, z, sz, t, st, double err, multi=None,
-                      int n_st=10, int n_sz=10, bint use_adaptive=1, double simps_err=1e-3,
+                      int n_st=10, int n_sz=10, int use_adaptive=1, double simps_err=1e-3,
                       double p_outlier=0, double w_outlier=0):
-    cdef Py_ssize_t size = x.shape[0]
-    cdef Py_ssize_t i
-    cdef double p = 0
-    cdef double sum_logp = 0
-    cdef double wp_outlier = w_outlier * p_outlier
-
-    if multi is None:
-        return full_pdf(x, v, sv, a, z, sz, t, st, err)
-    else:
-        params = {'v': v, 'z': z, 't': t, 'a': a, 'sv': sv, 'sz': sz, 'st': st}
-        params_iter = copy(params)
-        for i in range(size):
-            for param in multi:
-                params_iter[param] = params[param][i]
-            if abs(x[i]) != 999.:
-                p = full_pdf(x[i], params_iter['v'],
-                             params_iter['sv'], params_iter['a'], params_iter['z'],
-                             params_iter['sz'], params_iter['t'], params_iter['st'],
-                             err, n_st, n_sz, use_adaptive, simps_err)
-                p = p * (1 - p_outlier) + wp_outlier
-            elif x[i] == 999.:
-                p = prob_ub(params_iter['v'], params_iter['a'], params_iter['z'])
-            else: # x[i] == -999.
-                p = 1 - prob_ub(params_iter['v'], params_iter['a'], params_iter['z'])
-
-            sum_logp += log(p)
-
-        return sum_logp
+    """Kept for backwards compatibility, see wiener_like_array. The multi argument is no longer needed."""
+    return wiener_like_array(x, v, sv, a, z, sz, t, st, err, n_st, n_sz, use_adaptive,
+                             simps_err, p_outlier, w_outlier)
 
 
 def wiener_like_multi_rlddm(np.ndarray[double, ndim=1] x, 
@@ -392,45 +716,72 @@ def wiener_like_multi_rlddm(np.ndarray[double, ndim=1] x,
                       np.ndarray[double, ndim=1] feedback,
                       np.ndarray[long, ndim=1] split_by,
                       double q, v, sv, a, z, sz, t, st, alpha, double err, multi=None,
-                      int n_st=10, int n_sz=10, bint use_adaptive=1, double simps_err=1e-3,
+                      int n_st=10, int n_sz=10, int use_adaptive=1, double simps_err=1e-3,
                       double p_outlier=0, double w_outlier=0):
+    """Log-likelihood of the RLDDM where each of v, sv, a, z, sz, t, st and alpha can
+    either be a scalar or an array holding one value per trial (see wiener_like_array).
+    The multi argument is no longer needed.
+
+    The Q-values are reset whenever split_by differs from the previous trial, and
+    every trial is scored, the first of a block with drift 0. The blocks are evaluated
+    in parallel without the GIL.
+    """
     cdef Py_ssize_t size = x.shape[0]
-    cdef Py_ssize_t ij
-    cdef Py_ssize_t s_size
-    cdef double p = 0
+    cdef Py_ssize_t i, j
+    cdef double p
     cdef double sum_logp = 0
     cdef double wp_outlier = w_outlier * p_outlier
-    cdef int s
-    cdef np.ndarray[double, ndim=1] qs = np.array([q, q])
 
-    if multi is None:
-        return full_pdf(x, v, sv, a, z, sz, t, st, err)
-    else:
-        params = {'v': v, 'z': z, 't': t, 'a': a, 'sv': sv, 'sz': sz, 'st': st, 'alpha':alpha}
-        params_iter = copy(params)
-        qs[0] = q
-        qs[1] = q
-        for i in range(size):
-            for param in multi:
-                params_iter[param] = params[param][i]
-
-            if (i != 0):
-                if (split_by[i] != split_by[i-1]):
-                    qs[0] = q
-                    qs[1] = q
-
-            p = full_pdf(x[i], params_iter['v'] * (qs[1] - qs[0]),
-                         params_iter['sv'], params_iter['a'], params_iter['z'],
-                         params_iter['sz'], params_iter[
-                             't'], params_iter['st'],
+    cdef np.ndarray v_arr = param_array(v, size)
+    cdef np.ndarray sv_arr = param_array(sv, size)
+    cdef np.ndarray a_arr = param_array(a, size)
+    cdef np.ndarray z_arr = param_array(z, size)
+    cdef np.ndarray sz_arr = param_array(sz, size)
+    cdef np.ndarray t_arr = param_array(t, size)
+    cdef np.ndarray st_arr = param_array(st, size)
+    cdef np.ndarray alpha_arr = param_array(alpha, size)
+    cdef double* v_ptr = <double*> v_arr.data
+    cdef double* sv_ptr = <double*> sv_arr.data
+    cdef double* a_ptr = <double*> a_arr.data
+    cdef double* z_ptr = <double*> z_arr.data
+    cdef double* sz_ptr = <double*> sz_arr.data
+    cdef double* t_ptr = <double*> t_arr.data
+    cdef double* st_ptr = <double*> st_arr.data
+    cdef Py_ssize_t s_v = v_arr.shape[0] > 1
+    cdef Py_ssize_t s_sv = sv_arr.shape[0] > 1
+    cdef Py_ssize_t s_a = a_arr.shape[0] > 1
+    cdef Py_ssize_t s_z = z_arr.shape[0] > 1
+    cdef Py_ssize_t s_sz = sz_arr.shape[0] > 1
+    cdef Py_ssize_t s_t = t_arr.shape[0] > 1
+    cdef Py_ssize_t s_st = st_arr.shape[0] > 1
+    cdef Py_ssize_t s_alfa = alpha_arr.shape[0] > 1
+
+    cdef np.ndarray[double, ndim=1] alfa = logistic_array(alpha_arr)
+    cdef double* alfa_ptr = <double*> alfa.data
+    cdef np.ndarray[double, ndim=1] q_diff = np.empty(size, dtype=np.double)
+    cdef double* q_diff_ptr = <double*> q_diff.data
+    cdef const double[:] x_view = x
+    cdef const long[:] response_view = response
+    cdef const double[:] feedback_view = feedback
+
+    # blocks are runs of trials with the same split_by
+    cdef const Py_ssize_t[:] order_view = np.arange(size, dtype=np.intp)
+    cdef const Py_ssize_t[:] offsets_view = np.concatenate(
+        ([0], np.flatnonzero(split_by[1:] != split_by[:size - 1]) + 1, [size])
+    ).astype(np.intp)
+
+    for j in prange(offsets_view.shape[0] - 1, nogil=True, schedule='dynamic'):
+        q_learning(response_view, feedback_view, order_view, offsets_view[j], offsets_view[j + 1], q,
+                   alfa_ptr, s_alfa, alfa_ptr, s_alfa, q_diff_ptr)
+
+        for i in range(offsets_view[j], offsets_view[j + 1]):
+            p = full_pdf(x_view[i], v_ptr[i*s_v] * q_diff_ptr[i], sv_ptr[i*s_sv], a_ptr[i*s_a],
+                         z_ptr[i*s_z], sz_ptr[i*s_sz], t_ptr[i*s_t], st_ptr[i*s_st],
                          err, n_st, n_sz, use_adaptive, simps_err)
             p = p * (1 - p_outlier) + wp_outlier
             sum_logp += log(p)
 
-            alfa = (2.718281828459**params_iter['alpha']) / (1 + 2.718281828459**params_iter['alpha'])   
-            qs[response[i]] = qs[response[i]] + alfa * (feedback[i] - qs[response[i]])
-
-        return sum_logp
+    return sum_logp
 
 
 def wiener_like_rlssm_nn_reg(np.ndarray[float, ndim=2] data,
@@ -441,77 +792,43 @@ def wiener_like_rlssm_nn_reg(np.ndarray[float, ndim=2] data,
                       np.ndarray[long, ndim=1] split_by,
                       double q,
                       np.ndarray[double, ndim=2] params_bnds,
-                      double p_outlier=0, double w_outlier=0, network = None):
-    cdef double rl_alpha 
+                      double p_outlier=0, double w_outlier=0, network = None,
+                      np.ndarray order=None, np.ndarray offsets=None):
+    """Log-likelihood of an RLSSM with a LAN and trial-wise parameters. data is the
+    network input with one row per trial; its first column holds the (non-negative)
+    scale of the drift, which is replaced in place by the scale times the Q-value
+    difference. rl_arr holds the trial-wise learning rates in its first column.
+    See wiener_like_rlssm_nn for order and offsets.
+    """
     cdef Py_ssize_t size = x.shape[0]
-    cdef Py_ssize_t i, j, i_p
-    cdef Py_ssize_t s_size
-    cdef int s
-    cdef double log_p = 0
-    cdef double sum_logp = 0
-    cdef double wp_outlier = w_outlier * p_outlier
-    cdef double alfa
-    cdef np.ndarray[double, ndim=1] qs = np.array([q, q])
-    cdef np.ndarray[double, ndim=1] xs
-    cdef np.ndarray[double, ndim=1] feedbacks
-    cdef np.ndarray[long, ndim=1] responses
-    cdef np.ndarray[long, ndim=1] responses_qs
-    cdef np.ndarray[long, ndim=1] unique = np.unique(split_by)
-    cdef np.ndarray[float, ndim=2] data_copy = data
-    cdef float ll_min = -16.11809
-    cdef int cumm_s_size = 0
+    cdef Py_ssize_t j, i_p
+    cdef np.ndarray[double, ndim=1] alfa = logistic_array(rl_arr[:, 0])
+    cdef np.ndarray[double, ndim=1] q_diff = np.empty(size, dtype=np.double)
 
     if not p_outlier_in_range(p_outlier):
         return -np.inf
     
     # Check for boundary violations -- if true, return -np.inf
-    for i_p in np.arange(1, data.shape[1]-2):
-        lower_bnd = params_bnds[0][i_p]
-        upper_bnd = params_bnds[1][i_p]
-
-        if data[:,i_p].min() < lower_bnd or data[:,i_p].max() > upper_bnd:
+    for i_p in range(1, data.shape[1] - 2):
+        if data[:, i_p].min() < params_bnds[0, i_p] or data[:, i_p].max() > params_bnds[1, i_p]:
             return -np.inf
 
-    # unique represent # of conditions
-    for j in range(unique.shape[0]):
-        s = unique[j]
-        # select trials for current condition, identified by the split_by-array
-        feedbacks = feedback[split_by == s]
-        responses = response[split_by == s]
-        xs = x[split_by == s]
-        s_size = xs.shape[0]
-        qs[0] = q
-        qs[1] = q
-
-        responses_qs = responses
-        responses_qs[responses_qs == -1] = 0
-
-        # loop through all trials in current condition
-        for i in range(0, s_size):
-            tp_scale = data[cumm_s_size + i, 0]
-            if tp_scale < 0:
-                return -np.inf
-
-            data_copy[cumm_s_size + i, 0] = (qs[1] - qs[0]) * tp_scale 
+    if order is None:
+        order, offsets = rl_blocks(split_by)
+    cdef const Py_ssize_t[:] order_view = order
+    cdef const Py_ssize_t[:] offsets_view = offsets
 
-            # Check for boundary violations -- if true, return -np.inf
-            if data_copy[cumm_s_size + i, 0] < params_bnds[0][0] or data_copy[cumm_s_size + i, 0] > params_bnds[1][0]:
-                return -np.inf
-
-            rl_alpha = rl_arr[cumm_s_size + i, 0]
-            alfa = (2.718281828459**rl_alpha) / (1 + 2.718281828459**rl_alpha)
+    # blocks represent # of conditions
+    for j in range(offsets_view.shape[0] - 1):
+        q_learning(response, feedback, order_view, offsets_view[j], offsets_view[j + 1], q,
+                   <double*> alfa.data, 1, <double*> alfa.data, 1, <double*> q_diff.data)
 
-            qs[responses_qs[i]] = qs[responses_qs[i]] + \
-                alfa * (feedbacks[i] - qs[responses_qs[i]])
-        cumm_s_size += s_size
+    # Check for boundary violations -- if true, return -np.inf
+    if not scale_drift(data, <double*> q_diff.data, params_bnds[0, 0], params_bnds[1, 0], 1):
+        return -np.inf
 
     # Call to network:
-    if p_outlier == 0:
-        sum_logp = np.sum(np.core.umath.maximum(network.predict_on_batch(data_copy), ll_min))
-    else:
-        sum_logp = np.sum(np.log(np.exp(np.core.umath.maximum(network.predict_on_batch(data_copy), ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier)))
-
-    return sum_logp
+    return nn_mlp_log_p(network.predict_on_batch(data), p_outlier, w_outlier)
 
 
 def gen_rts_from_cdf(double v, double sv, double a, double z, double sz, double t,
@@ -550,7 +867,7 @@ def gen_rts_from_cdf(double v, double sv, double a, double z, double sz, double
 
 def wiener_like_contaminant(np.ndarray[double, ndim=1] x, np.ndarray[int, ndim=1] cont_x, double v,
                             double sv, double a, double z, double sz, double t, double st, double t_min,
-                            double t_max, double err, int n_st=10, int n_sz=10, bint use_adaptive=1,
+                            double t_max, double err, int n_st=10, int n_sz=10, int use_adaptive=1,
                             double simps_err=1e-8):
     """Wiener likelihood function where RTs could come from a
     separate, uniform contaminant distribution.
@@ -580,7 +897,7 @@ def wiener_like_contaminant(np.ndarray[double, ndim=1] x, np.ndarray[int, ndim=1
     return sum_logp
 
 def gen_cdf_using_pdf(double v, double sv, double a, double z, double sz, double t, double st, double err,
-                      int N=500, double time=5., int n_st=2, int n_sz=2, bint use_adaptive=1, double simps_err=1e-3,
+                      int N=500, double time=5., int n_st=2, int n_sz=2, int use_adaptive=1, double simps_err=1e-3,
                       double p_outlier=0, double w_outlier=0):
     """
     generate cdf vector using the pdf
@@ -630,27 +947,78 @@ def split_cdf(np.ndarray[double, ndim=1] x, np.ndarray[double, ndim=1] data):
 
 #############
 # Basic MLP Likelihoods
+cdef np.ndarray lan_input(np.ndarray rt, np.ndarray response, np.ndarray params, np.ndarray data):
+    """Network input with one row (params, rt, response) per trial.
+
+    If data is given (see hddm.utils.lan_input_buffer), its rt and response columns
+    are already filled in and only the parameter columns are overwritten in place.
+    """
+    cdef Py_ssize_t n_params = params.shape[0]
+    if data is None:
+        data = np.empty((rt.shape[0], n_params + 2), dtype = np.float32)
+        data[:, n_params] = rt
+        data[:, n_params + 1] = response
+    elif data.shape[1] != n_params + 2:
+        raise ValueError("input buffer needs %d columns, got %d" % (n_params + 2, data.shape[1]))
+    data[:, :n_params] = params
+    return data
+
+cdef np.ndarray lan_predict(network, np.ndarray rt, np.ndarray response, np.ndarray params, np.ndarray data):
+    """Network output for the rows (params, rt, response) of all trials.
+
+    Networks with predict_on_batch_factorized (see hddm.torch.mlp_inference_class)
+    get the parameter vector once and only the rt and response columns per trial.
+    Other networks get the full input built by lan_input.
+    """
+    cdef Py_ssize_t n_params = params.shape[0]
+    if not hasattr(network, "predict_on_batch_factorized"):
+        return network.predict_on_batch(lan_input(rt, response, params, data))
+
+    if data is None:
+        trials = np.stack([rt, response], axis = 1)
+    elif data.shape[1] != n_params + 2:
+        raise ValueError("input buffer needs %d columns, got %d" % (n_params + 2, data.shape[1]))
+    else:
+        trials = data[:, n_params:]
+    return network.predict_on_batch_factorized(params, trials)
+
 def wiener_like_nn_mlp(np.ndarray[float, ndim = 1] rt,
                        np.ndarray[float, ndim = 1] response,
                        np.ndarray[float, ndim = 1] params,
                        double p_outlier = 0,
                        double w_outlier = 0,
-                       network = None):
+                       network = None,
+                       np.ndarray[float, ndim = 1] weights = None,
+                       np.ndarray[float, ndim = 2] data = None):
+
+    cdef np.ndarray net_log_p
+
+    # Call to network:
+    net_log_p = lan_predict(network, rt, response, params, data)
+
+    return nn_mlp_log_p(net_log_p, p_outlier, w_outlier, weights)
+
+def nn_mlp_log_p(np.ndarray net_log_p,
+                 double p_outlier = 0,
+                 double w_outlier = 0,
+                 np.ndarray[float, ndim = 1] weights = None):
+    """Log-likelihood of a node from the network outputs net_log_p (one row per
+    trial), as returned by wiener_like_nn_mlp."""
 
-    cdef Py_ssize_t size = rt.shape[0]
-    cdef Py_ssize_t n_params = params.shape[0]
     cdef float log_p = 0
     cdef float ll_min = -16.11809
+    cdef np.ndarray[float, ndim = 2] trial_log_p
 
-    cdef np.ndarray[float, ndim = 2] data = np.zeros((size, n_params + 2), dtype = np.float32)
-    data[:, :n_params] = np.tile(params, (size, 1)).astype(np.float32)
-    data[:, n_params:] = np.stack([rt, response], axis = 1)
-
-    # Call to network:
     if p_outlier == 0:
-        log_p = np.sum(np.core.umath.maximum(network.predict_on_batch(data), ll_min))
+        trial_log_p = np.core.umath.maximum(net_log_p, ll_min)
     else:
-        log_p = np.sum(np.log(np.exp(np.core.umath.maximum(network.predict_on_batch(data), ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier)))
+        trial_log_p = np.log(np.exp(np.core.umath.maximum(net_log_p, ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier))
+
+    # weights count how often each (rt, response) pair occurs in the data
+    if weights is None:
+        log_p = np.sum(trial_log_p)
+    else:
+        log_p = np.dot(weights, trial_log_p[:, 0])
 
     return log_p
 
@@ -662,19 +1030,16 @@ def wiener_like_nn_mlp_info(np.ndarray[float, ndim = 1] rt,
                             np.ndarray[float, ndim = 1] lower_bounds,
                             double p_outlier = 0,
                             double w_outlier = 0,
-                            network = None):
+                            network = None,
+                            np.ndarray[float, ndim = 2] data = None):
 
-    cdef Py_ssize_t size = rt.shape[0]
     cdef Py_ssize_t n_params = params.shape[0]
     cdef float log_p = 0
     cdef float ll_min = -16.11809
     cdef float[:] upper_bounds_view = upper_bounds
     cdef float[:] lower_bounds_view = lower_bounds
     cdef float[:] params_view = params
-
-    cdef np.ndarray[float, ndim = 2] data = np.zeros((size, n_params + 2), dtype = np.float32)
-    data[:, :n_params] = np.tile(params, (size, 1)).astype(np.float32)
-    data[:, n_params:] = np.stack([rt, response], axis = 1)
+    cdef np.ndarray net_log_p
 
     for i in range(n_params):
         if params_view[i] > upper_bounds_view[i]:
@@ -683,10 +1048,12 @@ def wiener_like_nn_mlp_info(np.ndarray[float, ndim = 1] rt,
             return -np.inf
 
     # Call to network:
+    net_log_p = lan_predict(network, rt, response, params, data)
+
     if p_outlier == 0:
-        log_p = np.sum(np.core.umath.maximum(network.predict_on_batch(data), ll_min))
+        log_p = np.sum(np.core.umath.maximum(net_log_p, ll_min))
     else:
-        log_p = np.sum(np.log(np.exp(np.core.umath.maximum(network.predict_on_batch(data), ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier)))
+        log_p = np.sum(np.log(np.exp(np.core.umath.maximum(net_log_p, ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier)))
 
     return log_p
 
@@ -696,23 +1063,22 @@ def wiener_like_nn_mlp_pdf(np.ndarray[float, ndim = 1] rt,
                            double p_outlier = 0, 
                            double w_outlier = 0,
                            bint logp = 0,
-                           network = None):
+                           network = None,
+                           np.ndarray[float, ndim = 2] data = None):
     
     cdef Py_ssize_t size = rt.shape[0]
-    cdef Py_ssize_t n_params = params.shape[0]
 
     cdef np.ndarray[float, ndim = 1] log_p = np.zeros(size, dtype = np.float32)
     cdef float ll_min = -16.11809
-
-    cdef np.ndarray[float, ndim = 2] data = np.zeros((size, n_params + 2), dtype = np.float32)
-    data[:, :n_params] = np.tile(params, (size, 1)).astype(np.float32)
-    data[:, n_params:] = np.stack([rt, response], axis = 1)
+    cdef np.ndarray net_log_p
 
     # Call to network:
+    net_log_p = lan_predict(network, rt, response, params, data)
+
     if p_outlier == 0: # ddm_model
-        log_p = np.squeeze(np.core.umath.maximum(network.predict_on_batch(data), ll_min))
+        log_p = np.squeeze(np.core.umath.maximum(net_log_p, ll_min))
     else: # ddm_model
-        log_p = np.squeeze(np.log(np.exp(np.core.umath.maximum(network.predict_on_batch(data), ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier)))
+        log_p = np.squeeze(np.log(np.exp(np.core.umath.maximum(net_log_p, ll_min)) * (1.0 - p_outlier) + (w_outlier * p_outlier)))
     if logp == 0:
         log_p = np.exp(log_p) # shouldn't be called log_p anymore but no need for an extra array here
     return log_p